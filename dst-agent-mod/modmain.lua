@@ -54,8 +54,10 @@ end
 
 function SendChatMessageToServer(message_data)
     message_data.command = message_data.message
+    -- 命令发给 AI 控制的玩家对应的会话（服务端按 GUID 区分 Agent）
+    local agent_guid = GLOBAL.ThePlayer and GLOBAL.ThePlayer.GUID or 1234
 	GLOBAL.TheSim:QueryServer(
-        "http://localhost:8081" .. "/" .. tostring(1234) .. "/command",
+        "http://localhost:8081" .. "/" .. tostring(agent_guid) .. "/command",
         function(result, isSuccessful, http_code)
             print("result", result)
             print("isSuccessful", isSuccessful)
@@ -4,9 +4,13 @@ require("recipe")
 local SEE_DIST = 18
 local SEE_RANGE_HELPER = false
 local PERCEPTION_UPDATE_INTERVAL = 1
+local PERCEPTION_PROTOCOL_VERSION = 1
+local PERCEPTION_FULL_INTERVAL = 30 -- 每隔多少次感知发送一次完整快照，其余时间只发送增量
 local DSTACTION_INTERVAL = 1.5
 local SPEAKACTION_INTERVAL = 5
 local NUM_SEGS = 16
+-- 本次服务器运行的标识（模块在服务器启动后加载一次），重启后实体 GUID 会变化
+local SERVER_RUN = tostring(os.time())
 
 local PATHFINDACTION_INTERVAL = 3
 local MINDIST = 2
@@ -104,6 +108,26 @@ local function Entity(inst, v)
 end
 
 
+-- 比较同一实体的两次感知，返回变化的字段（带 GUID），没有变化返回 nil
+local function DiffEntity(old, new)
+	local changed = nil
+	for k, v in pairs(new) do
+		if old[k] ~= v then
+			changed = changed or { GUID = new.GUID }
+			changed[k] = v
+		end
+	end
+	-- 消失的字段（例如组件被移除）列在 Unset 中，Lua 表无法发送 null
+	for k, _ in pairs(old) do
+		if new[k] == nil then
+			changed = changed or { GUID = new.GUID }
+			changed.Unset = changed.Unset or {}
+			table.insert(changed.Unset, k)
+		end
+	end
+	return changed
+end
+
 local function GetDistanceBetweenPoints(pos1, pos2)
     local dx = pos1.x - pos2.x
     local dz = pos1.z - pos2.z
@@ -125,9 +149,19 @@ local AgentBrain = Class(Brain, function(self, inst, global_vars, server)
     ------------------------------
 	self.OnPerceptions = function() self:Perceptions() end
     self.PerceptionsCallback = function(result, isSuccessful , http_code)
-        -- Intentionally left blank
+        if not isSuccessful then
+			-- 快照没有送达，下次重新发送完整快照
+			self.PerceptionSeq = nil
+		end
     end
 
+	self.PerceptionDeltaCallback = function(result, isSuccessful, http_code)
+		if not isSuccessful or http_code == 409 or http_code == 400 then
+			-- 服务端要求重同步（序号断档或消息格式错误）或请求失败
+			self.PerceptionSeq = nil
+		end
+	end
+
 	self.OnEventCallback = function(result, isSuccessful , http_code)
 		-- Intentionally left blank
 	end
@@ -378,6 +412,9 @@ function AgentBrain:Perceptions()
 
 	-- 添加时间和季节信息
 	data.WorldStatus = {}
+	-- 世界（存档）标识和本次服务器运行的标识，Python 端据此区分世界记忆；GUID 只在一次运行内有效
+	data.WorldStatus.WorldID = TheNet:GetSessionIdentifier()
+	data.WorldStatus.Run = SERVER_RUN
 	data.WorldStatus.Day = TheWorld.state.cycles + 1
 	data.WorldStatus.Season = TheWorld.state.season
 	data.WorldStatus.SeasonProgress = string.format("%.2f", TheWorld.state.seasonprogress or 0)
@@ -399,11 +436,71 @@ function AgentBrain:Perceptions()
 
 	
 
-    TheSim:QueryServer(
-        self.AgentServer .. "/" .. tostring(self.inst.GUID) .. "/perceptions",
-        self.PerceptionsCallback,
-        "POST",
-		json.encode_compliant(data))
+	self:SendPerceptions(data)
+end
+
+-- 按增量感知协议发送：首次、重同步以及每 PERCEPTION_FULL_INTERVAL 次发送完整快照，其余只发送变化
+function AgentBrain:SendPerceptions(data)
+	local vision_by_guid = {}
+	for _, entity in ipairs(data.Vision) do
+		vision_by_guid[entity.GUID] = entity
+	end
+	local fields = {}
+	for k, v in pairs(data) do
+		if k ~= "Vision" then
+			fields[k] = json.encode_compliant(v)
+		end
+	end
+
+	self.PerceptionTick = (self.PerceptionTick or 0) + 1
+	if self.PerceptionSeq == nil or self.PerceptionTick % PERCEPTION_FULL_INTERVAL == 0 then
+		self.PerceptionSeq = (self.PerceptionSeq or 0) + 1
+		self.LastVision = vision_by_guid
+		self.LastPerceptionFields = fields
+		data.Version = PERCEPTION_PROTOCOL_VERSION
+		data.Seq = self.PerceptionSeq
+		TheSim:QueryServer(
+			self.AgentServer .. "/" .. tostring(self.inst.GUID) .. "/perceptions",
+			self.PerceptionsCallback,
+			"POST",
+			json.encode_compliant(data))
+		return
+	end
+
+	local delta = {}
+	delta.Version = PERCEPTION_PROTOCOL_VERSION
+	delta.Seq = self.PerceptionSeq + 1
+	delta.Added, delta.Removed, delta.Changed = {}, {}, {}
+	for guid, entity in pairs(vision_by_guid) do
+		local old = self.LastVision[guid]
+		if old == nil then
+			table.insert(delta.Added, entity)
+		else
+			local changed = DiffEntity(old, entity)
+			if changed ~= nil then
+				table.insert(delta.Changed, changed)
+			end
+		end
+	end
+	for guid, _ in pairs(self.LastVision) do
+		if vision_by_guid[guid] == nil then
+			table.insert(delta.Removed, guid)
+		end
+	end
+	for k, encoded in pairs(fields) do
+		if self.LastPerceptionFields[k] ~= encoded then
+			delta[k] = data[k]
+		end
+	end
+
+	self.PerceptionSeq = delta.Seq
+	self.LastVision = vision_by_guid
+	self.LastPerceptionFields = fields
+	TheSim:QueryServer(
+		self.AgentServer .. "/" .. tostring(self.inst.GUID) .. "/perceptions/delta",
+		self.PerceptionDeltaCallback,
+		"POST",
+		json.encode_compliant(delta))
 end
 
 function AgentBrain:CheckArrive()
@@ -541,6 +638,7 @@ function AgentBrain:OnStart()
 
 
     ----- Perceptions -----
+	self.PerceptionSeq = nil -- 重启后先发送完整快照
     if self.PerceptionsTask ~= nil then self.PerceptionsTask:Cancel() end
     self.PerceptionsTask = self.inst:DoPeriodicTask(PERCEPTION_UPDATE_INTERVAL, self.OnPerceptions, 0)
 
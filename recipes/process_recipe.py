@@ -1,5 +1,11 @@
 import json
+import os
 import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.config.settings import settings
+from src.tools.recipe_index import write_index
 
 def merge_recipe():
     # 读取英文菜谱文件
@@ -73,9 +79,17 @@ def process_recipe():
         json.dump(new_recipes, f, ensure_ascii=False, indent=4)
 
 
+def build_index():
+    # 重新生成服务端加载的预编译索引（不运行时服务端也会在第一次加载时发现 JSON 变化并自动重建）
+    data = write_index("recipes_merged_processed.json", settings.RECIPE_INDEX_FILE_PATH)
+    print(f"成功编译了 {len(data['order'])} 个菜谱")
+    print(f"索引已保存为 {settings.RECIPE_INDEX_FILE_PATH}")
+
+
 if __name__ == "__main__":
     # merge_recipe()
     process_recipe()
+    build_index()
 
 
 
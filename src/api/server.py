@@ -1,16 +1,14 @@
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import JSONResponse
-from typing import Dict
+from typing import Dict, Optional
 import uvicorn
 import logging
 import json
 import re
 from ..tools.parse_tool import parse_assistant_message
-from ..core.task import Task
-from ..core.event_manager import EventManager
+from ..core.session import SessionManager
+from ..utils.perception_delta import PerceptionDeltaError
 from ..config.prompt import systemPrompt
-from ..tools.tool_executor import parse_action_str
-from ..utils.queues import ActionQueue, DialogQueue
 from ..config.settings import settings
 
 # 禁用 uvicorn 访问日志
@@ -41,66 +39,106 @@ logging.basicConfig(
 )
 
 # --- 全局状态对象 ---
-action_queue = ActionQueue(maxsize=settings.ACTION_QUEUE_SIZE)
-dialog_queue = DialogQueue(maxsize=settings.DIALOG_QUEUE_SIZE)
-current_perception: Dict = {}
-self_uid = 0
-task_instance = Task(action_queue, current_perception, dialog_queue, self_uid)
-event_manager = EventManager(task_instance, current_perception)
+# 每个 Agent（GUID）一个独立会话，懒创建、空闲回收
+session_manager = SessionManager()
 
-# action_queue.put_action(parse_action_str("Action(EXPLORE, -, -, -, -) = -"))
-# action_queue.put_action(parse_action_str("Action(STOP, -, -, -, -) = -"))
-# action_queue.put_action(parse_action_str("Action(BUILD, -, 262, 100, homesign) = -"))
-# action_queue.put_action(parse_action_str("Action(PICK, -, -, -, -) = 127823"))
-# action_queue.put_action(parse_action_str("Action(BUILD, -, -, -, boards) = -"))
+# session = session_manager.get("1234")
+# session.action_queue.put_action(parse_action("Action(EXPLORE, -, -, -, -) = -").to_dict())
+# session.action_queue.put_action(parse_action("Action(STOP, -, -, -, -) = -").to_dict())
+# session.action_queue.put_action(parse_action("Action(BUILD, -, 262, 100, homesign) = -").to_dict())
+# session.action_queue.put_action(parse_action("Action(PICK, -, -, -, -) = 127823").to_dict())
+# session.action_queue.put_action(parse_action("Action(BUILD, -, -, -, boards) = -").to_dict())
+
+
+def _long_poll_timeout(wait: Optional[float]) -> float:
+    """计算本次 long-poll 的等待时长，客户端可通过 ?wait= 覆盖默认值"""
+    if wait is None:
+        return settings.DECIDE_LONG_POLL_TIMEOUT
+    return max(0.0, min(wait, settings.DECIDE_LONG_POLL_MAX_WAIT))
+
+
+def _resolve_session(guid: Optional[str]):
+    """调试接口使用：指定 GUID 时取该会话，否则取最近活跃的会话"""
+    session = session_manager.peek(guid) if guid is not None else session_manager.most_recent()
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
 
 
 @app.get("/{guid}/decide/{layer}")
-async def decide(guid: str, layer: str):
-    global self_uid
-    self_uid = guid
+async def decide(guid: str, layer: str, wait: Optional[float] = None):
+    session = session_manager.get(guid)
+    timeout = _long_poll_timeout(wait)
     if layer == "Behaviour":
-        response_data = action_queue.get_action()
+        response_data = await session.action_queue.get_action_async(timeout)
+        if response_data:
+            session.record("actions_dispatched")
         return JSONResponse(content=response_data)
     elif layer == "Dialog":
-        response_data = {"Type": "Speak", "Utterance": dialog_queue.get_dialog()}
+        utterance = await session.dialog_queue.get_dialog_async(timeout)
+        if utterance:
+            session.record("dialogs_dispatched")
+        response_data = {"Type": "Speak", "Utterance": utterance}
         return JSONResponse(content=response_data)
     else:
         raise HTTPException(status_code=404, detail="Layer not found")
 
 
+@app.get("/sessions")
+async def sessions():
+    return JSONResponse(content=session_manager.get_stats())
+
+
 @app.get("/stats")
-async def stats():
-    return JSONResponse(content=action_queue.get_stats())
+async def stats(guid: Optional[str] = None):
+    session = _resolve_session(guid)
+    return JSONResponse(content=session.action_queue.get_stats())
 
 
 @app.get("/inference-status")
-async def inference_status():
+async def inference_status(guid: Optional[str] = None):
+    session = _resolve_session(guid)
     status = {
-        "inference_running": task_instance.is_inference_running(),
-        "abort_event_set": task_instance.abort_event.is_set()
+        "guid": session.guid,
+        "inference_running": session.task.is_inference_running(),
+        "abort_event_set": session.task.abort_event.is_set(),
+        "model": session.task.model.get_metrics(),
+        "generations": dict(session.task.generation_stats),
+        "events": session.event_manager.get_stats()
     }
     return JSONResponse(content=status)
 
 
+@app.get("/actions")
+async def actions(guid: Optional[str] = None, recent: int = 0):
+    """动作生命周期统计：按动作类型的排队 / 执行延迟分位数和失败率"""
+    session = _resolve_session(guid)
+    return JSONResponse(content=session.action_ledger.get_stats(recent=max(0, min(recent, 100))))
+
+
 @app.get("/abort-inference")
-async def abort_inference():
-    aborted = task_instance.abort_current_inference()
-    return JSONResponse(content={"aborted": aborted})
+async def abort_inference(guid: Optional[str] = None):
+    session = _resolve_session(guid)
+    aborted = session.task.abort_current_inference()
+    return JSONResponse(content={"guid": session.guid, "aborted": aborted})
 
 
 @app.get("/vision")
-async def get_vision():
-    return JSONResponse(content=current_perception)
+async def get_vision(guid: Optional[str] = None):
+    session = _resolve_session(guid)
+    return JSONResponse(content=session.current_perception)
 
 
 @app.post("/{guid}/perceptions")
 async def receive_perception(guid: str, request: Request):
-    global self_uid
-    self_uid = guid
+    session = session_manager.get(guid)
     data = await request.json()
-    current_perception.clear()
-    current_perception.update(data)
+    try:
+        session.perception_store.apply_snapshot(data)
+    except PerceptionDeltaError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    session.on_perception_updated()
+    session.record("perceptions")
     # # 提取current_perception中的"Recipes"字段并保存为json文件
     # recipes = current_perception.get("Recipes", [])
     # # 直接保存原始recipes到文件
@@ -111,22 +149,43 @@ async def receive_perception(guid: str, request: Request):
     return JSONResponse(content={"status": f"Perception for GUID {guid} received and is being processed."}, status_code=202)
 
 
+@app.post("/{guid}/perceptions/delta")
+async def receive_perception_delta(guid: str, request: Request):
+    session = session_manager.get(guid)
+    data = await request.json()
+    try:
+        applied, expected_seq = session.perception_store.apply_delta(data)
+    except PerceptionDeltaError as e:
+        # 格式错误：当前序列已作废，客户端需要重发完整快照
+        return JSONResponse(content={"status": "invalid", "detail": str(e), "expected_seq": None}, status_code=400)
+    if not applied:
+        # 序号断档或状态不一致，要求客户端重发完整快照
+        return JSONResponse(content={"status": "resync", "expected_seq": expected_seq}, status_code=409)
+    session.on_perception_updated()
+    session.record("perception_deltas")
+    return JSONResponse(content={"status": "applied", "seq": expected_seq - 1}, status_code=202)
+
+
 @app.post("/{guid}/events")
 async def receive_event(guid: str, request: Request):
+    session = session_manager.get(guid)
     data = await request.json()
-    event_manager.handle_event(data)
+    session.record("events")
+    session.event_manager.handle_event(data)
     # logging.info(f"Event received for GUID {guid}: {data}")
     return JSONResponse(content={"status": "received event"})
 
 
 @app.post("/{guid}/command")
 async def receive_command(guid: str, request: Request):
+    session = session_manager.get(guid)
     data = await request.json()
     command = data.get("command", "")
     # command = COMMAND
     try:
         # 异步处理命令，立即返回响应
-        task_instance.processStreamAsync(command)
+        session.task.processStreamAsync(command)
+        session.record("commands")
         print(f"[Server] Command received and queued for processing: {command[:50]}...")
     except Exception as e:
         logging.error(f"Error while queuing command: {e}")
@@ -1,6 +1,7 @@
 import json
 import sys
 import os
+from functools import lru_cache
 
 # Handle both relative imports (when used as module) and absolute imports (when run directly)
 try:
@@ -11,7 +12,9 @@ except ImportError:
     from config.settings import settings
 
 
+@lru_cache(maxsize=1)
 def systemPrompt():
+    """系统提示词只生成一次：每次重置对话都使用逐字节相同的前缀，提供方的前缀缓存才能命中"""
 
     prompt = '''
 
@@ -232,6 +235,8 @@ You have access to a set of tools. Tool use is formatted using XML-style tags. T
 ...
 </tool_name>
 
+The read-only tools (check_inventory, check_status, check_surroundings, find_nearest, recall, check_equipslots, check_map, check_self_GUID, check_recipe, plan_craft, check_craftable) can be combined: put every check you need in one message and they are all executed together, with the results returned in a single observation. A `do` or any other tool ends the message. Observations may end with your current status and the inventory changes since the previous observation, so you rarely need to call check_status separately.
+
 
 ## check_inventory
 Description: Checks the player's inventory. Can be used to view the entire inventory or to check for a specific item and its quantity (if it exists).
@@ -261,13 +266,37 @@ Usage:
 <check_surroundings>
 </check_surroundings>
 
+## find_nearest
+Description: Finds the entities nearest to you by prefab and/or capability. Prefer it over check_surroundings when you are looking for something specific, the answer only contains the closest matches with their distance.
+Parameters:
+- prefab: (optional) A comma-separated list of prefabs to look for, e.g. evergreen. "tree" matches every kind of tree.
+- capability: (optional) Only return entities with this capability: Choppable, Mineable, Collectable, Pickable, Diggable, Hammerable, Harvestable, Edible, Cookable, Fuel or Equippable.
+- count: (optional) How many entities to return, defaults to 3.
+- radius: (optional) Only return entities within this distance.
+At least one of prefab and capability is required.
+Usage:
+<find_nearest>
+<prefab>tree</prefab>
+<count>3</count>
+</find_nearest>
+
+## recall
+Description: Recalls where you last saw entities that are no longer in your surroundings, nearest first. Use it before exploring for a resource, you may already have passed it. Entities seen before the server restarted have GUID null: go to their position and check_surroundings to get the current GUID.
+Parameters:
+- prefab: (required) A comma-separated list of prefabs to recall, e.g. rock2.
+- count: (optional) How many entities to return, defaults to 3.
+Usage:
+<recall>
+<prefab>rock2</prefab>
+</recall>
+
 ## check_status
 Description: Checks the player's status.
 Usage:
 <check_status></check_status>
 
 ## do
-Description: Request to perform an action.
+Description: Request to perform an action. The action is checked against your surroundings, inventory and the recipes before it is performed; if a GUID, coordinate or recipe is wrong you get an error naming the field at once, fix it and try again.
 Usage:
 <do>Your action here</do>
 
@@ -334,15 +363,60 @@ Use stop_explore to stop the explore tool:
 <stop_explore></stop_explore>
 
 
+## macro
+Description: Performs several actions in a row without asking you after each one; you are only notified when all of them are done or one fails. Use it for gathering, e.g. picking several grass or chopping several trees. No `do` is allowed while a macro is running.
+Parameters:
+- actions: (optional) Up to 10 actions, one per line, performed in order.
+- repeat: (optional) PICK, PICKUP, CHOP, MINE or DIG, performed on the nearest matching entities one after another.
+- prefab: (required with repeat) A comma-separated list of prefabs to repeat the action on.
+- count: (optional with repeat) On how many entities, defaults to 3, at most 10.
+- radius: (optional with repeat) Only use entities within this distance.
+Usage:
+<macro>
+<repeat>PICK</repeat>
+<prefab>grass</prefab>
+<count>5</count>
+</macro>
+
+<macro>
+<actions>
+Action(BUILD, -, -, -, axe) = -
+Action(BUILD, -, -, -, pickaxe) = -
+</actions>
+</macro>
+
+Use stop_macro to stop the macro:
+<stop_macro></stop_macro>
+
+
 ## check_recipe
 Description: Use this tool to check the recipes you can craft.
 Parameters:
-- recipe: (optional) The name of the recipe you want to check.
+- recipe: (optional) The name of the recipe you want to check. The prefab, English or Chinese name all work, and close misspellings are matched to the nearest recipe.
 Usage:
 <check_recipe>
 <recipe>researchlab</recipe>
 </check_recipe>
 
+
+## plan_craft
+Description: Plans how to craft an item from scratch in one call. The full material tree is expanded, the items you already have are subtracted, and you get the intermediate items to craft in order, the raw materials you are still missing and the tech (crafting station) required.
+Parameters:
+- recipe: (required) The name of the item you want to craft.
+- amount: (optional) How many you want, defaults to 1.
+Usage:
+<plan_craft>
+<recipe>researchlab2</recipe>
+</plan_craft>
+
+
+## check_craftable
+Description: Checks what you can craft with your current inventory. Without parameters it lists every recipe you have the ingredients for, split into those you can craft here (considering the crafting stations near you) and those that need a crafting station. With a recipe it shows the ingredients you are missing for it. BUILD actions whose ingredients you don't have are rejected before they are performed.
+Parameters:
+- recipe: (optional) The name of the recipe you want to check.
+Usage:
+<check_craftable></check_craftable>
+
 '''
     return prompt + system_prompt_summarize()
 
@@ -410,15 +484,25 @@ def instruction_summarize(global_goal, last_goal, role_status, possessions, worl
     return prompt
 
 
+def _get_recipe_index():
+    # 延迟导入：配方索引只在第一次生成提示词时加载
+    try:
+        from ..tools.recipe_index import get_recipe_index
+    except ImportError:
+        sys.path.insert(0, settings.BASE_DIR)
+        from src.tools.recipe_index import get_recipe_index
+    return get_recipe_index()
+
+
+@lru_cache(maxsize=1)
 def system_prompt_summarize():
     common_recipes = ""
     selected_recipes = ['torch', 'axe', 'pickaxe', 'spear', 'shovel', 'backpack', 'armorwood', 'researchlab', 'pighouse']
     final_recipes = []
-    with open(settings.RECIPE_LIST_FILE_PATH, "r", encoding="utf-8") as f:
-        recipes = json.load(f)
-    for recipe in recipes:
+    recipe_index = _get_recipe_index()
+    for recipe in recipe_index.iter_recipes():
         if recipe['name'] in selected_recipes:
-            ingredients_string = json.dumps(recipe['ingredients'], ensure_ascii=False) # , indent=4
+            ingredients_string = json.dumps(recipe_index.ingredients(recipe['name']), ensure_ascii=False) # , indent=4
             common_recipes += f"{recipe['name']}（英文名：{recipe['display_name_en']}，中文名：{recipe['display_name_zh']}）: {ingredients_string}\n"
             selected_recipes.remove(recipe['name'])
             final_recipes.append(recipe['name'])
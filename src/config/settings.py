@@ -23,21 +23,68 @@ class Settings:
     # Queue Configuration
     ACTION_QUEUE_SIZE: int = 20
     ACTION_ALLOWED_NUM: int = 1
+    # 动作在队列中的默认存活时间（秒），过期未被取走的动作不再下发；<= 0 表示不过期
+    ACTION_DEFAULT_TTL: float = 60.0
+    # macro 工具一次最多执行的步骤数（动作序列长度或重复次数）
+    MACRO_MAX_STEPS: int = 10
+    # do 动作入队前的坐标校验：超出 ±该值的坐标视为不在世界内
+    ACTION_MAX_COORDINATE: float = 1200.0
+    # 动作账本：保留最近的动作记录数，以及每种动作类型用于计算延迟分位数的样本数
+    ACTION_LEDGER_SIZE: int = 500
+    ACTION_LEDGER_WINDOW: int = 200
     DIALOG_QUEUE_SIZE: int = 20
+    # /decide long-poll: 默认等待时长与客户端 ?wait= 可请求的上限（秒）
+    DECIDE_LONG_POLL_TIMEOUT: float = 1.0
+    DECIDE_LONG_POLL_MAX_WAIT: float = 30.0
     
-    MAX_MESSAGE_LENGTH: int = 80
+    # Session Configuration - 每个 GUID 一个会话
+    SESSION_IDLE_TIMEOUT: float = 600.0  # seconds
+    SESSION_MAX_COUNT: int = 64
+    SESSION_SWEEP_INTERVAL: float = 30.0  # seconds
+
+    # 对话上下文的提示词 token 预算，config.json 中的 context_token_budget 可按模型配置覆盖
+    CONTEXT_TOKEN_BUDGET: int = 32000
+    # 上下文超过预算的该比例时在后台开始滚动总结；超过预算时先截断旧的工具观察，再淘汰最旧的消息
+    CONTEXT_SUMMARIZE_RATIO: float = 0.5
+    CONTEXT_SUMMARY_KEEP_RECENT: int = 10  # 滚动总结不折叠的最近消息数
+    CONTEXT_KEEP_RECENT: int = 6  # 最近的这么多条消息不截断、不淘汰
+    CONTEXT_TRUNCATED_OBSERVATION_TOKENS: int = 200  # 截断后的观察保留的 token 数
+    # 被更新结果取代的快照观察 (check_surroundings 等) 累计达到这么多 token 才一次性压缩，减少改写历史前缀的次数
+    CONTEXT_COMPACT_MIN_TOKENS: int = 2000
+    # 同一条回复中的只读工具 (check_*) 一次性执行，结果合并为一条观察
+    MULTI_TOOL_TURNS: bool = True
+    # 在观察消息后自动附加角色状态与物品栏变化
+    AUTO_ATTACH_STATE: bool = True
+    # 事件合并窗口（秒）：窗口内到达的非紧急事件合并为一条观察，<= 0 时每个事件立即打断推理
+    EVENT_COALESCE_INTERVAL: float = 0.5
+    # 反射层：入夜/黑暗时自动装备光源，饥饿或生命值低于最大值的该比例时自动进食，不等待 LLM
+    REFLEX_ENABLED: bool = True
+    REFLEX_HUNGER_RATIO: float = 0.25
+    REFLEX_HEALTH_RATIO: float = 0.3
+    REFLEX_COOLDOWN: float = 30.0  # seconds，同一条规则两次触发的最短间隔
     # File Paths
     BASE_DIR: str = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
     RECIPE_LIST_FILE_PATH: str = os.path.join(BASE_DIR, "recipes", "recipes_merged_processed.json")
+    # 本地生成的缓存文件（不提交到仓库）
+    CACHE_DIR: str = os.path.join(BASE_DIR, ".cache")
+    # 预编译配方索引：第一次加载时由配方 JSON 生成，JSON 变化后自动重建
+    RECIPE_INDEX_FILE_PATH: str = os.path.join(CACHE_DIR, "recipe_index.pickle")
     LOGS_DIR: str = os.path.join(BASE_DIR, "logs")
     CHAT_LOG_DIR: str = os.path.join(LOGS_DIR, "chat_log")
     # 暂时保持 memory 目录在根目录，直到用户决定移动它
     MEMORY_DIR: str = os.path.join(BASE_DIR, "memory")
     MAP_FILE_PATH: str = os.path.join(MEMORY_DIR, "map.json")
+    WORLD_MEMORY_FILE_PATH: str = os.path.join(MEMORY_DIR, "world_memory.json")
+    
+    # World Memory Configuration - 离开视野的实体记忆
+    WORLD_MEMORY_STALE_DAYS: int = 10  # 超过这么多天没再看到的实体被淘汰
+    WORLD_MEMORY_SEE_DIST: float = 16.0  # 小于 mod 的 SEE_DIST (18)，避免视野边缘的实体被误删
+    WORLD_MEMORY_SAVE_INTERVAL: float = 30.0  # seconds
     
     # Observer Configuration
-    OBSERVER_CLEANUP_INTERVAL: int = 240  # seconds
+    OBSERVER_CLEANUP_INTERVAL: int = 240  # seconds，已报告过的实体在这段时间内不会被再次报告
+    OBSERVER_ARM_DELAY: float = 1.0  # seconds，开始探索后等待 EXPLORE 动作启动再匹配感知
     
     # Logging Configuration
     LOG_LEVEL: str = "INFO"
@@ -60,12 +107,8 @@ class Settings:
             raise ValueError(f"配置文件格式错误: {e}")
     
     @classmethod
-    def get_ai_config(cls, config_name: Optional[str] = None) -> dict:
-        """从config.json获取AI配置
-        
-        Args:
-            config_name: 配置名称，如果为None则使用当前配置或第一个配置
-        """
+    def _resolve_config_name(cls, config_name: Optional[str] = None) -> str:
+        """确定要使用的配置名称：指定的、当前的或第一个配置"""
         configs = cls._load_config()
         
         # 如果没有指定配置名称，使用当前配置或第一个配置
@@ -81,24 +124,54 @@ class Settings:
         if config_name not in configs:
             available_configs = list(configs.keys())
             raise ValueError(f"配置 '{config_name}' 不存在。可用配置: {available_configs}")
+        return config_name
+    
+    @classmethod
+    def get_ai_config(cls, config_name: Optional[str] = None) -> dict:
+        """从config.json获取AI配置
         
-        config = configs[config_name]
-        return {
-            "api_key": config["api_key"],
-            "base_url": config["base_url"],
-            "model": config["model_name"],  # config.json中是model_name
-            "temperature": config["temperature"]
-        }
+        Args:
+            config_name: 配置名称，如果为None则使用当前配置或第一个配置
+        """
+        configs = cls._load_config()
+        config = configs[cls._resolve_config_name(config_name)]
+        # 路由配置 (model_type 为 routing) 没有 api_key 等字段，由模型自己校验必需项
+        ai_config = {}
+        for source, target in (("api_key", "api_key"), ("base_url", "base_url"),
+                               ("model_name", "model"),  # config.json中是model_name
+                               ("temperature", "temperature")):
+            if source in config:
+                ai_config[target] = config[source]
+        # 其余可选项（超时、重试、连接池等）原样透传给模型
+        for key, value in config.items():
+            if key not in ("api_key", "base_url", "model_name", "temperature", "model_type", "context_token_budget",
+                           "summary_model"):
+                ai_config[key] = value
+        return ai_config
     
+    @classmethod
+    def get_context_token_budget(cls, config_name: Optional[str] = None) -> int:
+        """对话上下文的 token 预算：config.json 中的 context_token_budget，未配置时取 CONTEXT_TOKEN_BUDGET"""
+        configs = cls._load_config()
+        return int(configs[cls._resolve_config_name(config_name)].get("context_token_budget", cls.CONTEXT_TOKEN_BUDGET))
+
+    @classmethod
+    def get_summary_config_name(cls, config_name: Optional[str] = None) -> Optional[str]:
+        """滚动总结使用的模型配置名：config.json 中的 summary_model，未配置时返回 None（使用主模型）"""
+        configs = cls._load_config()
+        summary_name = configs[cls._resolve_config_name(config_name)].get("summary_model")
+        return cls._resolve_config_name(summary_name) if summary_name else None
+
     @classmethod
     def set_current_config(cls, config_name: str):
         """设置当前使用的配置名称"""
         cls._current_config_name = config_name
     
     @classmethod
-    def get_ai_model_type(cls) -> str:
-        """获取AI模型类型，默认为openai_compatible"""
-        return "openai_compatible"
+    def get_ai_model_type(cls, config_name: Optional[str] = None) -> str:
+        """获取AI模型类型，可在config.json中通过model_type指定，默认为openai_compatible"""
+        configs = cls._load_config()
+        return configs[cls._resolve_config_name(config_name)].get("model_type", "openai_compatible")
     
     @classmethod
     def get_server_config(cls) -> dict:
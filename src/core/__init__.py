@@ -4,5 +4,6 @@ Contains the main business logic components
 """
 
 from .task import Task
+from .session import AgentSession, SessionManager
 
-__all__ = ['Task'] 
\ No newline at end of file
+__all__ = ['Task', 'AgentSession', 'SessionManager'] 
\ No newline at end of file
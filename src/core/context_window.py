@@ -0,0 +1,259 @@
+"""
+按 token 预算管理的对话上下文
+每条消息在加入时估算一次 token 数并缓存，总量超过预算时先截断最旧的工具观察（check_* 的大段输出），
+仍然超出再从最旧的消息开始淘汰；系统提示词和其后的第一条消息（目标 / 总结）始终保留。
+这样每次请求的提示词大小有上界，不再取决于消息条数。
+
+快照类工具（check_surroundings、check_inventory 等）的旧结果被同一工具的新结果取代后，
+替换为一行占位说明。为了尽量保持历史前缀不变（提供方的前缀缓存依赖它），
+被取代的结果先累计，达到 CONTEXT_COMPACT_MIN_TOKENS 或超出预算时才一次性改写。
+每次请求记录上一次请求的消息是否原样保留（前缀是否稳定），用于和提供方返回的缓存命中对照。
+"""
+
+import bisect
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..config.settings import settings
+
+# 每条消息的固定开销（角色、分隔符）
+MESSAGE_OVERHEAD_TOKENS = 4
+# 始终保留的开头消息数：系统提示词 + 目标 / 总结
+PINNED_MESSAGES = 2
+TRUNCATION_NOTE = "\n... [observation truncated, ~{} tokens omitted]"
+SUPERSEDED_NOTE = "[{} result superseded by a newer one]"
+
+# 消息来源：工具观察可以被截断，其余消息只能整体淘汰
+OBSERVATION = "observation"
+MESSAGE = "message"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算 token 数：ASCII 约 4 个字符一个 token，中文等非 ASCII 字符约一个字符一个 token。
+    只需要稳定且偏保守，不依赖具体模型的分词器。
+    """
+    if not text:
+        return MESSAGE_OVERHEAD_TOKENS
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ContextWindow:
+    """
+    消息列表及其缓存的 token 估算。messages 可以直接传给模型；修改只通过 append / reset 进行。
+
+    Args:
+        budget: 提示词 token 预算，默认取当前模型配置的 context_token_budget
+        keep_recent: 最近的这么多条消息不会被截断或淘汰
+    """
+
+    def __init__(self, messages: Optional[List[Dict[str, Any]]] = None, budget: Optional[int] = None,
+                 keep_recent: Optional[int] = None):
+        self.budget = settings.get_context_token_budget() if budget is None else budget
+        self.keep_recent = settings.CONTEXT_KEEP_RECENT if keep_recent is None else keep_recent
+        self.lock = threading.RLock()
+        self.messages: List[Dict[str, Any]] = []
+        self.tokens: List[int] = []
+        self.kinds: List[str] = []
+        self.ids: List[int] = []  # 每条消息的编号，淘汰后下标会变，快照按编号定位
+        self.next_id = 0
+        self.total = 0
+        self.live_snapshots: Dict[str, Tuple[int, str]] = {}  # 工具名 -> 最新结果所在消息编号和文本
+        self.superseded: List[Tuple[int, str, str]] = []  # 待压缩的 (消息编号, 工具名, 文本)
+        self.superseded_tokens = 0
+        self.dirty_from: Optional[int] = None  # 上次请求之后被改写的最靠前的消息下标
+        self.last_request_tokens = 0
+        self.stats = {
+            'requests': 0,
+            'prefix_intact': 0,
+            'prefix_broken': 0,
+            'last_stable_prefix_tokens': 0,
+            'compacted': 0,
+            'compaction_tokens_saved': 0,
+            'last_compaction_saved': 0,
+            'truncated': 0,
+            'evicted': 0,
+            'tokens_freed': 0,
+            'folds': 0,
+            'resets': 0
+        }
+        self.reset(messages or [])
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    def __getitem__(self, index):
+        return self.messages[index]
+
+    def reset(self, messages: List[Dict[str, Any]]):
+        """替换全部消息（总结之后）"""
+        with self.lock:
+            # 系统提示词不变时，重置只改写它之后的部分
+            same_system = bool(self.messages and messages and self.messages[0] == messages[0])
+            self._mark_dirty(1 if same_system else 0)
+            self.messages, self.tokens, self.kinds, self.ids = [], [], [], []
+            self.total = 0
+            self.live_snapshots, self.superseded, self.superseded_tokens = {}, [], 0
+            self.stats['resets'] += 1
+            for message in messages:
+                self._append(message, MESSAGE)
+
+    def append(self, message: Dict[str, Any], kind: str = MESSAGE,
+               snapshots: Optional[List[Tuple[str, str]]] = None) -> int:
+        """
+        加入一条消息，必要时压缩、截断或淘汰旧消息使总量回到预算内。
+
+        Args:
+            snapshots: 消息中包含的快照类工具结果 [(工具名, 结果文本)]，取代同一工具之前的结果
+
+        Returns:
+            本次压缩被取代的快照节省的 token 数
+        """
+        with self.lock:
+            message_id = self._append(message, kind)
+            for tool, text in snapshots or ():
+                previous = self.live_snapshots.get(tool)
+                if previous is not None:
+                    self.superseded.append((previous[0], tool, previous[1]))
+                    self.superseded_tokens += estimate_tokens(previous[1]) - MESSAGE_OVERHEAD_TOKENS
+                self.live_snapshots[tool] = (message_id, text)
+            saved = 0
+            if self.superseded_tokens >= settings.CONTEXT_COMPACT_MIN_TOKENS or self.total > self.budget:
+                saved = self._compact()
+            if self.total > self.budget:
+                self._enforce()
+            return saved
+
+    def _append(self, message: Dict[str, Any], kind: str) -> int:
+        tokens = estimate_tokens(message.get("content", ""))
+        self.messages.append(message)
+        self.tokens.append(tokens)
+        self.kinds.append(kind)
+        self.ids.append(self.next_id)
+        self.next_id += 1
+        self.total += tokens
+        return self.next_id - 1
+
+    def fold(self, upto_id: int, message: Dict[str, Any], resets: int) -> int:
+        """
+        用一条总结消息替换第 1 条到编号 upto_id 为止的消息（系统提示词保留）。
+        resets 是开始总结时的重置次数，期间上下文被重置过则不替换。
+
+        Returns:
+            被替换的消息数，未替换时为 0
+        """
+        with self.lock:
+            if self.stats['resets'] != resets:
+                return 0
+            # 编号单调递增，已被淘汰的消息自然不在范围内
+            cut = bisect.bisect_right(self.ids, upto_id)
+            if cut <= 1:
+                return 0
+            tokens = estimate_tokens(message.get("content", ""))
+            self.total += tokens - sum(self.tokens[1:cut])
+            self.messages[1:cut] = [message]
+            self.tokens[1:cut] = [tokens]
+            self.kinds[1:cut] = [MESSAGE]
+            self.ids[1:cut] = [upto_id]
+            self._mark_dirty(1)
+            self.stats['folds'] += 1
+            return cut - 1
+
+    def _mark_dirty(self, index: int):
+        if self.dirty_from is None or index < self.dirty_from:
+            self.dirty_from = index
+
+    def request_messages(self) -> List[Dict[str, Any]]:
+        """
+        发给模型的消息快照。同时记录自上次请求以来前缀是否保持不变，
+        以及可被前缀缓存复用的 token 数（估算）。
+        """
+        with self.lock:
+            if self.stats['requests'] > 0:
+                if self.dirty_from is None:
+                    self.stats['prefix_intact'] += 1
+                    self.stats['last_stable_prefix_tokens'] = self.last_request_tokens
+                else:
+                    self.stats['prefix_broken'] += 1
+                    self.stats['last_stable_prefix_tokens'] = sum(self.tokens[:self.dirty_from])
+            self.stats['requests'] += 1
+            self.dirty_from = None
+            self.last_request_tokens = self.total
+            return list(self.messages)
+
+    def _compact(self) -> int:
+        """把累计的被取代快照替换为占位说明，返回节省的 token 数"""
+        saved = 0
+        positions = {message_id: index for index, message_id in enumerate(self.ids)}
+        for message_id, tool, text in self.superseded:
+            index = positions.get(message_id)
+            if index is None:
+                continue  # 已被淘汰
+            content = self.messages[index].get("content", "")
+            compacted = content.replace(text, SUPERSEDED_NOTE.format(tool), 1)
+            if compacted == content:
+                continue  # 已被截断
+            self.messages[index] = dict(self.messages[index], content=compacted)
+            self._mark_dirty(index)
+            tokens = estimate_tokens(compacted)
+            saved += self.tokens[index] - tokens
+            self.total += tokens - self.tokens[index]
+            self.tokens[index] = tokens
+            self.stats['compacted'] += 1
+        self.superseded, self.superseded_tokens = [], 0
+        self.stats['compaction_tokens_saved'] += saved
+        self.stats['last_compaction_saved'] = saved
+        return saved
+
+    def usage(self) -> float:
+        """当前 token 数占预算的比例"""
+        return self.total / self.budget if self.budget > 0 else 0.0
+
+    def _enforce(self):
+        """先截断旧的大段观察（最旧的优先），仍超出预算时按时间顺序淘汰消息"""
+        protected = max(PINNED_MESSAGES, len(self.messages) - self.keep_recent)
+        limit = settings.CONTEXT_TRUNCATED_OBSERVATION_TOKENS
+        for index in range(PINNED_MESSAGES, protected):
+            if self.total <= self.budget:
+                return
+            if self.kinds[index] == OBSERVATION and self.tokens[index] > limit:
+                self._truncate(index, limit)
+        while self.total > self.budget and len(self.messages) > PINNED_MESSAGES + self.keep_recent:
+            self._mark_dirty(PINNED_MESSAGES)
+            self.messages.pop(PINNED_MESSAGES)
+            self.kinds.pop(PINNED_MESSAGES)
+            self.ids.pop(PINNED_MESSAGES)
+            tokens = self.tokens.pop(PINNED_MESSAGES)
+            self.total -= tokens
+            self.stats['evicted'] += 1
+            self.stats['tokens_freed'] += tokens
+
+    def _truncate(self, index: int, limit: int):
+        content = self.messages[index].get("content", "")
+        # 按比例保留开头部分，估算误差由重新计数修正
+        keep = max(0, int(len(content) * limit / self.tokens[index]))
+        truncated = content[:keep] + TRUNCATION_NOTE.format(self.tokens[index] - limit)
+        self.messages[index] = dict(self.messages[index], content=truncated)
+        self._mark_dirty(index)
+        tokens = estimate_tokens(truncated)
+        self.total += tokens - self.tokens[index]
+        self.stats['truncated'] += 1
+        self.stats['tokens_freed'] += self.tokens[index] - tokens
+        self.tokens[index] = tokens
+        self.kinds[index] = MESSAGE
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.stats)
+            stats.update({
+                'messages': len(self.messages),
+                'tokens': self.total,
+                'budget': self.budget,
+                'pending_compaction_tokens': self.superseded_tokens,
+                'usage': round(self.usage(), 3)
+            })
+            return stats
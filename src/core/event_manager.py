@@ -1,17 +1,47 @@
+import queue
+import threading
+
+from ..config.settings import settings
+
+
 class EventManager:
     """
     事件管理器，负责处理游戏中的各种事件
+
+    非紧急事件在 coalesce_interval 窗口内合并为一条观察消息，且不打断正在进行的生成；
+    紧急事件（入夜、进入黑暗）立即送出并抢占当前推理。
+    processStream 可能等待上一轮推理线程结束，消息由一个后台线程按提交顺序送出，
+    /events 和 /perceptions 请求不会阻塞服务的事件循环。
     """
     
-    def __init__(self, task_instance, current_perception):
+    def __init__(self, task_instance, current_perception, coalesce_interval=None, ledger=None, reflexes=None):
         """
         初始化事件管理器
         current_perception: 当前感知字典
         Args:
             task_instance: Task实例，用于调用processStream方法
+            coalesce_interval: 事件合并窗口（秒），默认取 settings.EVENT_COALESCE_INTERVAL
+            ledger: 可选的 ActionLedger，动作结束事件据此找到对应的动作并记录完成时间
+            reflexes: 可选的 ReflexEngine，事件和感知更新先经过反射规则，再交给模型
         """
         self.task_instance = task_instance
         self.current_perception = current_perception
+        self.ledger = ledger
+        self.reflexes = reflexes
+        self.coalesce_interval = settings.EVENT_COALESCE_INTERVAL if coalesce_interval is None else coalesce_interval
+        self.pending = []
+        self.lock = threading.Lock()
+        self.flush_timer = None
+        self.closed = False
+        self.outbox = queue.Queue()  # (消息, 是否抢占)，None 表示停止
+        self.sender = None
+        self.stats = {
+            'events_received': 0,
+            'messages_submitted': 0,
+            'batches_flushed': 0,
+            'coalesced_messages': 0,
+            'urgent_messages': 0
+        }
 
     def handle_event(self, data):
         """
@@ -20,7 +50,26 @@ class EventManager:
         Args:
             data: 事件数据字典
         """
+        with self.lock:
+            self.stats['events_received'] += 1
+        # 反射动作已经紧急入队，说明消息排在事件消息之前一起送给模型
+        if self.reflexes is not None:
+            for message in self.reflexes.on_event(data):
+                self._submit(message)
         info = "Info: {}".format(data.get("Info")) if data.get("Info") else ""
+        # 动作结束事件：在账本中找到对应的动作，把其 AUID 和耗时附加到观察消息
+        if self.ledger is not None and data.get("Type") in ("Action-End", "Action-Failed"):
+            record = self.ledger.completed(data.get("Name"), data.get("Type") == "Action-Failed", data.get("Info") or "")
+            if record is not None:
+                info = (info + " " + self.ledger.describe(record)).strip()
+        # 宏的中间步骤由 MacroRunner 继续下发，不唤醒模型；宏结束时只送出汇总消息
+        if data.get("Type") in ("Action-End", "Action-Failed"):
+            handled = self.task_instance.toolExecutor.macro_runner.on_action_event(data)
+            if handled is True:
+                return
+            if handled is not None:
+                self._submit(handled)
+                return
         
         # 处理BUILD相关事件
         if "BUILD" in data.get("Name"):
@@ -34,18 +83,117 @@ class EventManager:
         
         # 处理属性变化事件
         self._handle_property_change_events(data)
+
+    def handle_perception(self):
+        """感知更新后求值反射规则（饥饿、生命值），把反射层做了什么告诉模型"""
+        if self.reflexes is None:
+            return
+        for message in self.reflexes.on_perception():
+            self._submit(message)
+
+    def submit(self, message, urgent=False):
+        """供其它组件（如探索订阅）提交观察消息，与事件消息经同一个送出线程按顺序送出"""
+        self._submit(message, urgent)
+
+    def _submit(self, message, urgent=False):
+        """
+        提交一条观察消息。
+        紧急消息连同已缓冲的消息立即送出并打断当前推理；
+        其余消息进入缓冲区，合并窗口结束时一次性送出。
+        """
+        if self.coalesce_interval <= 0:
+            with self.lock:
+                if self.closed:
+                    return
+                self.stats['messages_submitted'] += 1
+            self._send(message, preempt=True)
+            return
+
+        with self.lock:
+            if self.closed:
+                return
+            self.stats['messages_submitted'] += 1
+            self.pending.append(message)
+            if not urgent:
+                if self.flush_timer is None:
+                    self.flush_timer = threading.Timer(self.coalesce_interval, self.flush)
+                    self.flush_timer.daemon = True
+                    self.flush_timer.start()
+                return
+            self.stats['urgent_messages'] += 1
+            batch = self._drain()
+
+        self._send(batch, preempt=True)
+
+    def _send(self, message, preempt):
+        """交给后台线程送出，第一次调用时启动该线程"""
+        with self.lock:
+            if self.sender is None:
+                self.sender = threading.Thread(target=self._sender_loop, name="event-sender", daemon=True)
+                self.sender.start()
+        self.outbox.put((message, preempt))
+
+    def _sender_loop(self):
+        while True:
+            item = self.outbox.get()
+            if item is None:
+                return
+            if self.closed:
+                continue  # 会话已回收，丢弃尚未送出的消息
+            message, preempt = item
+            try:
+                self.task_instance.processStream(message, preempt=preempt)
+            except Exception as e:
+                print(f"事件消息送出失败: {e}")
+
+    def _drain(self):
+        """取出缓冲区中的全部消息并合并（调用方需持有 self.lock）"""
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+        messages, self.pending = self.pending, []
+        self.stats['batches_flushed'] += 1
+        self.stats['coalesced_messages'] += len(messages) - 1
+        return "\n".join(messages)
+
+    def flush(self):
+        """合并窗口结束：把缓冲的消息作为一条观察送出，不打断正在进行的生成"""
+        with self.lock:
+            if self.closed or not self.pending:
+                self.flush_timer = None
+                return
+            batch = self._drain()
+        self._send(batch, preempt=False)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['pending'] = len(self.pending)
+            stats['unsent'] = self.outbox.qsize()
+            stats['coalesce_interval'] = self.coalesce_interval
+            return stats
+
+    def shutdown(self):
+        """取消尚未触发的合并定时器，丢弃缓冲的消息并停止送出线程"""
+        with self.lock:
+            self.closed = True
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+                self.flush_timer = None
+            self.pending = []
+        self.outbox.put(None)
     
     def _handle_build_event(self, data, info):
         """处理BUILD相关事件"""
         if data.get("Type") == "Action-Failed":
             # print(info)
-            self.task_instance.processStream(
+            self._submit(
                 "The action {} -> {} failed. {}".format(
                     data.get("Name"), data.get("Value"), info
                 )
             )
         elif data.get("Type") in "Action-End":
-            self.task_instance.processStream(
+            self._submit(
                 "The action {} -> {} done. {}".format(
                     data.get("Name"), data.get("Value"), info
                 )
@@ -53,30 +201,27 @@ class EventManager:
     
     def _handle_pathfind_event(self, data):
         """处理PATHFIND事件"""
-        if self.task_instance.toolExecutor._has_pathfind_action():
-            # print(f"[EventManager] Pathfind event received, stopping pathfind thread")
-            self.task_instance.toolExecutor.pathfind_stop_event.set()
-            # Wait briefly for the old thread to finish
-            self.task_instance.toolExecutor.pathfind_thread.join(timeout=1)
+        # 寻路已经结束（到达或失败），清除寻路状态
+        self.task_instance.toolExecutor.cancel_pathfind()
         if data.get("Type") in "Action-End":
-            self.task_instance.processStream(
+            self._submit(
                 "You've arrived at " + str(data.get("Value"))
             )
         else:
-            self.task_instance.processStream(
+            self._submit(
                 "Can't find way to " + str(data.get("Value")) + "or is interuppted" + "Your current location is x: {}, z: {}".format(self.current_perception["PosX"], self.current_perception["PosZ"])
             )
     
     def _handle_general_event(self, data, info):
         """处理一般事件"""
         if data.get("Type") in "Action-End":
-            self.task_instance.processStream(
+            self._submit(
                 "The action {} -> {} done. {}".format(
                     data.get("Name"), data.get("Value"), info
                 )
             )
         elif data.get("Type") == "Action-Failed":
-            self.task_instance.processStream(
+            self._submit(
                 "The action {} -> {} failed. {}".format(
                     data.get("Name"), data.get("Value"), info
                 )
@@ -85,11 +230,11 @@ class EventManager:
     def _handle_property_change_events(self, data):
         """处理属性变化事件"""
         # 处理光照变化
-        if data.get("Type") == "Property-Change" and data.get("Name") == "InLight(Walter)":
+        if data.get("Type") == "Property-Change" and str(data.get("Name") or "").startswith("InLight("):
             if data.get("Value") == "True":
-                self.task_instance.processStream("You are in light now.")
+                self._submit("You are in light now.")
             else:
-                self.task_instance.processStream("You are in dark now.")
+                self._submit("You are in dark now.", urgent=True)
         
         # 处理夜晚来临
         if data.get("Type") == "Property-Change" and data.get("Name") == "EnteringNight":
@@ -97,19 +242,17 @@ class EventManager:
                 # print(data)
                 exploration_stop = ""
                 pathfind_stop = ""
-                if self.task_instance.toolExecutor._has_explore_action():
-                    self.task_instance.toolExecutor.observer_stop_event.set()
-                    # Wait briefly for the old thread to finish
-                    self.task_instance.toolExecutor.observer_thread.join(timeout=0.5)
+                macro_stop = ""
+                if self.task_instance.toolExecutor.cancel_explore():
                     exploration_stop = "[Exploration Stopped]\n"
-                elif self.task_instance.toolExecutor._has_pathfind_action():
-                    self.task_instance.toolExecutor.pathfind_stop_event.set()
-                    # Wait briefly for the old thread to finish
-                    self.task_instance.toolExecutor.pathfind_thread.join(timeout=0.5)
+                elif self.task_instance.toolExecutor.cancel_pathfind():
                     pathfind_stop = "[Pathfind Stopped]\n"
+                if self.task_instance.toolExecutor.macro_runner.cancel():
+                    macro_stop = "[Macro Stopped]\n"
 
-                self.task_instance.processStream(
-                    exploration_stop + pathfind_stop +
+                self._submit(
+                    exploration_stop + pathfind_stop + macro_stop +
                     "You are about to enter night. Make sure you have a light source like a torch etc. "
-                    "You have to equip the light source to prevent you from being attacked by Charlie."
+                    "You have to equip the light source to prevent you from being attacked by Charlie.",
+                    urgent=True
                 ) 
\ No newline at end of file
@@ -0,0 +1,188 @@
+"""
+反射层
+入夜、进入黑暗、饥饿和生命值过低需要立即反应，等一轮 LLM 推理（几秒）可能已经被查理攻击。
+这里用声明式规则在每次感知更新和事件到达时求值：条件满足时直接把动作以紧急优先级入队，
+再把做了什么告诉模型。每条规则有冷却时间和命中计数。
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..config.settings import settings
+from ..tools.action_parser import parse_action
+from ..tools.action_validator import iter_possessions
+
+# 按优先顺序排列的光源
+LIGHT_SOURCES = ("lantern", "minerhat", "torch")
+# 按优先顺序排列的回血食物
+HEALING_FOODS = ("butterflywings", "blue_cap", "honey")
+# 反射层不会主动吃的食物（掉血、掉理智或腐烂）
+AVOIDED_FOODS = {"monstermeat", "cookedmonstermeat", "spoiled_food", "rottenegg", "red_cap", "green_cap",
+                 "mandrake", "durian", "spoiled_fish", "spoiled_fish_small"}
+
+
+@dataclass(frozen=True)
+class ReflexRule:
+    """
+    event:  (Type, Name, Value)，事件三个字段都相同时触发；Name 以 "(" 结尾时按前缀匹配，
+            例如 "InLight(" 匹配任何角色的 InLight(<角色名>)
+    status: RoleStatus 中 "当前 / 最大" 格式的属性名，比例低于 below 时触发
+    response: ReflexEngine 中的响应名，对应 _respond_<response> 方法
+    """
+    name: str
+    response: str
+    event: Optional[Tuple[str, str, str]] = None
+    status: Optional[str] = None
+    below: float = 0.0
+    cooldown: Optional[float] = None
+
+
+REFLEX_RULES = (
+    ReflexRule("light_at_night", "equip_light", event=("Property-Change", "EnteringNight", "True")),
+    ReflexRule("light_in_dark", "equip_light", event=("Property-Change", "InLight(", "False")),
+    ReflexRule("eat_when_hungry", "eat_food", status="Hunger", below=settings.REFLEX_HUNGER_RATIO),
+    ReflexRule("heal_when_hurt", "eat_healing", status="Health", below=settings.REFLEX_HEALTH_RATIO),
+)
+
+
+def event_matches(pattern: Tuple[str, str, str], data: Dict[str, Any]) -> bool:
+    """事件是否匹配规则的 (Type, Name, Value)"""
+    event_type, name, value = pattern
+    actual = str(data.get("Name") or "")
+    if not (actual.startswith(name) if name.endswith("(") else actual == name):
+        return False
+    return data.get("Type") == event_type and str(data.get("Value")) == value
+
+
+def status_ratio(value: Any) -> Optional[float]:
+    """解析 "当前 / 最大" 格式的状态值"""
+    try:
+        current, maximum = (float(part) for part in str(value).split("/"))
+    except ValueError:
+        return None
+    return current / maximum if maximum > 0 else None
+
+
+class ReflexEngine:
+    """
+    每个会话一个。响应方法返回 (动作字符串, 说明) 或 (None, 未能响应的原因)；
+    入队的动作经过正常的动作队列，因此同样由账本记录，装备光源这类幂等动作按 WFN 去重。
+    """
+
+    def __init__(self, executor, rules=REFLEX_RULES, cooldown: Optional[float] = None):
+        self.executor = executor
+        self.rules = tuple(rules)
+        self.cooldown = settings.REFLEX_COOLDOWN if cooldown is None else cooldown
+        self.enabled = settings.REFLEX_ENABLED
+        self.lock = threading.Lock()
+        self.last_fired: Dict[str, float] = {}
+        # 已经告诉过模型"无法响应"的状态规则，状态恢复之前不再重复提示
+        self.reported = set()
+        self.counters = {rule.name: {"hits": 0, "fired": 0, "unavailable": 0, "satisfied": 0, "cooldown": 0}
+                         for rule in self.rules}
+
+    def on_event(self, data: Dict[str, Any]) -> List[str]:
+        """事件到达时求值事件规则，返回需要告诉模型的消息"""
+        if not self.enabled:
+            return []
+        return self._run([rule for rule in self.rules if rule.event is not None and event_matches(rule.event, data)])
+
+    def on_perception(self) -> List[str]:
+        """感知更新后求值状态规则，返回需要告诉模型的消息"""
+        if not self.enabled:
+            return []
+        role_status = self.executor.shared_perception_dict.get("RoleStatus") or {}
+        matched = []
+        for rule in self.rules:
+            if rule.status is None:
+                continue
+            ratio = status_ratio(role_status.get(rule.status))
+            if ratio is not None and ratio < rule.below:
+                matched.append(rule)
+            else:
+                self.reported.discard(rule.name)
+        return self._run(matched)
+
+    def _run(self, rules: List[ReflexRule]) -> List[str]:
+        messages = []
+        now = time.time()
+        for rule in rules:
+            counters = self.counters[rule.name]
+            with self.lock:
+                counters["hits"] += 1
+                cooldown = self.cooldown if rule.cooldown is None else rule.cooldown
+                if now - self.last_fired.get(rule.name, 0.0) < cooldown:
+                    counters["cooldown"] += 1
+                    continue
+                # 先占用冷却，避免事件线程和感知请求同时求值时重复触发
+                previous = self.last_fired.get(rule.name)
+                self.last_fired[rule.name] = now
+            action_str, description = getattr(self, "_respond_" + rule.response)()
+            if action_str is None:
+                report = bool(description) and rule.name not in self.reported
+                with self.lock:
+                    counters["unavailable" if description else "satisfied"] += 1
+                    if not report and self.last_fired.get(rule.name) == now:
+                        # 什么都没做（条件已满足或已经提示过），不进入冷却
+                        if previous is None:
+                            del self.last_fired[rule.name]
+                        else:
+                            self.last_fired[rule.name] = previous
+                if report:
+                    if rule.status is not None:
+                        self.reported.add(rule.name)
+                    messages.append("[Reflex {}] {}".format(rule.name, description))
+                continue
+            action = parse_action(action_str).to_dict()
+            if not self.executor.action_queue.put_action(action, urgent=True):
+                with self.lock:
+                    counters["unavailable"] += 1
+                messages.append("[Reflex {}] Could not queue {}, the action queue is full.".format(rule.name, action["WFN"]))
+                continue
+            with self.lock:
+                counters["fired"] += 1
+            messages.append("[Reflex {}] {} Queued {}.".format(rule.name, description, action["WFN"]))
+        return messages
+
+    def _possessions(self, slots: str = None) -> List[Dict[str, Any]]:
+        perception = self.executor.shared_perception_dict
+        if slots is None:
+            return list(iter_possessions(perception))
+        return list(iter_possessions({"Possessions": {slots: (perception.get("Possessions") or {}).get(slots)}}))
+
+    def _respond_equip_light(self):
+        if any(item.get("Prefab") in LIGHT_SOURCES for item in self._possessions("EquipSlots")):
+            return None, ""
+        carried = [item for item in self._possessions() if item.get("Prefab") in LIGHT_SOURCES]
+        if not carried:
+            return None, "It is dark and you have no light source. Craft a torch or stand next to a fire now."
+        item = min(carried, key=lambda item: LIGHT_SOURCES.index(item["Prefab"]))
+        return "Action(EQUIP, {}, -, -, -) = -".format(item["GUID"]), "Equipping {} ({}) against the dark.".format(
+            item["Prefab"], item["GUID"])
+
+    def _respond_eat_food(self):
+        foods = [item for item in self._possessions() if item.get("Edible") and item.get("Prefab") not in AVOIDED_FOODS]
+        if not foods:
+            return None, "You are starving and have nothing safe to eat. Find food soon."
+        # 优先吃堆叠最多的，保留稀有食物
+        item = max(foods, key=lambda item: item.get("Quantity", 1))
+        return "Action(EAT, -, -, -, -) = {}".format(item["GUID"]), "Hunger is low, eating {} ({}).".format(
+            item["Prefab"], item["GUID"])
+
+    def _respond_eat_healing(self):
+        foods = [item for item in self._possessions() if item.get("Edible") and item.get("Prefab") in HEALING_FOODS]
+        if not foods:
+            return None, "Health is low and you have no healing food. Avoid fights and retreat to safety."
+        item = min(foods, key=lambda item: HEALING_FOODS.index(item["Prefab"]))
+        return "Action(EAT, -, -, -, -) = {}".format(item["GUID"]), "Health is low, eating {} ({}).".format(
+            item["Prefab"], item["GUID"])
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "cooldown": self.cooldown,
+                "rules": {name: dict(counters) for name, counters in self.counters.items()}
+            }
@@ -0,0 +1,106 @@
+"""
+后台滚动总结
+上下文用量达到 CONTEXT_SUMMARIZE_RATIO（远低于预算上限）时，在后台线程中把较早的对话连同上一份总结
+折叠成新的总结；推理照常进行，不被中止。总结完成后，在下一轮生成开始前一次性替换被折叠的消息，
+最近 CONTEXT_SUMMARY_KEEP_RECENT 条消息原样保留。总结可以使用 config.json 中 summary_model 指定的
+另一个（更便宜的）模型配置。
+"""
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from ..config.settings import settings
+from .context_window import PINNED_MESSAGES
+
+
+class RollingSummarizer:
+    """
+    每个 Task 一个，同一时间最多一个总结在进行。
+    折叠范围按消息编号记录，总结期间新增或被淘汰的消息不影响替换；
+    期间对话被整体重置（例如初始规划）时丢弃这份总结。
+    """
+
+    def __init__(self, task, model, ratio: Optional[float] = None, keep_recent: Optional[int] = None):
+        self.task = task
+        self.model = model
+        self.ratio = settings.CONTEXT_SUMMARIZE_RATIO if ratio is None else ratio
+        self.keep_recent = settings.CONTEXT_SUMMARY_KEEP_RECENT if keep_recent is None else keep_recent
+        self.lock = threading.Lock()
+        self.running = False
+        self.pending: Optional[Dict[str, Any]] = None
+        self.stats = {
+            'started': 0,
+            'applied': 0,
+            'failed': 0,
+            'discarded': 0,
+            'messages_folded': 0,
+            'last_duration': None
+        }
+
+    def maybe_start(self) -> bool:
+        """上下文用量超过阈值且没有总结在进行时，启动后台总结；返回是否启动"""
+        context = self.task.context
+        if context.usage() < self.ratio:
+            return False
+        with self.lock:
+            if self.running or self.pending is not None:
+                return False
+            with context.lock:
+                # 预算很小、消息条数不多时至少折叠较早的一半
+                cut = max(len(context.messages) - self.keep_recent, len(context.messages) // 2)
+                if cut <= PINNED_MESSAGES:
+                    return False
+                # 折叠范围包括上一份总结（第 1 条消息），新的总结延续其中的信息
+                folded = list(context.messages[1:cut])
+                fold = {"upto_id": context.ids[cut - 1], "resets": context.stats['resets']}
+            self.running = True
+            self.stats['started'] += 1
+        self.task.debug_log(f"[Summarize] Rolling summary of {len(folded)} messages started in background")
+        threading.Thread(target=self._run, args=(folded, fold), daemon=True).start()
+        return True
+
+    def _run(self, folded, fold: Dict[str, Any]):
+        start = time.time()
+        result = None
+        try:
+            result = self.task.summarize_task(messages=folded, model=self.model)
+        except Exception as e:
+            self.task.debug_log(f"[Summarize] Error in rolling summary: {e}")
+        with self.lock:
+            self.running = False
+            self.stats['last_duration'] = round(time.time() - start, 2)
+            if not result or not any(result.values()):
+                self.stats['failed'] += 1
+                return
+            fold["result"] = result
+            self.pending = fold
+        self.task.debug_log(f"[Summarize] Rolling summary ready after {self.stats['last_duration']}s")
+
+    def apply(self) -> bool:
+        """在两轮生成之间调用：把已完成的总结替换进上下文，返回是否替换"""
+        with self.lock:
+            fold, self.pending = self.pending, None
+        if fold is None:
+            return False
+        result = fold["result"]
+        folded = self.task.context.fold(fold["upto_id"], {"role": "user", "content": self.task.summary_message(result)},
+                                        fold["resets"])
+        with self.lock:
+            if folded == 0:
+                self.stats['discarded'] += 1
+                return False
+            self.stats['applied'] += 1
+            self.stats['messages_folded'] += folded
+        if result.get("next_objectives"):
+            self.task.current_goal = result["next_objectives"]
+        self.task.debug_log(f"[Summarize] Folded {folded} messages into the rolling summary")
+        self.task.dialog_queue.put_dialog("策略更新完成")
+        return True
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.stats)
+            stats['running'] = self.running
+            stats['pending'] = self.pending is not None
+            return stats
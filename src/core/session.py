@@ -0,0 +1,217 @@
+"""
+Agent 会话管理
+每个游戏内 Agent（以 GUID 区分）拥有独立的 Task / ToolExecutor / 队列 / 感知字典，
+由 SessionManager 按需创建并在空闲超时后回收，使一个服务进程可以同时驱动多个玩家。
+"""
+
+import threading
+import time
+import logging
+from typing import Dict, Optional
+
+from .task import Task
+from .event_manager import EventManager
+from .reflex import ReflexEngine
+from ..utils.queues import ActionQueue, DialogQueue
+from ..utils.action_ledger import ActionLedger
+from ..utils.perception_delta import PerceptionStore
+from ..utils.world_memory import get_world_memory, world_identity
+from ..config.settings import settings
+
+
+class AgentSession:
+    """单个 Agent 的运行时状态"""
+
+    def __init__(self, guid: str):
+        self.guid = guid
+        self.action_ledger = ActionLedger()
+        self.action_queue = ActionQueue(maxsize=settings.ACTION_QUEUE_SIZE, ledger=self.action_ledger)
+        self.dialog_queue = DialogQueue(maxsize=settings.DIALOG_QUEUE_SIZE)
+        self.current_perception: Dict = {}
+        self.perception_store = PerceptionStore(self.current_perception)
+        self.world_memory = get_world_memory()
+        self.task = Task(self.action_queue, self.current_perception, self.dialog_queue, guid)
+        self.reflexes = ReflexEngine(self.task.toolExecutor)
+        self.event_manager = EventManager(self.task, self.current_perception, ledger=self.action_ledger,
+                                          reflexes=self.reflexes)
+        self.task.toolExecutor.event_manager = self.event_manager
+
+        self.created_at = time.time()
+        self.last_seen = self.created_at
+        self.stats = {
+            'perceptions': 0,
+            'perception_deltas': 0,
+            'events': 0,
+            'commands': 0,
+            'actions_dispatched': 0,
+            'dialogs_dispatched': 0
+        }
+
+    def touch(self):
+        """记录一次来自客户端的访问"""
+        self.last_seen = time.time()
+
+    def record(self, key: str, count: int = 1):
+        """累加吞吐量计数"""
+        self.stats[key] = self.stats.get(key, 0) + count
+
+    def on_perception_updated(self):
+        """完整快照或增量应用之后调用：更新世界记忆、评估探索订阅和反射规则"""
+        world_id = world_identity(self.current_perception)
+        if world_id != self.world_memory.world_id:
+            # 第一次收到世界标识或者换了世界：改用该世界的记忆
+            self.world_memory.save()
+            self.world_memory = get_world_memory(world_id)
+            self.task.toolExecutor.world_memory = self.world_memory
+        self.world_memory.observe(self.current_perception)
+        self.task.toolExecutor.on_perception()
+        self.event_manager.handle_perception()
+
+    def idle_seconds(self, now: Optional[float] = None) -> float:
+        return (now or time.time()) - self.last_seen
+
+    def get_stats(self) -> dict:
+        """获取该 Agent 的吞吐量统计"""
+        now = time.time()
+        uptime = max(now - self.created_at, 1e-6)
+        return {
+            'guid': self.guid,
+            'uptime': round(uptime, 1),
+            'idle': round(self.idle_seconds(now), 1),
+            'counters': self.stats.copy(),
+            'per_minute': {key: round(value * 60.0 / uptime, 2) for key, value in self.stats.items()},
+            'inference_running': self.task.is_inference_running(),
+            'context': self.task.context.get_stats(),
+            'summarizer': self.task.summarizer.get_stats(),
+            'perception': self.perception_store.get_stats(),
+            'world_memory': self.world_memory.get_stats(),
+            'macros': self.task.toolExecutor.macro_runner.get_stats(),
+            'reflexes': self.reflexes.get_stats(),
+            'action_queue': self.action_queue.get_stats(),
+            'dialog_queue': self.dialog_queue.get_stats()
+        }
+
+    def close(self):
+        """释放会话持有的线程与定时器"""
+        self.event_manager.shutdown()
+        self.task.shutdown()
+        self.world_memory.save()
+
+
+class SessionManager:
+    """
+    以 GUID 为键的会话注册表。
+    会话在第一次被访问时懒创建；每次访问时顺带清理空闲超过 idle_timeout 的会话，
+    会话数超过 max_sessions 时淘汰最久未访问的会话。
+    get() 在事件循环上被调用，被淘汰会话的关闭（等待推理线程、保存世界记忆）在锁外的后台线程中进行。
+    """
+
+    def __init__(self, idle_timeout: float = None, max_sessions: int = None, sweep_interval: float = None):
+        self.idle_timeout = settings.SESSION_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        self.max_sessions = settings.SESSION_MAX_COUNT if max_sessions is None else max_sessions
+        self.sweep_interval = settings.SESSION_SWEEP_INTERVAL if sweep_interval is None else sweep_interval
+        self._sessions: Dict[str, AgentSession] = {}
+        self._lock = threading.RLock()
+        self._last_sweep = time.time()
+        self.logger = logging.getLogger(__name__)
+        self.stats = {
+            'created': 0,
+            'evicted': 0
+        }
+
+    def get(self, guid: str) -> AgentSession:
+        """获取（必要时创建）指定 GUID 的会话，并刷新其活跃时间"""
+        guid = str(guid)
+        self._maybe_sweep()
+        evicted = None
+        with self._lock:
+            session = self._sessions.get(guid)
+            if session is None:
+                session, evicted = self._create(guid)
+            session.touch()
+        if evicted is not None:
+            self._close(evicted)
+        return session
+
+    def peek(self, guid: str) -> Optional[AgentSession]:
+        """获取已存在的会话，不创建也不刷新活跃时间"""
+        with self._lock:
+            return self._sessions.get(str(guid))
+
+    def most_recent(self) -> Optional[AgentSession]:
+        """最近活跃的会话，供不带 GUID 的调试接口使用"""
+        with self._lock:
+            if not self._sessions:
+                return None
+            return max(self._sessions.values(), key=lambda session: session.last_seen)
+
+    def sessions(self) -> list:
+        with self._lock:
+            return list(self._sessions.values())
+
+    def remove(self, guid: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(str(guid), None)
+        if session is None:
+            return False
+        self._close(session)
+        return True
+
+    def evict_idle(self, now: Optional[float] = None) -> list:
+        """淘汰空闲超时的会话，返回被淘汰的 GUID 列表"""
+        now = now or time.time()
+        with self._lock:
+            expired = [guid for guid, session in self._sessions.items()
+                       if session.idle_seconds(now) > self.idle_timeout]
+            sessions = [self._sessions.pop(guid) for guid in expired]
+        for session in sessions:
+            self.logger.info(f"Evicting idle session {session.guid} (idle {session.idle_seconds(now):.0f}s)")
+            self._close(session)
+        return expired
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'active': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'idle_timeout': self.idle_timeout,
+                'stats': self.stats.copy(),
+                'sessions': {guid: session.get_stats() for guid, session in self._sessions.items()}
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def _create(self, guid: str):
+        """创建会话（调用方需持有 self._lock），返回 (新会话, 需要关闭的被淘汰会话或 None)"""
+        oldest = None
+        if len(self._sessions) >= self.max_sessions:
+            oldest = min(self._sessions.values(), key=lambda session: session.last_seen)
+            self.logger.warning(f"Session limit {self.max_sessions} reached, evicting {oldest.guid}")
+            self._sessions.pop(oldest.guid)
+        session = AgentSession(guid)
+        self._sessions[guid] = session
+        self.stats['created'] += 1
+        self.logger.info(f"Created session for GUID {guid}")
+        return session, oldest
+
+    def _close(self, session: AgentSession):
+        """在后台线程中关闭已从注册表移除的会话，不阻塞调用方"""
+        with self._lock:
+            self.stats['evicted'] += 1
+        threading.Thread(target=self._close_now, args=(session,), name=f"close-session-{session.guid}",
+                         daemon=True).start()
+
+    def _close_now(self, session: AgentSession):
+        try:
+            session.close()
+        except Exception as e:
+            self.logger.error(f"Error closing session {session.guid}: {e}")
+
+    def _maybe_sweep(self):
+        now = time.time()
+        if now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        self.evict_idle(now)
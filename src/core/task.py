@@ -4,36 +4,44 @@ import re
 import json
 import datetime
 import os
-from ..tools.parse_tool import parse_assistant_message
+from ..tools.parse_tool import parse_assistant_message, StreamingToolParser, SNAPSHOT_TOOLS
 from ..config.prompt import system_prompt_summarize, systemPrompt, instruction_summarize
 from ..tools.tool_executor import ToolExecutor
 from ..config.settings import settings
 from ..model.model_factory import ModelFactory
+from .context_window import ContextWindow, OBSERVATION, MESSAGE
+from .rolling_summary import RollingSummarizer
 
 class Task:
     def __init__(self, action_queue, current_perception, dialog_queue, self_uid):
         # 使用模型工厂创建AI模型实例
         self.model = ModelFactory.create_from_settings(settings)
+        # 滚动总结可以使用 summary_model 指定的另一个模型配置
+        summary_config = settings.get_summary_config_name()
+        self.summary_model = ModelFactory.create_from_settings(settings, summary_config) if summary_config else self.model
         self.toolExecutor = ToolExecutor(self, action_queue, current_perception, dialog_queue, self_uid)
         self.dialog_queue = dialog_queue
         self.current_perception = current_perception
-        self.messages = [
+        self.self_uid = self_uid
+        self.context = ContextWindow([
             {"role": "system", "content": systemPrompt()},
-        ]
+        ])
         self.summarize_time = 0
+        self.summarizer = RollingSummarizer(self, self.summary_model)
         self.global_goal = ""
         self.current_goal = ""
         
         # 确保日志目录存在
         if not os.path.exists(settings.CHAT_LOG_DIR):
             os.makedirs(settings.CHAT_LOG_DIR)
-        # 根据时间戳命名日志文件
-        self.base_log_file = os.path.join(settings.CHAT_LOG_DIR, datetime.datetime.now().strftime("%Y%m%d_%H%M%S") + ".txt")
+        # 根据时间戳和 Agent GUID 命名日志文件，多个会话互不覆盖
+        log_name = datetime.datetime.now().strftime("%Y%m%d_%H%M%S") + "_" + str(self_uid)
+        self.base_log_file = os.path.join(settings.CHAT_LOG_DIR, log_name + ".txt")
         self.chat_log_file = self.base_log_file.split(".")[0] + "_" + str(0) + ".txt"
-        self.log_file_prompt = os.path.join(settings.LOGS_DIR, datetime.datetime.now().strftime("%Y%m%d_%H%M%S") + ".txt")
+        self.log_file_prompt = os.path.join(settings.LOGS_DIR, log_name + ".txt")
         
         # 调试日志文件
-        self.debug_log_file = os.path.join(settings.LOGS_DIR, "debug.log")
+        self.debug_log_file = os.path.join(settings.LOGS_DIR, "debug_{}.log".format(self_uid))
 
         # 清空debug.log
         with open(self.debug_log_file, "w", encoding="utf-8") as log:
@@ -44,11 +52,30 @@ class Task:
         self.abort_event = threading.Event()
         self.thread_lock = threading.Lock()
         
+        # 推理进行中到达的非紧急观察，在当前生成结束后合并送出
+        self.pending_observations = []
+        self.pending_lock = threading.Lock()
+        self.turn_active = False
+        self.generation_stats = {
+            'started': 0,
+            'completed': 0,
+            'aborted': 0,
+            'deferred_observations': 0
+        }
+        
         # 状态管理
-        self.is_summarizing = False
         self.is_processing_command = False
         self.initial_planning_done = False
 
+    @property
+    def messages(self):
+        """当前上下文中的消息列表"""
+        return self.context.messages
+
+    @messages.setter
+    def messages(self, messages):
+        self.context.reset(messages)
+
     def createMessage(self, abort_event):
         """
         使用模型创建消息流
@@ -59,24 +86,22 @@ class Task:
         Yields:
             str: 流式输出的内容块
         """
-        full_message = ""
+        parser = StreamingToolParser(batch_read_only=settings.MULTI_TOOL_TURNS)
         
         for content_chunk in self.model.create_chat_completion(
-            messages=self.messages,
+            messages=self.context.request_messages(),
             stream=True,
             abort_event=abort_event
         ):
             yield content_chunk
-            full_message += content_chunk
-            content_blocks, has_tool_use = parse_assistant_message(full_message)
-            
-            if has_tool_use:
+            # 增量解析，出现第一个完整工具块即停止
+            if parser.feed(content_chunk):
                 return
 
-    def createMessageOnce(self, messages):
+    def createMessageOnce(self, messages, model=None):
         self.debug_log(f"[Model] Calling create_chat_completion_once with {len(messages)} messages")
         try:
-            full_message = self.model.create_chat_completion_once(
+            full_message = (model or self.model).create_chat_completion_once(
                 messages=messages,
             )
             self.debug_log(f"[Model] Got response: {len(full_message) if full_message else 0} characters")
@@ -101,7 +126,21 @@ class Task:
         finally:
             self.is_processing_command = False
 
-    def processStream(self, user_message):
+    def processStream(self, user_message, preempt=True):
+        """
+        向模型提交一条观察/命令。
+
+        Args:
+            user_message: 消息内容
+            preempt: 为 False 时若推理正在进行，不打断当前生成，
+                     而是在本轮生成结束后与其它待发观察合并送出
+        """
+        if not preempt:
+            with self.pending_lock:
+                if self.turn_active:
+                    self.pending_observations.append(user_message)
+                    self.generation_stats['deferred_observations'] += 1
+                    return
 
         if settings.ENABLE_INITIAL_PLANNING:
             # 如果还在等待初始规划完成，直接返回
@@ -126,55 +165,105 @@ class Task:
             # inventory = self.toolExecutor.executeTool(parse_assistant_message("<check_inventory></check_inventory>")[0])
             # stream_input = f"{surroundings}\nYou have: \n{inventory}\n\n{user_message}"
 
-        if len(self.messages) > settings.MAX_MESSAGE_LENGTH:
-            self.debug_log(f"[Task] Message length exceeded ({len(self.messages)} > {settings.MAX_MESSAGE_LENGTH})")
-            # 检查是否已经在总结中，避免重复触发
-            if not self.is_summarizing:
-                self.debug_log("[Task] Triggering new summarize task")
-                self._start_summarize_task_async()
-                self.debug_log("[Task] Summarize triggered, continuing with current message processing")
-            else:
-                self.debug_log("[Task] Summarize already in progress, skipping duplicate trigger")
-        
-        self.append_to_messages({"role": "user", "content": user_message})
-
         # 启动推理线程
+        self._stop_inference_thread()
+        self.append_to_messages({"role": "user", "content": self.attach_state(self._merge_pending(user_message))})
+        self._start_inference_thread()
+
+    def _stop_inference_thread(self):
+        """中止正在进行的推理线程"""
         if self.current_thread and self.current_thread.is_alive():
             self.abort_event.set()
             self.current_thread.join(timeout=1.0)
-        
+
+    def _start_inference_thread(self):
+        """启动新一轮推理线程"""
         self.abort_event.clear()
-        self.current_thread = threading.Thread(target=self._processStreamInternal, daemon=True)
-        self.current_thread.start()
+        with self.pending_lock:
+            self.turn_active = True
+            self.current_thread = threading.Thread(target=self._runInference, daemon=True)
+            self.current_thread.start()
+
+    def _merge_pending(self, message):
+        """把待发的观察合并到消息前面"""
+        with self.pending_lock:
+            pending, self.pending_observations = self.pending_observations, []
+        if not pending:
+            return message
+        return "\n".join(pending + [message])
+
+    def _runInference(self):
+        """推理线程入口：生成结束后若有延迟的观察，继续下一轮"""
+        try:
+            while True:
+                self._processStreamInternal()
+                with self.pending_lock:
+                    if self.current_thread is not threading.current_thread():
+                        return  # 已被新一轮推理取代
+                    if self.abort_event.is_set() or not self.pending_observations:
+                        self.turn_active = False
+                        return
+                    pending, self.pending_observations = self.pending_observations, []
+                self.append_to_messages({"role": "user", "content": self.attach_state("\n".join(pending))})
+        except Exception:
+            with self.pending_lock:
+                if self.current_thread is threading.current_thread():
+                    self.turn_active = False
+            raise
     
     def _processStreamInternal(self):
         """执行推理逻辑"""
         if self.abort_event.is_set():
             return
         
+        # 两轮生成之间：换入已完成的滚动总结，上下文用量超过阈值时在后台开始新的总结
+        self.summarizer.apply()
+        self.summarizer.maybe_start()
+        
         full_message = ""
+        self.generation_stats['started'] += 1
         
         for content_chunk in self.createMessage(self.abort_event):
             if self.abort_event.is_set():
+                self.generation_stats['aborted'] += 1
                 return
             # print(content_chunk, end="", flush=True)
             full_message += content_chunk
         
         if self.abort_event.is_set():
+            self.generation_stats['aborted'] += 1
             return
         
+        self.generation_stats['completed'] += 1
         self.append_to_messages({"role": "assistant", "content": full_message})
         
         content_blocks, has_tool_use = parse_assistant_message(full_message)
         self.add_to_dialog_queue(content_blocks)
-        result = self.toolExecutor.executeTool(content_blocks)
+        tool_results = []
+        result = self.toolExecutor.executeTool(content_blocks, tool_results)
         
         if result and not self.abort_event.is_set():
-            self.append_to_messages({"role": "user", "content": result})
+            snapshots = [(name, text) for name, text in tool_results if name in SNAPSHOT_TOOLS]
+            self.append_to_messages({"role": "user", "content": self.attach_state(self._merge_pending(result))},
+                                    kind=OBSERVATION, snapshots=snapshots)
             self._processStreamInternal()
 
-    def append_to_messages(self, message):
-        self.messages.append(message)
+    def attach_state(self, observation):
+        """按配置在观察消息后附加角色状态与物品栏变化"""
+        if not settings.AUTO_ATTACH_STATE:
+            return observation
+        # 观察本身已包含状态时不再重复
+        state = self.toolExecutor.observation_state(include_status="Your current status is" not in observation)
+        return observation + "\n\n" + state if state else observation
+
+    def append_to_messages(self, message, kind=MESSAGE, snapshots=None):
+        """
+        加入一条消息；kind 为 OBSERVATION 的工具结果在超出 token 预算时可以被截断，
+        snapshots 中的快照类工具结果会取代历史中同一工具的旧结果
+        """
+        saved = self.context.append(message, kind, snapshots)
+        if saved:
+            self.debug_log(f"[Context] Compacted superseded observations, saved ~{saved} tokens")
         self.write_chat_log(message)
         
     def write_chat_log(self, message):
@@ -205,6 +294,11 @@ class Task:
             return True
         return False
     
+    def shutdown(self):
+        """会话回收时调用：终止推理并停止工具执行器的后台线程"""
+        self.abort_current_inference()
+        self.toolExecutor.shutdown()
+    
     def _start_initial_planning_async(self):
         """异步启动初始规划"""
         if self.initial_planning_done:
@@ -249,22 +343,9 @@ class Task:
             self.debug_log("[Execution] Already running, skipping")
             return
         
-        self.abort_event.clear()
-        self.current_thread = threading.Thread(target=self._processStreamInternal, daemon=True)
-        self.current_thread.start()
+        self._start_inference_thread()
         self.debug_log("[Execution] Task execution thread started")
     
-    def _restart_inference_after_summarize(self):
-        """总结完成后重新启动推理"""
-        self.debug_log("[Summarize] Restarting inference after summarize completion")
-        if self.current_thread and self.current_thread.is_alive():
-            self.abort_event.set()
-            self.current_thread.join(timeout=1.0)
-        
-        self.abort_event.clear()
-        self.current_thread = threading.Thread(target=self._processStreamInternal, daemon=True)
-        self.current_thread.start()
-        
     def add_to_dialog_queue(self, content_blocks):
         for block in content_blocks:
             if block.get('type') == 'text':
@@ -272,63 +353,27 @@ class Task:
             if block.get('type') == 'tool_use' and block.get('name') == "task_completion":
                 self.dialog_queue.put_dialog("Task Complete:" + block["params"].get("result", ""))
     
-    def _start_summarize_task_async(self):
-        """异步启动总结任务"""
-        self.debug_log(f"[Summarize] Request to start summarize task, current state: is_summarizing={self.is_summarizing}")
-        if self.is_summarizing:
-            self.debug_log("[Summarize] Already summarizing, ignoring request")
-            return
-        
-        self.is_summarizing = True
-        self.debug_log(f"[Summarize] Starting new summarize thread for {len(self.messages)} messages")
-        threading.Thread(target=self._do_summarize, daemon=True).start()
-    
-    def _do_summarize(self):
-        """执行总结任务"""
-        try:
-            self.debug_log(f"[Summarize] Starting summarize task, message count: {len(self.messages)}")
-            result = self.summarize_task()
-            
-            if result:
-                self.debug_log(f"[Summarize] Summarize task completed successfully")
-                if "next_objectives" in result:
-                    self.current_goal = result["next_objectives"]
-                    self.debug_log(f"[Summarize] Updated current goal: {self.current_goal[:50]}...")
-                
-                # 重置messages并使用总结结果
-                next_command = f"全局目标：\n{self.global_goal}\n当前目标：\n{result['next_objectives']}\n当前状态：\n{result['current_situation']}\n近期行动回顾：\n{result['recent_actions']}"
-                self.messages = [
-                    {"role": "system", "content": systemPrompt()}
-                ]
-                self.append_to_messages({"role": "user", "content": next_command})
-                self.debug_log("[Summarize] Messages reset with summary result")
-                
-                # 重新开始推理流程
-                self._restart_inference_after_summarize()
-                
-                self.dialog_queue.put_dialog("策略更新完成，重新开始推理")
-            else:
-                self.debug_log("[Summarize] Warning: Summarize task returned empty result")
-                self.dialog_queue.put_dialog("策略更新遇到问题")
-        
-        except Exception as e:
-            self.debug_log(f"[Summarize] Error in summarize task: {e}")
-            self.dialog_queue.put_dialog(f"策略更新出错: {str(e)}")
-        
-        finally:
-            self.is_summarizing = False
-            self.debug_log("[Summarize] Summarize task finished")
+    def summary_message(self, result):
+        """总结结果转换为上下文中第一条用户消息"""
+        return f"全局目标：\n{self.global_goal}\n当前目标：\n{result['next_objectives']}\n当前状态：\n{result['current_situation']}\n近期行动回顾：\n{result['recent_actions']}"
 
+    def summarize_task(self, messages=None, model=None):
+        """
+        调用模型总结历史。
 
-    def summarize_task(self):
+        Args:
+            messages: 要总结的消息，默认为系统提示词和第一条消息之后的全部对话
+            model: 使用的模型，默认为主模型
+        """
         self.debug_log(f"[Summarize] Starting summarize_task #{self.summarize_time + 1}")
         self.summarize_time += 1
         
         try:
             role_status = self.toolExecutor.check_status()
             world_status = json.dumps(self.current_perception["WorldStatus"], indent=4, ensure_ascii=False)
-            history_actions = self.format_history()
-            possessions = self.toolExecutor.executeTool(parse_assistant_message("<check_inventory></check_inventory>")[0])
+            history_actions = self.format_history(messages)
+            # 总结在后台线程中运行，直接读取物品栏，不经过推理线程使用的 executeTool
+            possessions = self.toolExecutor.execute_check_inventory({'params': {}})
             
             self.debug_log(f"[Summarize] Preparing summarize prompt...")
             prompt_for_summarize = instruction_summarize(
@@ -340,13 +385,13 @@ class Task:
                 history_actions=history_actions
             )
             
-            messages = [
+            prompt_messages = [
                 {"role": "system", "content": system_prompt_summarize()},
                 {"role": "user", "content": prompt_for_summarize}
             ]
             
             self.debug_log(f"[Summarize] Calling AI model for summary...")
-            summary = self.createMessageOnce(messages)
+            summary = self.createMessageOnce(prompt_messages, model)
             
             if not summary:
                 self.debug_log("[Summarize] Error: AI model returned empty summary")
@@ -368,11 +413,11 @@ class Task:
             self.debug_log(f"[Summarize] Exception in summarize_task: {e}")
             return None
 
-    def format_history(self):
+    def format_history(self, messages=None):
         history = ""
-        for i, message in enumerate(self.messages):
-            if i <= 1:
-                continue
+        if messages is None:
+            messages = self.messages[2:]
+        for message in messages:
             if message["role"] == "assistant":
                 history += "\n" + "[Assistant]\n" + message["content"] + "\n"
             elif message["role"] == "user":
@@ -5,6 +5,9 @@ AI模型包
 
 from .base_model import BaseModel
 from .openai_model import OpenAIModel
+from .async_openai_model import AsyncOpenAIModel
+from .routing_model import RoutingModel
 from .model_factory import ModelFactory
+from .usage import UsageTracker
 
-__all__ = ['BaseModel', 'OpenAIModel', 'ModelFactory']
+__all__ = ['BaseModel', 'OpenAIModel', 'AsyncOpenAIModel', 'RoutingModel', 'ModelFactory', 'UsageTracker']
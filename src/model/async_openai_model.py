@@ -0,0 +1,393 @@
+"""
+异步 OpenAI 兼容模型实现
+基于 AsyncOpenAI，在共享的后台事件循环上运行：
+- 每个 base_url 共享一个调优过的 keep-alive 连接池
+- 连接 / 首 token / 总时长三级超时
+- 首 token 之前的可重试错误按指数退避 + 抖动重试，并受全局重试预算限制
+- 记录每次调用的首 token 时间 (TTFT)、tokens/sec 以及提示词缓存命中的 token 数
+"""
+
+import asyncio
+import queue
+import random
+import threading
+import time
+from typing import Dict, Any, Iterator, List, AsyncIterator, Optional
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+
+from .base_model import BaseModel
+from .usage import UsageTracker, chunk_usage
+
+
+# 可重试的错误：连接失败、超时、限流、服务端错误
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class FirstTokenTimeout(Exception):
+    """在 first_token_timeout 内没有收到首个 token"""
+
+
+class TotalTimeout(Exception):
+    """调用总时长超过 total_timeout"""
+
+
+class _EventLoopThread:
+    """所有异步模型共享的后台事件循环"""
+
+    _lock = threading.Lock()
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def get_loop(cls) -> asyncio.AbstractEventLoop:
+        with cls._lock:
+            if cls._loop is None or cls._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="model-event-loop", daemon=True)
+                thread.start()
+                cls._loop = loop
+            return cls._loop
+
+
+class RetryBudget:
+    """
+    令牌桶形式的重试预算：每次成功调用存入 ratio 个令牌，每次重试消耗一个，
+    防止服务端故障时重试把请求量放大数倍。
+    """
+
+    def __init__(self, ratio: float = 0.2, capacity: float = 10.0):
+        self.ratio = ratio
+        self.capacity = capacity
+        self.tokens = capacity
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self.lock:
+            if self.tokens < 1.0:
+                return False
+            self.tokens -= 1.0
+            return True
+
+
+class AsyncOpenAIModel(BaseModel):
+    """异步 OpenAI 兼容模型实现"""
+
+    # 连接池按 base_url 和池的超时 / 容量设置共享（设置不同的模型使用各自的池），重试预算按 base_url 共享
+    _http_clients: Dict[tuple, httpx.AsyncClient] = {}
+    _retry_budgets: Dict[str, RetryBudget] = {}
+    _shared_lock = threading.Lock()
+
+    # 决定连接池行为的选项，是共享连接池的键的一部分
+    POOL_OPTIONS = ("connect_timeout", "first_token_timeout", "pool_max_connections", "pool_max_keepalive",
+                    "keepalive_expiry")
+
+    DEFAULTS = {
+        "connect_timeout": 5.0,
+        "first_token_timeout": 20.0,
+        "total_timeout": 120.0,
+        "max_retries": 2,
+        "backoff_base": 0.5,
+        "backoff_max": 8.0,
+        "pool_max_connections": 32,
+        "pool_max_keepalive": 16,
+        "keepalive_expiry": 60.0,
+    }
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self.options = {key: config.get(key, default) for key, default in self.DEFAULTS.items()}
+        self.base_url = config.get("base_url") or "https://api.openai.com/v1"
+        self.loop = _EventLoopThread.get_loop()
+        self.retry_budget = self._shared_retry_budget(self.base_url)
+        self.client = AsyncOpenAI(
+            api_key=config["api_key"],
+            base_url=self.base_url,
+            http_client=self._shared_http_client(self.base_url, self.options),
+            max_retries=0,  # 重试由本类控制
+        )
+        self.metrics_lock = threading.Lock()
+        self.usage = UsageTracker()
+        self.last_call_metrics: Dict[str, Any] = {}
+        self.metrics = {
+            'calls': 0,
+            'errors': 0,
+            'retries': 0,
+            'first_token_timeouts': 0,
+            'ttft_total': 0.0,
+            'tokens_total': 0,
+            'stream_seconds_total': 0.0
+        }
+
+    def _validate_config(self) -> None:
+        """验证配置参数"""
+        required_keys = ["api_key", "model"]
+        for key in required_keys:
+            if key not in self.config:
+                raise ValueError(f"Missing required config key: {key}")
+
+    @classmethod
+    def _shared_http_client(cls, base_url: str, options: Dict[str, Any]) -> httpx.AsyncClient:
+        key = (base_url,) + tuple(options[name] for name in cls.POOL_OPTIONS)
+        with cls._shared_lock:
+            client = cls._http_clients.get(key)
+            if client is None:
+                client = httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=options["pool_max_connections"],
+                        max_keepalive_connections=options["pool_max_keepalive"],
+                        keepalive_expiry=options["keepalive_expiry"],
+                    ),
+                    timeout=httpx.Timeout(
+                        connect=options["connect_timeout"],
+                        read=options["first_token_timeout"],
+                        write=options["connect_timeout"],
+                        pool=options["connect_timeout"],
+                    ),
+                )
+                cls._http_clients[key] = client
+            return client
+
+    @classmethod
+    def _shared_retry_budget(cls, base_url: str) -> RetryBudget:
+        with cls._shared_lock:
+            return cls._retry_budgets.setdefault(base_url, RetryBudget())
+
+    def _backoff(self, attempt: int) -> float:
+        """full jitter 指数退避"""
+        cap = min(self.options["backoff_max"], self.options["backoff_base"] * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    # ------------------------------------------------------------------
+    # 原生异步接口
+    # ------------------------------------------------------------------
+
+    async def astream_chat_completion(self, messages: List[Dict[str, str]], **kwargs) -> AsyncIterator[str]:
+        """
+        异步流式聊天完成。首 token 之前的可重试错误会重试，之后的错误直接抛出。
+
+        Yields:
+            str: 流式输出的内容块
+        """
+        params = {
+            "model": self.config["model"],
+            "messages": messages,
+            "temperature": self.config.get("temperature", 0.6),
+            "stream": True,
+            **kwargs
+        }
+        # 请求在最后一个数据块中返回 usage，用于统计前缀缓存命中
+        if self.config.get("include_usage", True) and "stream_options" not in params:
+            # 固定的 openai==1.3.7 的 create() 没有 stream_options 参数，经 extra_body 原样发给提供方
+            params["extra_body"] = dict(params.get("extra_body") or {}, stream_options={"include_usage": True})
+        start = time.monotonic()
+        deadline = start + self.options["total_timeout"]
+        attempt = 0
+        call = {"attempts": 0, "ttft": None, "tokens": 0, "error": None, "usage": None}
+        stream = None
+
+        try:
+            while True:
+                call["attempts"] = attempt + 1
+                try:
+                    first_token_deadline = min(deadline, time.monotonic() + self.options["first_token_timeout"])
+                    stream = await asyncio.wait_for(
+                        self.client.chat.completions.create(**params),
+                        timeout=first_token_deadline - time.monotonic()
+                    )
+                    iterator = stream.__aiter__()
+                    first = await self._next_content(iterator, first_token_deadline, call)
+                    break
+                except asyncio.TimeoutError:
+                    error = FirstTokenTimeout(f"No first token within {self.options['first_token_timeout']}s")
+                    with self.metrics_lock:
+                        self.metrics['first_token_timeouts'] += 1
+                except RETRYABLE_ERRORS as e:
+                    error = e
+                await self._close_stream(stream)
+                stream = None
+                if attempt >= self.options["max_retries"] or not self.retry_budget.withdraw():
+                    raise error
+                delay = self._backoff(attempt)
+                if time.monotonic() + delay >= deadline:
+                    raise error
+                attempt += 1
+                with self.metrics_lock:
+                    self.metrics['retries'] += 1
+                await asyncio.sleep(delay)
+
+            call["ttft"] = time.monotonic() - start
+            if first is not None:
+                call["tokens"] += 1
+                yield first
+                while True:
+                    try:
+                        chunk = await self._next_content(iterator, deadline, call)
+                    except asyncio.TimeoutError:
+                        raise TotalTimeout(f"Completion exceeded {self.options['total_timeout']}s")
+                    if chunk is None:
+                        break
+                    call["tokens"] += 1
+                    yield chunk
+            self.retry_budget.deposit()
+        except Exception as e:
+            call["error"] = repr(e)
+            raise
+        finally:
+            await self._close_stream(stream)
+            self._record_call(call, time.monotonic() - start)
+
+    @staticmethod
+    async def _close_stream(stream):
+        """关闭流式响应，把连接归还连接池"""
+        if stream is None:
+            return
+        try:
+            await stream.response.aclose()
+        except Exception:
+            pass
+
+    async def _next_content(self, iterator, deadline: float, call: Dict[str, Any]) -> Optional[str]:
+        """
+        取下一个非空内容块，流结束返回 None；途经的 usage 记录到 call。
+        只含 role 等无内容的数据块不会延后 deadline，到期抛出 asyncio.TimeoutError。
+        """
+        while True:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                raise asyncio.TimeoutError()
+            try:
+                chunk = await asyncio.wait_for(iterator.__anext__(), timeout=timeout)
+            except StopAsyncIteration:
+                return None
+            usage = chunk_usage(chunk)
+            if usage is not None:
+                call["usage"] = self.usage.record(usage)
+            if chunk.choices:
+                delta = chunk.choices[0].delta
+                if delta and delta.content:
+                    return delta.content
+
+    async def acreate_chat_completion_once(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        """异步非流式调用（内部仍以流式请求以便执行首 token 超时）"""
+        parts = []
+        async for chunk in self.astream_chat_completion(messages, **kwargs):
+            parts.append(chunk)
+        return "".join(parts)
+
+    # ------------------------------------------------------------------
+    # 同步接口（供推理线程使用）
+    # ------------------------------------------------------------------
+
+    def create_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        stream: bool = True,
+        abort_event=None,
+        **kwargs
+    ) -> Iterator[str]:
+        """
+        在共享事件循环上执行流式调用，并把内容块转交给调用线程。
+        abort_event 被设置时取消底层请求，连接随即归还连接池。
+
+        Yields:
+            str: 流式输出的内容块
+        """
+        try:
+            yield from self.stream_chat_completion(messages, abort_event=abort_event, **kwargs)
+        except openai.APIError as e:
+            print(f"An API error occurred: {e}")
+            yield "Sorry, there was an error with the service."
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+            yield "An unexpected error occurred."
+
+    def stream_chat_completion(self, messages: List[Dict[str, str]], abort_event=None, **kwargs) -> Iterator[str]:
+        """同 create_chat_completion，但重试耗尽后的错误以异常抛出"""
+        chunks: "queue.Queue" = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for chunk in self.astream_chat_completion(messages, **kwargs):
+                    chunks.put(chunk)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                chunks.put(e)
+            finally:
+                chunks.put(done)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                if abort_event and abort_event.is_set():
+                    print("\n[Stream aborted by user]")
+                    break
+                try:
+                    item = chunks.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+    def create_chat_completion_once(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        """同步非流式调用，重试耗尽后抛出异常"""
+        future = asyncio.run_coroutine_threadsafe(self.acreate_chat_completion_once(messages, **kwargs), self.loop)
+        return future.result()
+
+    # ------------------------------------------------------------------
+    # 指标
+    # ------------------------------------------------------------------
+
+    def _record_call(self, call: Dict[str, Any], elapsed: float):
+        ttft = call["ttft"]
+        stream_seconds = elapsed - ttft if ttft is not None else 0.0
+        call["total"] = round(elapsed, 3)
+        call["ttft"] = round(ttft, 3) if ttft is not None else None
+        # 近似：一个流式增量约等于一个 token
+        call["tokens_per_sec"] = round(call["tokens"] / stream_seconds, 1) if stream_seconds > 0 else None
+        with self.metrics_lock:
+            self.last_call_metrics = call
+            self.metrics['calls'] += 1
+            if call["error"]:
+                self.metrics['errors'] += 1
+            if ttft is not None:
+                self.metrics['ttft_total'] += ttft
+                self.metrics['tokens_total'] += call["tokens"]
+                self.metrics['stream_seconds_total'] += stream_seconds
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self.metrics_lock:
+            metrics = self.metrics.copy()
+            succeeded = metrics['calls'] - metrics['errors']
+            return {
+                'calls': metrics['calls'],
+                'errors': metrics['errors'],
+                'retries': metrics['retries'],
+                'first_token_timeouts': metrics['first_token_timeouts'],
+                'avg_ttft': round(metrics['ttft_total'] / succeeded, 3) if succeeded > 0 else None,
+                'tokens_per_sec': round(metrics['tokens_total'] / metrics['stream_seconds_total'], 1)
+                if metrics['stream_seconds_total'] > 0 else None,
+                'usage': self.usage.get_stats(),
+                'last_call': dict(self.last_call_metrics)
+            }
+
+    def get_model_name(self) -> str:
+        """获取模型名称"""
+        return self.config["model"]
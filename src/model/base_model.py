@@ -45,6 +45,13 @@ class BaseModel(ABC):
         """
         pass
 
+    def stream_chat_completion(self, messages: List[Dict[str, str]], abort_event=None, **kwargs) -> Iterator[str]:
+        """
+        流式聊天完成，错误以异常抛出而不是转换为提示文本，供 RoutingModel 判断失败并切换提供方。
+        默认退化为 create_chat_completion。
+        """
+        return self.create_chat_completion(messages, stream=True, abort_event=abort_event, **kwargs)
+
     @abstractmethod
     def create_chat_completion_once(self, messages: List[Dict[str, str]], **kwargs) -> str:
         """
@@ -57,6 +64,10 @@ class BaseModel(ABC):
         """获取模型名称"""
         pass
     
+    def get_metrics(self) -> Dict[str, Any]:
+        """获取调用指标（TTFT、吞吐等），不支持的模型返回空字典"""
+        return {}
+    
     def get_config(self) -> Dict[str, Any]:
         """获取模型配置"""
         return self.config.copy()
@@ -6,6 +6,8 @@
 from typing import Dict, Any, Type
 from .base_model import BaseModel
 from .openai_model import OpenAIModel
+from .async_openai_model import AsyncOpenAIModel
+from .routing_model import RoutingModel
 
 
 class ModelFactory:
@@ -15,6 +17,8 @@ class ModelFactory:
     _model_types: Dict[str, Type[BaseModel]] = {
         "openai": OpenAIModel,
         "openai_compatible": OpenAIModel,  # 别名
+        "openai_async": AsyncOpenAIModel,  # 连接池 + 超时 + 重试
+        "routing": RoutingModel,  # 多提供方对冲 / 回退
     }
     
     @classmethod
@@ -23,7 +27,7 @@ class ModelFactory:
         创建模型实例
         
         Args:
-            model_type: 模型类型 ("openai", "openai_compatible" 等)
+            model_type: 模型类型 ("openai", "openai_compatible", "openai_async" 等)
             config: 模型配置
             
         Returns:
@@ -57,17 +61,26 @@ class ModelFactory:
         return list(cls._model_types.keys())
     
     @classmethod
-    def create_from_settings(cls, settings_instance) -> BaseModel:
+    def create_from_settings(cls, settings_instance, config_name: str = None) -> BaseModel:
         """
         从设置实例创建模型
         
         Args:
             settings_instance: 设置实例
+            config_name: config.json 中的配置名，默认为当前配置
             
         Returns:
             BaseModel: 模型实例
         """
-        ai_config = settings_instance.get_ai_config()
-        model_type = settings_instance.get_ai_model_type()
+        ai_config = settings_instance.get_ai_config(config_name)
+        model_type = settings_instance.get_ai_model_type(config_name)
+        if model_type == "routing":
+            # providers 中的每个配置各自创建一个模型，不允许嵌套路由
+            backends = {}
+            for provider in ai_config.get("providers") or []:
+                if settings_instance.get_ai_model_type(provider) == "routing":
+                    raise ValueError(f"Routing provider '{provider}' cannot itself be a routing config")
+                backends[provider] = cls.create_from_settings(settings_instance, provider)
+            ai_config["backends"] = backends
         
         return cls.create_model(model_type, ai_config)
@@ -8,6 +8,7 @@ import openai
 from openai import OpenAI
 
 from .base_model import BaseModel
+from .usage import UsageTracker, chunk_usage
 
 
 class OpenAIModel(BaseModel):
@@ -19,6 +20,7 @@ class OpenAIModel(BaseModel):
             api_key=config["api_key"],
             base_url=config.get("base_url"),
         )
+        self.usage = UsageTracker()
     
     def _validate_config(self) -> None:
         """验证OpenAI配置参数"""
@@ -47,28 +49,7 @@ class OpenAIModel(BaseModel):
             str: 流式输出的内容块
         """
         try:
-            # 合并配置参数
-            params = {
-                "model": self.config["model"],
-                "messages": messages,
-                "temperature": self.config.get("temperature", 0.6),
-                "stream": stream,
-                **kwargs
-            }
-            
-            if stream:
-                stream_response = self.client.chat.completions.create(**params)
-                
-                for chunk in stream_response:
-                    # 检查中止事件
-                    if abort_event and abort_event.is_set():
-                        print("\n[Stream aborted by user]")
-                        break
-                    
-                    delta = chunk.choices[0].delta
-                    if delta and delta.content:
-                        yield delta.content
-                
+            yield from self.stream_chat_completion(messages, stream=stream, abort_event=abort_event, **kwargs)
         except openai.APIError as e:
             print(f"An API error occurred: {e}")
             yield "Sorry, there was an error with the service."
@@ -77,6 +58,45 @@ class OpenAIModel(BaseModel):
             yield "An unexpected error occurred."
 
 
+    def stream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        stream: bool = True,
+        abort_event=None,
+        **kwargs
+    ) -> Iterator[str]:
+        """同 create_chat_completion，但错误以异常抛出"""
+        # 合并配置参数
+        params = {
+            "model": self.config["model"],
+            "messages": messages,
+            "temperature": self.config.get("temperature", 0.6),
+            "stream": stream,
+            **kwargs
+        }
+        # 请求在最后一个数据块中返回 usage，用于统计前缀缓存命中
+        if stream and self.config.get("include_usage", True) and "stream_options" not in params:
+            # 固定的 openai==1.3.7 的 create() 没有 stream_options 参数，经 extra_body 原样发给提供方
+            params["extra_body"] = dict(params.get("extra_body") or {}, stream_options={"include_usage": True})
+        
+        if stream:
+            stream_response = self.client.chat.completions.create(**params)
+            
+            for chunk in stream_response:
+                # 检查中止事件
+                if abort_event and abort_event.is_set():
+                    print("\n[Stream aborted by user]")
+                    break
+                
+                usage = chunk_usage(chunk)
+                if usage is not None:
+                    self.usage.record(usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta and delta.content:
+                    yield delta.content
+
     def create_chat_completion_once(self, messages: List[Dict[str, str]], **kwargs) -> str:
         """
         创建OpenAI聊天完成
@@ -89,8 +109,13 @@ class OpenAIModel(BaseModel):
             **kwargs
         }
         response = self.client.chat.completions.create(**params)
+        self.usage.record(response.usage)
         return response.choices[0].message.content
     
+    def get_metrics(self) -> Dict[str, Any]:
+        """提示词 token 用量与缓存命中"""
+        return {'usage': self.usage.get_stats()}
+
     def get_model_name(self) -> str:
         """获取模型名称"""
         return self.config["model"]
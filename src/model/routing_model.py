@@ -0,0 +1,277 @@
+"""
+多提供方路由模型
+把一次调用路由到 config.json 中配置的多个提供方（如 qwen-plus、k2）：
+- 按滚动评分（首 token 时间和错误率的指数加权平均）选择最快且健康的提供方
+- 对冲：hedge_after 秒内没有收到首 token 时，再向下一个提供方发同样的请求，先出首 token 的获胜，
+  其余请求随即取消；hedge_after 为 0 时同时向 max_parallel 个提供方竞速，为 null 时不对冲
+- 回退：提供方在首 token 之前出错时立即改用下一个提供方
+这样一轮推理的尾延迟取决于最快的健康提供方，而不是单个提供方的最差情况。
+
+配置示例（providers 中的名字是 config.json 中的其它配置）：
+    "routing": {"model_type": "routing", "providers": ["qwen-plus", "k2"], "hedge_after": 2.0}
+"""
+
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import openai
+
+from .base_model import BaseModel
+
+
+class ProviderScore:
+    """单个提供方的滚动评分"""
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.ttft: Optional[float] = None  # 首 token 时间的 EWMA（秒）
+        # 被取消的请求已等待时间的最大值，是首 token 时间的下界（删失样本），只在还没有真实样本时参与评分
+        self.ttft_lower_bound: Optional[float] = None
+        self.error_rate = 0.0  # 错误率的 EWMA
+        self.counters = {'calls': 0, 'errors': 0, 'wins': 0, 'hedged': 0, 'cancelled': 0}
+
+    def observe_ttft(self, ttft: float):
+        self.ttft = ttft if self.ttft is None else self.alpha * ttft + (1 - self.alpha) * self.ttft
+
+    def success(self, ttft: float):
+        self.observe_ttft(ttft)
+        self.success_no_ttft()
+
+    def success_no_ttft(self):
+        """没有首 token 时间的成功调用（非流式），只更新错误率"""
+        self.error_rate *= 1 - self.alpha
+
+    def cancelled(self, waited: float):
+        """请求在首 token 之前被取消；已等待的时间只是首 token 时间的下界，不进入 EWMA"""
+        self.counters['cancelled'] += 1
+        if self.ttft is None:
+            self.ttft_lower_bound = max(self.ttft_lower_bound or 0.0, waited)
+
+    def failure(self):
+        self.error_rate = self.alpha + (1 - self.alpha) * self.error_rate
+        self.counters['errors'] += 1
+
+    def score(self, error_penalty: float) -> float:
+        """越小越好；没有任何样本的提供方按 0 计，保证先被试用"""
+        ttft = self.ttft if self.ttft is not None else self.ttft_lower_bound
+        return (ttft or 0.0) + self.error_rate * error_penalty
+
+    def to_dict(self, error_penalty: float) -> Dict[str, Any]:
+        result = dict(self.counters)
+        result.update({
+            'ttft_ewma': round(self.ttft, 3) if self.ttft is not None else None,
+            'ttft_lower_bound': round(self.ttft_lower_bound, 3) if self.ttft_lower_bound is not None else None,
+            'error_rate': round(self.error_rate, 3),
+            'score': round(self.score(error_penalty), 3)
+        })
+        return result
+
+
+class RoutingModel(BaseModel):
+    """
+    backends 由 ModelFactory 按 providers 中的配置名创建，键为配置名。
+    各提供方的请求在各自的线程中执行，内容块经一个队列汇总。
+    """
+
+    DEFAULTS = {
+        "hedge_after": 2.0,  # 秒；0 表示竞速，None 表示只回退不对冲
+        "max_parallel": 2,  # 同一次调用最多同时进行的请求数
+        "ewma_alpha": 0.3,
+        "error_penalty": 10.0,  # 错误率为 1 时评分增加的秒数
+    }
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self.options = {key: config.get(key, default) for key, default in self.DEFAULTS.items()}
+        self.backends: Dict[str, BaseModel] = dict(config["backends"])
+        self.lock = threading.Lock()
+        self.scores = {name: ProviderScore(self.options["ewma_alpha"]) for name in self.backends}
+        self.metrics = {
+            'calls': 0,
+            'errors': 0,
+            'hedged_calls': 0,
+            'fallbacks': 0
+        }
+
+    def _validate_config(self) -> None:
+        """验证配置参数"""
+        if not self.config.get("providers"):
+            raise ValueError("Missing required config key: providers")
+        if not self.config.get("backends"):
+            raise ValueError("Routing model requires backends created from providers")
+
+    def ranked(self) -> List[str]:
+        """按评分从好到差排列的提供方；同分时保持配置顺序"""
+        with self.lock:
+            order = {name: index for index, name in enumerate(self.backends)}
+            return sorted(self.backends, key=lambda name: (
+                self.scores[name].score(self.options["error_penalty"]), order[name]))
+
+    def stream_chat_completion(self, messages: List[Dict[str, str]], abort_event=None, **kwargs) -> Iterator[str]:
+        """
+        对冲 / 回退的流式调用；所有提供方都在首 token 之前失败时抛出最后一个错误。
+        获胜的提供方在输出中途出错时直接抛出，不再切换（已经输出的内容无法撤回）。
+        """
+        candidates = self.ranked()
+        hedge_after = self.options["hedge_after"]
+        max_parallel = max(1, int(self.options["max_parallel"]))
+        events: "queue.Queue" = queue.Queue()
+        running: Dict[str, threading.Event] = {}
+        started: Dict[str, float] = {}
+        start = time.monotonic()
+        winner = None
+        with self.lock:
+            self.metrics['calls'] += 1
+
+        def launch(name: str):
+            stop = threading.Event()
+            running[name] = stop
+            started[name] = time.monotonic()
+            with self.lock:
+                self.scores[name].counters['calls'] += 1
+            threading.Thread(target=self._pump, args=(name, messages, stop, events, kwargs), daemon=True).start()
+
+        def stop_others(keep: Optional[str]):
+            now = time.monotonic()
+            for name, stop in running.items():
+                if name != keep:
+                    stop.set()
+                    with self.lock:
+                        self.scores[name].cancelled(now - started[name])
+
+        launch(candidates.pop(0))
+        if hedge_after == 0:
+            while candidates and len(running) < max_parallel:
+                launch(candidates.pop(0))
+        hedge_at = None if hedge_after is None else start + hedge_after
+        try:
+            while True:
+                if abort_event is not None and abort_event.is_set():
+                    print("\n[Stream aborted by user]")
+                    return
+                try:
+                    name, kind, payload = events.get(timeout=0.05)
+                except queue.Empty:
+                    # 首 token 超过对冲阈值仍未到达：向下一个提供方发出同样的请求
+                    if winner is None and hedge_at is not None and time.monotonic() >= hedge_at \
+                            and candidates and len(running) < max_parallel:
+                        hedged = candidates.pop(0)
+                        launch(hedged)
+                        hedge_at = time.monotonic() + hedge_after
+                        with self.lock:
+                            self.metrics['hedged_calls'] += 1
+                            self.scores[hedged].counters['hedged'] += 1
+                    continue
+                if name not in running or (winner is not None and name != winner):
+                    continue  # 已取消的请求的剩余输出
+                if kind == "chunk":
+                    if winner is None:
+                        winner = name
+                        stop_others(winner)
+                        with self.lock:
+                            self.scores[name].success(time.monotonic() - started[name])
+                            self.scores[name].counters['wins'] += 1
+                    yield payload
+                elif kind == "done":
+                    if winner is None:
+                        # 没有任何内容的正常结束也算获胜
+                        stop_others(name)
+                        with self.lock:
+                            self.scores[name].success(time.monotonic() - started[name])
+                            self.scores[name].counters['wins'] += 1
+                    return
+                else:
+                    del running[name]
+                    with self.lock:
+                        self.scores[name].failure()
+                    if winner == name:
+                        raise payload
+                    # 出错的请求腾出了并行名额，立即改用下一个提供方，不必等其余请求结束
+                    if not candidates:
+                        if not running:
+                            raise payload
+                    elif len(running) < max_parallel:
+                        launch(candidates.pop(0))
+                        hedge_at = None if hedge_after is None else time.monotonic() + hedge_after
+                        with self.lock:
+                            self.metrics['fallbacks'] += 1
+        except Exception:
+            with self.lock:
+                self.metrics['errors'] += 1
+            raise
+        finally:
+            for stop in running.values():
+                stop.set()
+
+    def _pump(self, name: str, messages, stop: threading.Event, events: "queue.Queue", kwargs: Dict[str, Any]):
+        """在后台线程中执行单个提供方的请求"""
+        try:
+            for chunk in self.backends[name].stream_chat_completion(messages, abort_event=stop, **kwargs):
+                if stop.is_set():
+                    return
+                events.put((name, "chunk", chunk))
+            events.put((name, "done", None))
+        except Exception as e:
+            events.put((name, "error", e))
+
+    def create_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        stream: bool = True,
+        abort_event=None,
+        **kwargs
+    ) -> Iterator[str]:
+        """
+        路由后的流式聊天完成，错误转换为提示文本（与其它模型一致）
+
+        Yields:
+            str: 流式输出的内容块
+        """
+        try:
+            yield from self.stream_chat_completion(messages, abort_event=abort_event, **kwargs)
+        except openai.APIError as e:
+            print(f"An API error occurred: {e}")
+            yield "Sorry, there was an error with the service."
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+            yield "An unexpected error occurred."
+
+    def create_chat_completion_once(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        """非流式调用（总结等后台任务）：按评分依次尝试，不对冲"""
+        last_error: Optional[Exception] = None
+        with self.lock:
+            self.metrics['calls'] += 1
+        for name in self.ranked():
+            with self.lock:
+                self.scores[name].counters['calls'] += 1
+            try:
+                result = self.backends[name].create_chat_completion_once(messages, **kwargs)
+            except Exception as e:
+                last_error = e
+                with self.lock:
+                    self.scores[name].failure()
+                    self.metrics['fallbacks'] += 1
+                continue
+            with self.lock:
+                self.scores[name].success_no_ttft()
+                self.scores[name].counters['wins'] += 1
+            return result
+        with self.lock:
+            self.metrics['errors'] += 1
+        raise last_error
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            metrics = dict(self.metrics)
+            metrics['options'] = dict(self.options)
+            metrics['providers'] = {name: score.to_dict(self.options["error_penalty"])
+                                    for name, score in self.scores.items()}
+        for name, backend in self.backends.items():
+            metrics['providers'][name]['backend'] = backend.get_metrics()
+        return metrics
+
+    def get_model_name(self) -> str:
+        """获取模型名称"""
+        return "routing(" + ", ".join(backend.get_model_name() for backend in self.backends.values()) + ")"
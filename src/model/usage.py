@@ -0,0 +1,76 @@
+"""
+提示词 token 用量与前缀缓存命中统计
+从提供方返回的 usage 字段读取每次调用的提示词 token 数和命中缓存的部分：
+OpenAI / 通义千问在 usage.prompt_tokens_details.cached_tokens，Moonshot (kimi) 在 usage.cached_tokens。
+流式调用需要在请求体中加上 stream_options={"include_usage": True}（经 extra_body 发送），用量在最后一个数据块中返回
+（Moonshot 放在最后一个 choice 的 usage 中）。
+"""
+
+import threading
+from typing import Any, Dict, Optional
+
+
+def _field(obj: Any, name: str) -> Any:
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def extract_usage(usage: Any) -> Optional[Dict[str, int]]:
+    """把 SDK 的 usage 对象（或字典）转换为 {prompt_tokens, cached_tokens, completion_tokens}"""
+    prompt_tokens = _field(usage, "prompt_tokens")
+    if prompt_tokens is None:
+        return None
+    cached = _field(_field(usage, "prompt_tokens_details"), "cached_tokens")
+    if cached is None:
+        cached = _field(usage, "cached_tokens")
+    return {
+        "prompt_tokens": int(prompt_tokens),
+        "cached_tokens": int(cached or 0),
+        "completion_tokens": int(_field(usage, "completion_tokens") or 0)
+    }
+
+
+def chunk_usage(chunk: Any) -> Any:
+    """流式数据块中的 usage（没有时返回 None）"""
+    usage = _field(chunk, "usage")
+    if usage is None and _field(chunk, "choices"):
+        usage = _field(chunk.choices[0], "usage")
+    return usage
+
+
+class UsageTracker:
+    """按调用累计提示词 token、缓存命中 token 和生成 token"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {
+            "calls_with_usage": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "completion_tokens": 0
+        }
+        self.last_call: Dict[str, Any] = {}
+
+    def record(self, usage: Any) -> Optional[Dict[str, int]]:
+        """记录一次调用的 usage，返回解析结果；提供方没有返回用量时返回 None"""
+        parsed = extract_usage(usage)
+        if parsed is None:
+            return None
+        with self.lock:
+            self.totals["calls_with_usage"] += 1
+            for key, value in parsed.items():
+                self.totals[key] += value
+            self.last_call = dict(parsed, uncached_tokens=parsed["prompt_tokens"] - parsed["cached_tokens"])
+        return parsed
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = dict(self.totals)
+            stats["uncached_tokens"] = stats["prompt_tokens"] - stats["cached_tokens"]
+            stats["cache_hit_ratio"] = round(stats["cached_tokens"] / stats["prompt_tokens"], 3) \
+                if stats["prompt_tokens"] else None
+            stats["last_call"] = dict(self.last_call)
+            return stats
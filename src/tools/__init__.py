@@ -3,7 +3,17 @@ Tools module for DST Agent Brain
 Contains tool execution and parsing logic
 """
 
-from .tool_executor import ToolExecutor, parse_action_str
-from .parse_tool import parse_assistant_message
+from .tool_executor import ToolExecutor
+from .parse_tool import parse_assistant_message, StreamingToolParser, ALLOWED_TOOLS, READ_ONLY_TOOLS, SNAPSHOT_TOOLS
+from .crafting_planner import CraftingPlanner, get_crafting_planner
+from .recipe_index import RecipeIndex, get_recipe_index
+from .craft_feasibility import FeasibilityMatrix, get_feasibility_matrix
+from .name_resolver import NameResolver, get_recipe_resolver, get_prefab_resolver, resolve_in
+from .action_parser import ParsedAction, ActionError, ActionParseError, parse_action, action_wfn
+from .action_validator import ActionValidator
 
-__all__ = ['ToolExecutor', 'parse_action_str', 'parse_assistant_message'] 
\ No newline at end of file
+__all__ = ['ToolExecutor', 'parse_assistant_message', 'StreamingToolParser',
+           'ALLOWED_TOOLS', 'READ_ONLY_TOOLS', 'SNAPSHOT_TOOLS', 'CraftingPlanner', 'get_crafting_planner',
+           'RecipeIndex', 'get_recipe_index', 'FeasibilityMatrix', 'get_feasibility_matrix',
+           'NameResolver', 'get_recipe_resolver', 'get_prefab_resolver', 'resolve_in', 'ActionValidator', 'ActionError',
+           'ParsedAction', 'ActionParseError', 'parse_action', 'action_wfn'] 
\ No newline at end of file
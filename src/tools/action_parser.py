@@ -0,0 +1,157 @@
+"""
+动作字符串解析
+文法：Action(TYPE, invobject, posx, posz, recipe) = target
+规范写法由一个预编译正则一次匹配；其余情况用宽松正则切出参数，再逐个字段校验，
+接受模型常见的写法变体：多余空格、小写动作名、带引号的名字、缺省的 "= -"、空字段（视为 -）。
+解析失败时抛出 ActionParseError，指明出错的字段。
+"""
+
+import itertools
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+# 规范写法的快速路径：一次匹配即完成全部字段校验
+CANONICAL_PATTERN = re.compile(r"Action\(([A-Z_]+), (\d+|-), (-?\d+(?:\.\d+)?|-), (-?\d+(?:\.\d+)?|-), "
+                               r"([^\s,()\"'`“”‘’](?:[^,()\"'`“”‘’]*[^\s,()\"'`“”‘’])?)\) = (\d+|-)")
+ACTION_PATTERN = re.compile(r"^\s*`*\s*action\s*\((?P<args>.*)\)\s*(?:=\s*(?P<target>.*?))?\s*`*\s*$",
+                            re.IGNORECASE | re.DOTALL)
+ACTION_TYPE_PATTERN = re.compile(r"^[A-Z_]+$")
+GUID_PATTERN = re.compile(r"^\d+$")
+NUMBER_PATTERN = re.compile(r"^[+-]?(\d+(\.\d*)?|\.\d+)$")
+QUOTES = "\"'`“”‘’"
+ARGUMENT_FIELDS = ("action", "invobject", "posx", "posz", "recipe")
+WFN_FORMAT = "Action({}, {}, {}, {}, {}) = {}"
+
+# 进程内单调递增的动作编号，不会像截断的 uuid4 那样碰撞
+_auid_counter = itertools.count(1)
+
+
+def next_auid() -> str:
+    return str(next(_auid_counter))
+
+
+class ActionError(Exception):
+    """动作参数错误：field 为出错的参数 (action / invobject / posx / posz / recipe / target)"""
+
+    def __init__(self, field: str, value: Any, message: str, suggestions: Optional[list] = None):
+        super().__init__(message)
+        self.field = field
+        self.value = value
+        self.message = message
+        self.suggestions = suggestions
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {"field": self.field, "value": self.value, "error": self.message}
+        if self.suggestions:
+            result["did_you_mean"] = self.suggestions
+        return result
+
+
+class ActionParseError(ActionError):
+    """动作字符串不符合文法"""
+
+
+@dataclass
+class ParsedAction:
+    action: str
+    invobject: str = "-"
+    posx: str = "-"
+    posz: str = "-"
+    recipe: str = "-"
+    target: str = "-"
+    auid: str = field(default_factory=next_auid)
+
+    @property
+    def wfn(self) -> str:
+        """规范化后的动作字符串，游戏在 Action-End / Action-Failed 事件中原样返回"""
+        return WFN_FORMAT.format(self.action, self.invobject, self.posx, self.posz, self.recipe, self.target)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """动作队列和 mod 使用的字典格式"""
+        wfn = self.wfn
+        return {
+            "Type": "Action",
+            "Action": self.action,
+            "InvObject": self.invobject,
+            "Recipe": self.recipe,
+            "Name": wfn,
+            "PosX": self.posx,
+            "Target": self.target,
+            "PosZ": self.posz,
+            "WFN": wfn,
+            "AUID": self.auid
+        }
+
+
+def action_wfn(action: Dict[str, Any]) -> str:
+    """由动作字典的字段重新生成 WFN（字段被改写之后调用）"""
+    return WFN_FORMAT.format(action["Action"], action["InvObject"], action["PosX"], action["PosZ"],
+                             action["Recipe"], action["Target"])
+
+
+def _clean(value: str) -> str:
+    value = value.strip().strip(QUOTES).strip()
+    return value or "-"
+
+
+def parse_action(action_str: str) -> ParsedAction:
+    """解析动作字符串，失败时抛出 ActionParseError"""
+    match = CANONICAL_PATTERN.fullmatch(action_str.strip()) if action_str else None
+    if match is not None:
+        return ParsedAction(*match.groups())
+    match = ACTION_PATTERN.match(action_str or "")
+    if match is None:
+        raise ActionParseError("action", (action_str or "").strip(),
+                               "Expected Action(TYPE, invobject, posx, posz, recipe) = target.")
+    args = match.group("args").split(",")
+    if len(args) != len(ARGUMENT_FIELDS):
+        raise ActionParseError("action", match.group("args").strip(),
+                               "Expected 5 comma-separated arguments (TYPE, invobject, posx, posz, recipe), got {}. "
+                               "Use - for the ones that are not needed.".format(len(args)))
+    action, invobject, posx, posz, recipe = (_clean(arg) for arg in args)
+    target = _clean(match.group("target") or "")
+
+    action = action.upper()
+    if not ACTION_TYPE_PATTERN.match(action):
+        raise ActionParseError("action", action, "The action type must be a word in capital letters, e.g. CHOP.")
+    for name, value in (("invobject", invobject), ("target", target)):
+        if value != "-" and not GUID_PATTERN.match(value):
+            raise ActionParseError(name, value, "{} must be a numeric GUID or -.".format(name))
+    for name, value in (("posx", posx), ("posz", posz)):
+        if value != "-" and not NUMBER_PATTERN.match(value):
+            raise ActionParseError(name, value, "{} must be a number or -.".format(name))
+    return ParsedAction(action, invobject, posx, posz, recipe, target)
+
+
+if __name__ == "__main__":
+    import time
+    import uuid
+
+    samples = ["Action(CHOP, -, -, -, -) = 116312", "Action(BUILD, -, 262, 100, homesign) = -",
+               "action( pick , -, -, -, - )= 127823", 'Action(BUILD, -, -, -, "axe")', "Action(EAT, -, -, -) = 1",
+               "Action(PATHFIND, -, 10.5, north, -) = -", "Action(CHOP, -, -, -, -) = tree"]
+    for sample in samples:
+        try:
+            print(f"{sample!r} -> {parse_action(sample).wfn}")
+        except ActionParseError as e:
+            print(f"{sample!r} -> {e.to_dict()}")
+
+    def legacy(action_str):
+        action_match = re.match(r'Action\(([^,]+),\s*(\d+|-),\s*([^,]+),\s*([^,]+),\s*([^,]+)\)\s*=\s*(\d+|-)', action_str)
+        if action_match:
+            return action_match.groups(), str(uuid.uuid4())[:4]
+
+    rounds = 20000
+    valid = samples[:2]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for sample in valid:
+            legacy(sample)
+    legacy_us = (time.perf_counter() - start) / rounds / len(valid) * 1e6
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for sample in valid:
+            parse_action(sample).to_dict()
+    parsed_us = (time.perf_counter() - start) / rounds / len(valid) * 1e6
+    print(f"legacy regex + uuid4: {legacy_us:.1f} µs, parse_action + to_dict: {parsed_us:.1f} µs")
@@ -0,0 +1,135 @@
+"""
+do 动作的入队前校验
+对照当前感知和配方数据检查动作参数：目标 GUID 是否在视野 / 物品栏中、坐标是否合法、
+BUILD 的配方是否存在且原料足够。校验失败时立即返回结构化错误给模型，
+不必等游戏执行失败后几秒才回来的 Action-Failed 事件。
+"""
+
+import json
+import math
+from typing import Any, Dict, Iterable, Optional
+
+from ..config.settings import settings
+from .action_parser import ActionError, action_wfn
+from .craft_feasibility import get_feasibility_matrix
+from .name_resolver import get_recipe_resolver, resolve_recipe_name
+
+# 各动作必须给出的参数（参见系统提示词中的动作表）
+TARGET_ACTIONS = {"PICK", "PICKUP", "CHOP", "MINE", "ATTACK", "HAMMER", "DIG", "EAT", "HARVEST", "SLEEPIN",
+                  "STORE", "TURNOFF", "TURNON", "UNEQUIP", "UPGRADE", "WALKTO"}
+INVOBJECT_ACTIONS = {"DROP", "EQUIP", "STORE", "UPGRADE"}
+POSITION_ACTIONS = {"PATHFIND"}
+# 目标可以是自己身上的物品（物品栏、装备栏、背包）的动作
+INVENTORY_TARGET_ACTIONS = {"EAT", "UNEQUIP"}
+
+POSSESSION_SLOTS = ("ItemSlots", "EquipSlots", "Backpack")
+
+
+def iter_possessions(perception: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+    """遍历物品栏、装备栏和背包中的物品（槽位可能是列表或 {槽位: 物品} 字典）"""
+    possessions = perception.get("Possessions") or {}
+    for slots in POSSESSION_SLOTS:
+        items = possessions.get(slots) or []
+        if isinstance(items, dict):
+            items = items.values()
+        for item in items:
+            if item:
+                yield item
+
+
+def _coordinate(value: str) -> Optional[float]:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+class ActionValidator:
+    """
+    校验只拒绝可以确定会失败的动作：未列出的动作类型和未知配方（可能来自 mod）都放行交给游戏判断。
+    科技等级不检查，已学会的配方在任何地方都能制作。
+    """
+
+    def __init__(self, max_coordinate: Optional[float] = None):
+        self.max_coordinate = settings.ACTION_MAX_COORDINATE if max_coordinate is None else max_coordinate
+
+    def validate(self, action_obj: Dict[str, Any], perception: Dict[str, Any], spatial_index,
+                 self_uid: Any = None) -> Optional[ActionError]:
+        """
+        校验并就地规范化动作（BUILD 的配方名改写为标准配方名）。
+
+        Returns:
+            第一个发现的错误，没有问题时返回 None
+        """
+        action = action_obj.get("Action")
+        try:
+            self._check_position(action, action_obj.get("PosX", "-"), action_obj.get("PosZ", "-"))
+            if action in INVOBJECT_ACTIONS:
+                self._check_invobject(action_obj.get("InvObject", "-"), perception)
+            if action in TARGET_ACTIONS:
+                self._check_target(action, action_obj.get("Target", "-"), perception, spatial_index, self_uid)
+            if action == "BUILD":
+                self._check_recipe(action_obj, perception)
+        except ActionError as error:
+            return error
+        return None
+
+    def _check_position(self, action: str, posx: str, posz: str):
+        given = [value.strip() != "-" for value in (posx, posz)]
+        if action in POSITION_ACTIONS and not all(given):
+            raise ActionError("posx" if not given[0] else "posz", "-", "{} requires both x and z coordinates.".format(action))
+        if any(given) and not all(given):
+            raise ActionError("posx" if not given[0] else "posz", "-", "x and z must be given together.")
+        for field, value, present in (("posx", posx, given[0]), ("posz", posz, given[1])):
+            if not present:
+                continue
+            number = _coordinate(value)
+            if number is None:
+                raise ActionError(field, value, "The coordinate must be a number.")
+            if abs(number) > self.max_coordinate:
+                raise ActionError(field, value, "The coordinate is outside the world (|{}| > {:g}).".format(
+                    field[-1], self.max_coordinate))
+
+    @staticmethod
+    def _check_invobject(guid: str, perception: Dict[str, Any]):
+        if guid == "-":
+            raise ActionError("invobject", guid, "This action requires the GUID of an item in your inventory.")
+        if not any(str(item.get("GUID")) == guid for item in iter_possessions(perception)):
+            raise ActionError("invobject", guid, "No item with this GUID in your inventory, equipslots or backpack.")
+
+    @staticmethod
+    def _check_target(action: str, guid: str, perception: Dict[str, Any], spatial_index, self_uid: Any):
+        if guid == "-":
+            raise ActionError("target", guid, "{} requires the GUID of its target.".format(action))
+        if spatial_index.entity(guid) is not None or (self_uid is not None and str(self_uid) == guid):
+            return
+        if action in INVENTORY_TARGET_ACTIONS and any(str(item.get("GUID")) == guid for item in iter_possessions(perception)):
+            return
+        where = "your surroundings or inventory" if action in INVENTORY_TARGET_ACTIONS else "your surroundings"
+        raise ActionError("target", guid, "No entity with this GUID in {}; it may be out of sight.".format(where))
+
+    @staticmethod
+    def _check_recipe(action_obj: Dict[str, Any], perception: Dict[str, Any]):
+        recipe_name = action_obj.get("Recipe", "-").strip()
+        if recipe_name == "-":
+            raise ActionError("recipe", recipe_name, "BUILD requires the name of a recipe.")
+        name = resolve_recipe_name(recipe_name)
+        if name is None:
+            suggestions = get_recipe_resolver().suggest(recipe_name)
+            if suggestions:
+                raise ActionError("recipe", recipe_name, "Recipe not found.", suggestions)
+            return
+        # mod 按 Recipe 字段查找配方，改写为标准配方名；WFN 随之更新，
+        # 队列去重和账本匹配 Action-End / Action-Failed 事件时 "axe" 与 "Axe" 是同一个动作
+        if action_obj["Recipe"] != name:
+            action_obj["Recipe"] = name
+            action_obj["Name"] = action_obj["WFN"] = action_wfn(action_obj)
+        counts: Dict[str, int] = {}
+        for item in iter_possessions(perception):
+            if item.get("Prefab"):
+                counts[item["Prefab"]] = counts.get(item["Prefab"], 0) + item.get("Quantity", 1)
+        missing = get_feasibility_matrix().missing(name, counts)
+        if missing:
+            raise ActionError("recipe", name, "Missing ingredients: {}. Use plan_craft to see how to get them.".format(
+                json.dumps(missing, sort_keys=True)))
@@ -0,0 +1,150 @@
+"""
+"现在能做什么"的向量化可行性查询
+把配方数据构建为 配方 × 原料 的数量矩阵和 配方 × 科技 的等级矩阵，
+对当前物品栏的可行性判断就是一次 NumPy 广播比较。
+"""
+
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .recipe_index import RecipeIndex, get_recipe_index
+
+# 制作站提供的科技等级；站在其 PROTOTYPER_RADIUS 范围内才生效
+PROTOTYPER_TECH = {
+    "researchlab": {"SCIENCE": 1},
+    "researchlab2": {"SCIENCE": 2},
+    "researchlab4": {"MAGIC": 1},
+    "researchlab3": {"MAGIC": 2},
+    "ancient_altar_broken": {"ANCIENT": 2},
+    "ancient_altar": {"ANCIENT": 4},
+    "cartographydesk": {"CARTOGRAPHY": 2},
+    "seafaring_prototyper": {"SEAFARING": 2},
+    "carpentry_station": {"CARPENTRY": 2},
+}
+PROTOTYPER_RADIUS = 4.0
+
+
+class FeasibilityMatrix:
+    """
+    只包含至少需要一种原料的配方。角色专属配方（filters 含 CHARACTER，如 woodie_boards、
+    walter_rope）需要对应角色的标签，无法仅凭物品栏判断，默认不纳入。
+    """
+
+    def __init__(self, index: RecipeIndex, include_character: bool = False):
+        self.index = index
+        recipes = [recipe for recipe in index.iter_recipes()
+                   if (include_character or "CHARACTER" not in recipe["filters"])
+                   and any(ingredient[2] > 0 for ingredient in recipe["ingredients"] + recipe["tech_ingredients"])]
+        self.names: List[str] = [recipe["name"] for recipe in recipes]
+        self.row_of = {name: row for row, name in enumerate(self.names)}
+
+        ingredient_types = sorted({ingredient[0] for recipe in recipes
+                                   for ingredient in recipe["ingredients"] + recipe["tech_ingredients"]})
+        self.ingredient_column = {name: column for column, name in enumerate(ingredient_types)}
+        self.ingredient_types = ingredient_types
+        techs = sorted({tech for recipe in recipes for tech in recipe["level"]})
+        self.tech_column = {name: column for column, name in enumerate(techs)}
+        self.techs = techs
+
+        self.amounts = np.zeros((len(recipes), len(ingredient_types)), dtype=np.int32)
+        self.levels = np.zeros((len(recipes), len(techs)), dtype=np.int8)
+        for row, recipe in enumerate(recipes):
+            for ingredient in recipe["ingredients"] + recipe["tech_ingredients"]:
+                self.amounts[row, self.ingredient_column[ingredient[0]]] += ingredient[2]
+            for tech, level in recipe["level"].items():
+                self.levels[row, self.tech_column[tech]] = level
+
+    def inventory_vector(self, inventory: Dict[str, int]) -> np.ndarray:
+        vector = np.zeros(len(self.ingredient_types), dtype=np.int32)
+        for prefab, count in inventory.items():
+            column = self.ingredient_column.get(prefab)
+            if column is not None:
+                vector[column] = count
+        return vector
+
+    def tech_vector(self, tech_levels: Dict[str, int]) -> np.ndarray:
+        vector = np.zeros(len(self.techs), dtype=np.int8)
+        for tech, level in tech_levels.items():
+            column = self.tech_column.get(tech)
+            if column is not None:
+                vector[column] = level
+        return vector
+
+    def feasible_mask(self, inventory: Dict[str, int], tech_levels: Optional[Dict[str, int]] = None) -> np.ndarray:
+        """每个配方的原料是否足够；给出 tech_levels 时同时要求科技等级满足"""
+        mask = (self.amounts <= self.inventory_vector(inventory)).all(axis=1)
+        if tech_levels is not None:
+            mask &= (self.levels <= self.tech_vector(tech_levels)).all(axis=1)
+        return mask
+
+    def craftable(self, inventory: Dict[str, int], tech_levels: Optional[Dict[str, int]] = None) -> List[str]:
+        """原料（以及给定时的科技等级）满足的配方名"""
+        return [self.names[row] for row in np.flatnonzero(self.feasible_mask(inventory, tech_levels))]
+
+    def missing(self, name: str, inventory: Dict[str, int]) -> Optional[Dict[str, int]]:
+        """单个配方缺少的原料 {type: 缺少数量}；配方不在矩阵中返回 None"""
+        row = self.row_of.get(name)
+        if row is None:
+            return None
+        shortage = self.amounts[row] - self.inventory_vector(inventory)
+        return {self.ingredient_types[column]: int(shortage[column]) for column in np.flatnonzero(shortage > 0)}
+
+    def required_tech(self, name: str) -> Dict[str, int]:
+        row = self.row_of.get(name)
+        if row is None:
+            return {}
+        return {self.techs[column]: int(self.levels[row, column]) for column in np.flatnonzero(self.levels[row])}
+
+
+def nearby_tech_levels(nearby_prefabs) -> Dict[str, int]:
+    """根据附近的制作站推算当前可用的科技等级"""
+    levels: Dict[str, int] = {}
+    for prefab in nearby_prefabs:
+        for tech, level in PROTOTYPER_TECH.get(prefab, {}).items():
+            levels[tech] = max(levels.get(tech, 0), level)
+    return levels
+
+
+@lru_cache(maxsize=1)
+def get_feasibility_matrix() -> FeasibilityMatrix:
+    """进程内共享的可行性矩阵"""
+    return FeasibilityMatrix(get_recipe_index())
+
+
+if __name__ == "__main__":
+    import time
+
+    matrix = get_feasibility_matrix()
+    inventory = {"twigs": 12, "cutgrass": 15, "flint": 6, "log": 10, "rocks": 8, "goldnugget": 2,
+                 "boards": 2, "rope": 1, "petals": 6, "silk": 2, "charcoal": 3}
+    tech = nearby_tech_levels(["researchlab"])
+    print(f"matrix: {matrix.amounts.shape[0]} recipes x {matrix.amounts.shape[1]} ingredients")
+    print(f"craftable near a science machine: {matrix.craftable(inventory, tech)}")
+    print(f"researchlab2 missing: {matrix.missing('researchlab2', inventory)}")
+
+    def loop_craftable():
+        result = []
+        for recipe in matrix.index.iter_recipes():
+            if recipe["name"] not in matrix.row_of:
+                continue
+            needed: Dict[str, int] = {}
+            for ingredient in recipe["ingredients"] + recipe["tech_ingredients"]:
+                needed[ingredient[0]] = needed.get(ingredient[0], 0) + ingredient[2]
+            if all(inventory.get(prefab, 0) >= amount for prefab, amount in needed.items()) and \
+                    all(tech.get(name, 0) >= level for name, level in recipe["level"].items()):
+                result.append(recipe["name"])
+        return result
+
+    assert loop_craftable() == matrix.craftable(inventory, tech)
+    rounds = 500
+    start = time.perf_counter()
+    for _ in range(rounds):
+        loop_craftable()
+    loop_us = (time.perf_counter() - start) / rounds * 1e6
+    start = time.perf_counter()
+    for _ in range(rounds):
+        matrix.craftable(inventory, tech)
+    numpy_us = (time.perf_counter() - start) / rounds * 1e6
+    print(f"python loop: {loop_us:.0f} µs, numpy: {numpy_us:.0f} µs")
@@ -0,0 +1,196 @@
+"""
+递归合成规划器
+把目标物品展开为完整的材料树：扣除已有物品后给出需要依次合成的中间产物、
+缺少的原材料，以及需要的科技等级，模型一次调用即可得到完整的合成路线。
+"""
+
+import json
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from .recipe_index import RecipeIndex, get_recipe_index
+
+# 常见科技等级对应的制作站
+TECH_STATIONS = {
+    ("SCIENCE", 1): "researchlab (Science Machine)",
+    ("SCIENCE", 2): "researchlab2 (Alchemy Engine)",
+    ("MAGIC", 1): "researchlab4 (Prestihatitator)",
+    ("MAGIC", 2): "researchlab3 (Shadow Manipulator)",
+    ("ANCIENT", 2): "ancient_altar_broken (Broken Ancient Pseudoscience Station)",
+    ("ANCIENT", 4): "ancient_altar (Ancient Pseudoscience Station)",
+    ("CELESTIAL", 1): "moonrockseed (Celestial Orb)",
+    ("CELESTIAL", 3): "moon_altar (Celestial Altar)",
+    ("CARTOGRAPHY", 2): "cartographydesk (Cartographer's Desk)",
+    ("SEAFARING", 2): "seafaring_prototyper (Think Tank)",
+    ("CARPENTRY", 2): "carpentry_station (Sawhorse)",
+    ("CARPENTRY", 3): "carpentry_station (Sawhorse with Carpentry Blade)",
+}
+
+
+class CraftingPlanner:
+    """
+    基于预编译配方索引的合成规划。
+    中间产物只使用 name == product 的标准配方；角色专属、批量或转换配方
+    （woodie_boards、boards_bunch、transmute_log 等）只在被直接指定为目标时使用，
+    没有标准配方的物品视为原材料。
+    """
+
+    def __init__(self, index: RecipeIndex):
+        self.index = index
+        self.lock = threading.Lock()
+        self.raw_cache: Dict[str, Dict[str, int]] = {}
+
+    def resolve(self, name: str) -> Optional[str]:
+        """把 prefab / 英文名 / 中文名解析为配方名，找不到返回 None"""
+        return self.index.resolve(name)
+
+    @staticmethod
+    def _ingredients(recipe: Dict[str, Any]):
+        # 索引中的原料为 (type, display_name, amount, display_name_zh) 元组
+        for ingredient in recipe["ingredients"] + recipe["tech_ingredients"]:
+            if ingredient[2] > 0:
+                yield ingredient[0], ingredient[2]
+
+    def raw_materials(self, product: str, _stack: Optional[set] = None) -> Dict[str, int]:
+        """
+        合成一个 product 所需的全部原材料（不考虑已有物品），结果按产物缓存。
+        """
+        with self.lock:
+            cached = self.raw_cache.get(product)
+        if cached is not None:
+            return cached
+        stack = _stack if _stack is not None else set()
+        recipe = self.index.canonical(product)
+        if recipe is None or product in stack:
+            return {product: 1}
+
+        stack.add(product)
+        totals: Dict[str, int] = {}
+        for ingredient, count in self._ingredients(recipe):
+            for raw, raw_count in self.raw_materials(ingredient, stack).items():
+                totals[raw] = totals.get(raw, 0) + raw_count * count
+        stack.discard(product)
+        with self.lock:
+            self.raw_cache[product] = totals
+        return totals
+
+    def plan(self, target: str, inventory: Dict[str, int], amount: int = 1) -> Optional[Dict[str, Any]]:
+        """
+        规划合成 amount 个 target。
+
+        Args:
+            target: 配方名 / 英文名 / 中文名
+            inventory: 当前持有的物品数量 {prefab: count}
+            amount: 目标数量
+
+        Returns:
+            {"target", "amount", "steps", "use_from_inventory", "missing", "tech", "costs", "raw_materials"}，
+            配方不存在时返回 None
+        """
+        name = self.resolve(target)
+        if name is None:
+            return None
+        available = dict(inventory)
+        plan = {
+            "target": name,
+            "amount": amount,
+            "steps": [],
+            "use_from_inventory": {},
+            "missing": {},
+            "tech": {},
+            "costs": {}
+        }
+        self._expand(name, amount, available, plan, set(), recipe=self.index.recipes[name])
+        # 合并同一产物的多个步骤（按首次出现的位置）
+        merged: Dict[str, int] = {}
+        for product, count in plan["steps"]:
+            merged[product] = merged.get(product, 0) + count
+        plan["steps"] = [{"craft": product, "amount": count} for product, count in merged.items()]
+        raw = {}
+        for ingredient, count in self._ingredients(self.index.recipes[name]):
+            for material, material_count in self.raw_materials(ingredient).items():
+                raw[material] = raw.get(material, 0) + material_count * count * amount
+        plan["raw_materials"] = raw
+        return plan
+
+    def _expand(self, item: str, needed: int, available: Dict[str, int], plan: Dict[str, Any],
+                stack: set, recipe: Optional[Dict[str, Any]] = None):
+        """
+        按需展开：先用已有物品抵扣，剩余部分递归合成，合成步骤按后序加入。
+        recipe 只对目标本身给出（目标不使用已有物品抵扣）。
+        """
+        is_target = recipe is not None
+        if not is_target:
+            used = min(available.get(item, 0), needed)
+            if used:
+                available[item] -= used
+                plan["use_from_inventory"][item] = plan["use_from_inventory"].get(item, 0) + used
+                needed -= used
+        if needed <= 0:
+            return
+
+        if not is_target:
+            recipe = self.index.canonical(item)
+        if recipe is None or item in stack:
+            plan["missing"][item] = plan["missing"].get(item, 0) + needed
+            return
+
+        stack.add(item)
+        for ingredient, count in self._ingredients(recipe):
+            self._expand(ingredient, count * needed, available, plan, stack)
+        stack.discard(item)
+
+        for tech, level in recipe["level"].items():
+            plan["tech"][tech] = max(plan["tech"].get(tech, 0), level)
+        for cost in recipe["character_ingredients"]:
+            plan["costs"][cost[0]] = plan["costs"].get(cost[0], 0) + cost[2] * needed
+        plan["steps"].append((item, needed))
+
+    @staticmethod
+    def describe_tech(tech: Dict[str, int]) -> List[str]:
+        """把科技要求翻译成需要靠近的制作站"""
+        result = []
+        for name, level in sorted(tech.items()):
+            station = TECH_STATIONS.get((name, level))
+            result.append("{} {}".format(name, level) + (" - stand near {}".format(station) if station else ""))
+        return result
+
+    def format_plan(self, plan: Dict[str, Any]) -> str:
+        """生成给模型的精简文本"""
+        lines = ["Crafting plan for {} x{}:".format(plan["target"], plan["amount"])]
+        lines.append("Craft in this order: " + ", ".join(
+            "{} x{}".format(step["craft"], step["amount"]) for step in plan["steps"]))
+        if plan["use_from_inventory"]:
+            lines.append("Uses from your inventory: " + json.dumps(plan["use_from_inventory"], sort_keys=True))
+        if plan["missing"]:
+            lines.append("Missing raw materials: " + json.dumps(plan["missing"], sort_keys=True))
+        else:
+            lines.append("You have all the materials.")
+        if plan["tech"]:
+            lines.append("Tech required: " + "; ".join(self.describe_tech(plan["tech"])))
+        if plan["costs"]:
+            lines.append("Character costs: " + json.dumps(plan["costs"], sort_keys=True))
+        return "\n".join(lines)
+
+
+@lru_cache(maxsize=1)
+def get_crafting_planner() -> CraftingPlanner:
+    """进程内共享的规划器（配方数据只读）"""
+    return CraftingPlanner(get_recipe_index())
+
+
+if __name__ == "__main__":
+    import time
+
+    planner = get_crafting_planner()
+    inventory = {"log": 5, "cutgrass": 2, "boards": 1}
+    print(planner.format_plan(planner.plan("researchlab2", inventory)))
+    print()
+    print(planner.format_plan(planner.plan("科学机器", {})))
+
+    rounds = 2000
+    start = time.perf_counter()
+    for _ in range(rounds):
+        planner.plan("researchlab2", inventory)
+    print(f"\nplan researchlab2: {(time.perf_counter() - start) / rounds * 1e6:.1f} µs")
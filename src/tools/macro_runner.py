@@ -0,0 +1,199 @@
+"""
+多步动作宏
+模型一次给出一串动作，或"对最近的 N 个匹配实体重复某个动作"，由服务端逐个下发：
+每收到上一步的 Action-End 就入队下一步，全部完成或某一步失败时才唤醒模型，
+采集类任务（采 10 根草、砍 3 棵树）不再需要每一步一次 LLM 调用。
+"""
+
+import json
+import threading
+from typing import Any, Dict, List, Optional
+
+from ..config.settings import settings
+from .action_parser import ActionParseError, parse_action
+
+# 可重复作用于最近实体的动作及其要求的实体能力
+REPEATABLE_ACTIONS = {
+    "PICK": "Pickable",
+    "PICKUP": "Collectable",
+    "CHOP": "Choppable",
+    "MINE": "Mineable",
+    "DIG": "Diggable",
+}
+# 不能放进宏的动作：寻路和探索有各自的结束通知，STOP 应立即执行
+EXCLUDED_ACTIONS = {"PATHFIND", "EXPLORE", "STOP"}
+
+
+class MacroRunner:
+    """
+    每个 ToolExecutor 一个，同一时间最多运行一个宏。
+    步骤按 WFN 与 Action-End / Action-Failed 事件匹配；每一步在下发前才校验，
+    因此可以引用前面步骤之后才出现的实体。
+    """
+
+    def __init__(self, executor, max_steps: Optional[int] = None):
+        self.executor = executor
+        self.max_steps = settings.MACRO_MAX_STEPS if max_steps is None else max_steps
+        self.lock = threading.Lock()
+        self.macro: Optional[Dict[str, Any]] = None
+        self.stats = {
+            'started': 0,
+            'completed': 0,
+            'failed': 0,
+            'cancelled': 0,
+            'steps_dispatched': 0
+        }
+
+    def active(self) -> bool:
+        return self.macro is not None
+
+    def start_sequence(self, lines: List[str]) -> str:
+        """按顺序执行给出的动作"""
+        steps = []
+        for number, line in enumerate((line for line in lines if line.strip()), 1):
+            try:
+                steps.append(parse_action(line))
+            except ActionParseError as e:
+                return "Macro not started, step {} could not be parsed: {}".format(
+                    number, json.dumps(e.to_dict(), ensure_ascii=False))
+            if steps[-1].action in EXCLUDED_ACTIONS:
+                return "Macro not started: {} cannot be used in a macro.".format(steps[-1].action)
+        if not steps:
+            return "Macro not started: no actions given."
+        if len(steps) > self.max_steps:
+            return "Macro not started: at most {} actions are allowed, got {}.".format(self.max_steps, len(steps))
+        return self._start({"kind": "sequence", "steps": steps, "total": len(steps),
+                            "description": "{} actions".format(len(steps))})
+
+    def start_repeat(self, action: str, prefabs: List[str], count: int, radius: Optional[float] = None) -> str:
+        """对最近的 count 个匹配实体依次执行 action"""
+        action = action.strip().upper()
+        if action not in REPEATABLE_ACTIONS:
+            return "Macro not started: repeat must be one of {}.".format(", ".join(REPEATABLE_ACTIONS))
+        if not prefabs:
+            return "Macro not started: you should specify the prefab to repeat {} on.".format(action)
+        count = max(1, min(count, self.max_steps))
+        return self._start({"kind": "repeat", "action": action, "prefabs": prefabs, "radius": radius,
+                            "total": count, "visited": set(),
+                            "description": "{} x{} on {}".format(action, count, ", ".join(prefabs))})
+
+    def _start(self, macro: Dict[str, Any]) -> str:
+        macro.update({"done": [], "current": None})
+        with self.lock:
+            if self.macro is not None:
+                return "Another macro is already running. Use <stop_macro></stop_macro> to stop it first."
+            self.macro = macro
+            self.stats['started'] += 1
+        message = self._dispatch_next(macro)
+        if message is not None:
+            return message
+        return "Macro started: {}. You will be notified when it finishes or a step fails; " \
+               "output <wait></wait> if you have nothing else to do.".format(macro["description"])
+
+    def _next_action(self, macro: Dict[str, Any]):
+        """下一步的动作字典；没有下一步时返回 None"""
+        if len(macro["done"]) >= macro["total"]:
+            return None
+        if macro["kind"] == "sequence":
+            return macro["steps"][len(macro["done"])].to_dict()
+
+        position = self.executor.player_position()
+        if position is None:
+            return None
+        visited = macro["visited"]
+        results = self.executor.spatial_index().nearest(
+            position[0], position[1], prefabs=macro["prefabs"], capability=REPEATABLE_ACTIONS[macro["action"]],
+            count=len(visited) + 1, radius=macro["radius"])
+        for _, entity in results:
+            guid = str(entity.get("GUID"))
+            if guid not in visited:
+                visited.add(guid)
+                return parse_action("Action({}, -, -, -, -) = {}".format(macro["action"], guid)).to_dict()
+        return None
+
+    def _dispatch_next(self, macro: Dict[str, Any]) -> Optional[str]:
+        """
+        入队下一步。宏结束（完成、找不到更多目标或校验失败）时返回给模型的消息，否则返回 None。
+        """
+        action = self._next_action(macro)
+        if action is None:
+            return self._finish(macro, "completed")
+        executor = self.executor
+        error = executor.action_validator.validate(action, executor.shared_perception_dict, executor.spatial_index(),
+                                                   executor.self_uid)
+        if error is not None:
+            return self._finish(macro, "failed", "Step {} ({}) was rejected: {}".format(
+                len(macro["done"]) + 1, action["WFN"], json.dumps(error.to_dict(), ensure_ascii=False)))
+        # 与 cancel（推理线程）互斥：已被取消的宏不再入队，入队的步骤一定能被 cancel 撤回
+        with self.lock:
+            if self.macro is not macro:
+                return None
+            macro["current"] = action
+            queued = executor.action_queue.put_action(action)
+            if queued:
+                self.stats['steps_dispatched'] += 1
+        if not queued:
+            return self._finish(macro, "failed", "Step {} could not be queued, the action queue is full.".format(
+                len(macro["done"]) + 1))
+        return None
+
+    def _finish(self, macro: Dict[str, Any], outcome: str, reason: str = "") -> Optional[str]:
+        with self.lock:
+            if self.macro is not macro:
+                return None
+            self.macro = None
+            self.stats[outcome] += 1
+        done = macro["done"]
+        if outcome == "completed" and not done:
+            return "Macro not started: no matching {} found nearby.".format(", ".join(macro.get("prefabs", [])) or "entities")
+        if outcome == "completed":
+            summary = "Macro finished: {}. {} of {} steps done.".format(macro["description"], len(done), macro["total"])
+            if len(done) < macro["total"]:
+                summary += " No more matching entities were found nearby."
+        else:
+            summary = "Macro stopped: {}. {}".format(macro["description"], reason)
+        if done:
+            summary += "\nCompleted steps: " + json.dumps(done, ensure_ascii=False)
+        return summary
+
+    def on_action_event(self, data: Dict[str, Any]):
+        """
+        EventManager 在动作结束事件到达时调用。
+
+        Returns:
+            None  - 事件不属于宏，按原方式处理
+            True  - 宏的中间步骤完成，已下发下一步，不唤醒模型
+            str   - 宏结束，需要送给模型的消息
+        """
+        with self.lock:
+            macro = self.macro
+            if macro is None or macro["current"] is None or data.get("Name") != macro["current"]["WFN"]:
+                return None
+            step = macro["current"]
+            macro["current"] = None
+        if data.get("Type") == "Action-Failed":
+            info = " Info: {}".format(data.get("Info")) if data.get("Info") else ""
+            return self._finish(macro, "failed", "Step {} ({}) failed.{}".format(len(macro["done"]) + 1, step["WFN"], info))
+        macro["done"].append(step["WFN"])
+        message = self._dispatch_next(macro)
+        return True if message is None and self.macro is macro else message
+
+    def cancel(self) -> bool:
+        """停止当前宏并撤回已入队但尚未下发的步骤，返回之前是否有宏在运行"""
+        with self.lock:
+            macro, self.macro = self.macro, None
+            if macro is None:
+                return False
+            self.stats['cancelled'] += 1
+            current = macro["current"]
+        if current is not None:
+            self.executor.action_queue.cancel(current["AUID"])
+        return True
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.stats)
+            macro = self.macro
+            stats['running'] = None if macro is None else {
+                "description": macro["description"], "done": len(macro["done"]), "total": macro["total"]}
+            return stats
@@ -0,0 +1,196 @@
+"""
+中英文名称的模糊解析
+模型常用显示名、中文名或带拼写错误的名字（"科学机器"、"science machine"、"Researchlab"、
+"goldnuget"）来指代配方和 prefab。这里用三元组 (trigram) 倒排索引召回候选，
+再用编辑距离排序，返回带分数的候选列表。
+"""
+
+import heapq
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .recipe_index import get_recipe_index
+
+# 召回阶段保留的候选数，之后只对它们计算编辑距离
+RECALL_SIZE = 10
+# 模糊匹配可直接采用的最低分数
+DEFAULT_MIN_SCORE = 0.75
+# 作为"你是不是要找"提示的最低分数
+SUGGEST_MIN_SCORE = 0.4
+
+
+def normalize(name: str) -> str:
+    """忽略大小写，下划线/连字符视为空格，合并空白"""
+    return re.sub(r"[\s_\-]+", " ", name.strip().lower())
+
+
+def trigrams(text: str) -> set:
+    padded = "  " + text + "  "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein 距离（两行滚动数组；内层循环避免调用 min，快一倍）"""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a):
+        left = i + 1
+        current = [left]
+        for j, cb in enumerate(b):
+            cost = previous[j] + (ca != cb)
+            if previous[j + 1] + 1 < cost:
+                cost = previous[j + 1] + 1
+            if left + 1 < cost:
+                cost = left + 1
+            current.append(cost)
+            left = cost
+        previous = current
+    return previous[-1]
+
+
+class NameResolver:
+    """
+    别名 -> 目标名 的模糊索引。精确匹配（归一化后）直接返回，分数为 1；
+    否则按共享三元组数召回 RECALL_SIZE 个别名，以 1 - 编辑距离 / 较长长度 作为分数，
+    查询是别名的子串时（如 "science" 之于 "science machine"）按长度比例给分。
+    add 与查询可以在不同线程中进行，读写索引都持有 self.lock。
+    """
+
+    def __init__(self, aliases: Optional[Iterable[Tuple[str, str]]] = None):
+        self.lock = threading.Lock()
+        self.exact: Dict[str, str] = {}
+        self.keys: List[str] = []  # 归一化后的别名
+        self.targets: List[str] = []
+        self.postings: Dict[str, List[int]] = {}
+        for alias, target in aliases or ():
+            self.add(alias, target)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, alias: str, target: str):
+        """加入别名；同一别名已存在时保留先加入的目标"""
+        if not alias:
+            return
+        key = normalize(alias)
+        if not key or key in self.exact:
+            return
+        with self.lock:
+            if key in self.exact:
+                return
+            self.exact[key] = target
+            alias_id = len(self.keys)
+            self.keys.append(key)
+            self.targets.append(target)
+            for gram in trigrams(key):
+                self.postings.setdefault(gram, []).append(alias_id)
+
+    def candidates(self, query: str, limit: int = 5, min_score: float = 0.0) -> List[Tuple[float, str]]:
+        """按分数降序返回 (分数, 目标名)，同一目标只保留最高分"""
+        key = normalize(query)
+        if not key:
+            return []
+        exact = self.exact.get(key)
+        if exact is not None:
+            return [(1.0, exact)]
+
+        grams = trigrams(key)
+        overlap: Dict[int, int] = {}
+        with self.lock:
+            for gram in grams:
+                for alias_id in self.postings.get(gram, ()):
+                    overlap[alias_id] = overlap.get(alias_id, 0) + 1
+            if not overlap:
+                return []
+            # 按 Dice 系数召回（分母中的三元组数 = 长度 + 2）
+            size = len(grams) + 2
+            recalled = heapq.nlargest(RECALL_SIZE, overlap,
+                                      key=lambda alias_id: overlap[alias_id] / (size + len(self.keys[alias_id])))
+            recalled = [(self.keys[alias_id], self.targets[alias_id]) for alias_id in recalled]
+
+        best: Dict[str, float] = {}
+        for alias, target in recalled:
+            score = 1 - edit_distance(key, alias) / max(len(key), len(alias))
+            if len(key) >= 3 and key in alias:
+                score = max(score, 0.9 * len(key) / len(alias))
+            if score >= min_score and score > best.get(target, -1):
+                best[target] = score
+        ranked = sorted(((score, target) for target, score in best.items()), key=lambda item: -item[0])
+        return [(round(score, 2), target) for score, target in ranked[:limit]]
+
+    def resolve(self, query: str, min_score: float = DEFAULT_MIN_SCORE) -> Optional[str]:
+        """分数最高且不低于 min_score 的目标名；没有或前两名同分（有歧义）时返回 None"""
+        return resolve_in((self,), query, min_score)
+
+    def suggest(self, query: str, limit: int = 3) -> List[str]:
+        """给模型的候选名列表"""
+        return [target for _, target in self.candidates(query, limit=limit, min_score=SUGGEST_MIN_SCORE)]
+
+
+def resolve_in(resolvers: Iterable[NameResolver], query: str, min_score: float = DEFAULT_MIN_SCORE) -> Optional[str]:
+    """在多个解析器的候选中取分数最高的目标名，规则同 NameResolver.resolve"""
+    best: Dict[str, float] = {}
+    for resolver in resolvers:
+        for score, target in resolver.candidates(query, limit=2, min_score=min_score):
+            if score > best.get(target, -1):
+                best[target] = score
+    found = sorted(best.items(), key=lambda item: -item[1])
+    if not found or (len(found) > 1 and found[0][1] == found[1][1]):
+        return None
+    return found[0][0]
+
+
+@lru_cache(maxsize=1)
+def get_recipe_resolver() -> NameResolver:
+    """配方名解析：name / product / 英文名 / 中文名 -> 配方名"""
+    return NameResolver(get_recipe_index().aliases.items())
+
+
+def resolve_recipe_name(name: str) -> Optional[str]:
+    """配方名 / 英文名 / 中文名（允许拼写错误）-> 配方名：先查索引别名，再模糊匹配；无法确定时返回 None"""
+    return get_recipe_index().resolve(name) or get_recipe_resolver().resolve(name)
+
+
+@lru_cache(maxsize=1)
+def get_prefab_resolver() -> NameResolver:
+    """
+    prefab 名解析：配方产物和原料的 prefab 及其中英文名。进程内共享，创建后不再修改；
+    运行中见到的 prefab（Vision、世界记忆）由每个会话的 ToolExecutor 放在自己的解析器中。
+    """
+    resolver = NameResolver()
+    for recipe in get_recipe_index().iter_recipes():
+        for ingredient in recipe["ingredients"] + recipe["tech_ingredients"]:
+            for alias in (ingredient[0], ingredient[1], ingredient[3]):
+                resolver.add(alias, ingredient[0])
+    for recipe in get_recipe_index().iter_recipes():
+        for alias in (recipe["product"], recipe["display_name_en"], recipe["display_name_zh"]):
+            resolver.add(alias, recipe["product"])
+    return resolver
+
+
+if __name__ == "__main__":
+    import time
+
+    recipes = get_recipe_resolver()
+    prefabs = get_prefab_resolver()
+    queries = ["科学机器", "science machine", "Researchlab", "reserchlab", "alchemy engin", "炼金", "pick axe",
+               "torch", "火把", "wall_wood", "backpak"]
+    for query in queries:
+        print(f"{query!r}: {recipes.candidates(query, limit=3)}")
+    for query in ["goldnuget", "金块", "cut grass", "燧石", "rock"]:
+        print(f"prefab {query!r}: {prefabs.candidates(query, limit=3)}")
+
+    rounds = 200
+    timings = {query: [] for query in queries}
+    for _ in range(rounds):
+        for query in queries:
+            start = time.perf_counter()
+            recipes.candidates(query)
+            timings[query].append(time.perf_counter() - start)
+    medians = sorted(sorted(samples)[rounds // 2] * 1e6 for samples in timings.values())
+    slowest = max(timings, key=lambda query: sorted(timings[query])[rounds // 2])
+    print(f"{len(recipes)} aliases, median per query {medians[len(medians) // 2]:.0f} µs, "
+          f"slowest query {slowest!r} {medians[-1]:.0f} µs")
@@ -6,6 +6,8 @@ ALLOWED_TOOLS = {
     "check_status", 
     "do",
     "check_surroundings",
+    "find_nearest",
+    "recall",
     "task_completion",
     "check_equipslots",
     "mark_loc",
@@ -13,16 +15,52 @@ ALLOWED_TOOLS = {
     "check_self_GUID",
     "explore",
     "check_recipe",
+    "plan_craft",
+    "check_craftable",
     "stop_explore",
-    "stop_pathfind"
+    "stop_pathfind",
+    "macro",
+    "stop_macro"
 }
 
+# 只读工具：不改变游戏状态，可以在同一条回复中批量执行
+READ_ONLY_TOOLS = {
+    "check_inventory",
+    "check_status",
+    "check_surroundings",
+    "find_nearest",
+    "recall",
+    "check_equipslots",
+    "check_map",
+    "check_self_GUID",
+    "check_recipe",
+    "plan_craft",
+    "check_craftable"
+}
+
+# 快照类只读工具：结果只反映调用时的状态，被同一工具更新的结果取代后可以在历史中压缩
+SNAPSHOT_TOOLS = {
+    "check_inventory",
+    "check_status",
+    "check_surroundings",
+    "check_equipslots",
+    "check_map"
+}
+
+TOOL_PATTERN = re.compile(r"<([a-zA-Z0-9_]+)>(.*?)</\1>", re.DOTALL)
+PARAM_PATTERN = TOOL_PATTERN
+TAG_PATTERN = re.compile(r"<(/?)([a-zA-Z0-9_]+)>")
+
+# 最长的合法标签（闭标签）长度，用于判断缓冲区末尾是否可能有被截断的标签
+_MAX_TAG_LENGTH = max(len(name) for name in ALLOWED_TOOLS) + 3
+
+
 def parse_assistant_message(assistant_message: str) -> Tuple[List[Dict[str, Any]], bool]:
     content_blocks = []
     last_index = 0
 
-    tool_pattern = re.compile(r"<([a-zA-Z0-9_]+)>(.*?)</\1>", re.DOTALL)
-    param_pattern = re.compile(r"<([a-zA-Z0-9_]+)>(.*?)</\1>", re.DOTALL)
+    tool_pattern = TOOL_PATTERN
+    param_pattern = PARAM_PATTERN
 
     for match in tool_pattern.finditer(assistant_message):
         start, end = match.span()
@@ -69,11 +107,111 @@ def parse_assistant_message(assistant_message: str) -> Tuple[List[Dict[str, Any]
     return content_blocks, has_tool_use
 
 
-# --- Example Usage ---
-message = """asdfasdf
+class StreamingToolParser:
+    """
+    增量式工具调用解析器，用于流式推理。
+
+    每次 feed() 只扫描新到达的文本（以及末尾可能被截断的标签），
+    跟踪 ALLOWED_TOOLS 的开/闭标签，一旦出现第一个完整的工具块即报告。
+    同时跟踪所有未闭合的工具开标签：正文中提到的 <explore> 没有闭标签时，
+    之后完整的 <do>...</do> 仍然会被识别，与 parse_assistant_message 的结果一致。
+    只保留尚未扫描完的尾部窗口，因此每个块的开销与块长度成正比，与已累积的回复长度无关。
+
+    batch_read_only=True 时，只读工具块不会结束解析，直到出现第一个会改变游戏状态的工具块，
+    这样同一条回复里的多个查询可以一次执行完。
+    """
+
+    def __init__(self, batch_read_only: bool = False):
+        self.batch_read_only = batch_read_only
+        self.read_only_tools = []   # 已闭合的只读工具名（仅 batch_read_only 模式）
+        self.chunks = []
+        self.window = ""            # 尚需扫描的尾部文本
+        self.offset = 0             # window[0] 在完整文本中的位置
+        self.open_tools = {}        # 未闭合的工具名 -> 最早的开标签在完整文本中的起始位置
+        self.tool_end = -1          # 第一个完整工具块在完整文本中的结束位置
+
+    @property
+    def has_tool_use(self) -> bool:
+        return self.tool_end >= 0
+
+    @property
+    def text(self) -> str:
+        """已累积的完整文本"""
+        if len(self.chunks) > 1:
+            self.chunks = ["".join(self.chunks)]
+        return self.chunks[0] if self.chunks else ""
+
+    def feed(self, chunk: str) -> bool:
+        """
+        追加一个流式块。
+
+        Returns:
+            bool: 是否已出现第一个完整的工具块
+        """
+        self.chunks.append(chunk)
+        if self.has_tool_use:
+            return True
+        self.window += chunk
+
+        scanned = 0
+        for match in TAG_PATTERN.finditer(self.window):
+            scanned = match.end()
+            closing, name = match.group(1), match.group(2)
+            if name not in ALLOWED_TOOLS:
+                continue  # 参数或思考标签
+            if not closing:
+                self.open_tools.setdefault(name, self.offset + match.start())
+                continue
+            if name not in self.open_tools:
+                continue
+            if self.batch_read_only and name in READ_ONLY_TOOLS:
+                # 只读工具闭合，继续寻找下一个工具；此前未闭合的开标签不再可能成为完整的块
+                self.read_only_tools.append(name)
+                self.open_tools = {}
+                continue
+            self.tool_end = self.offset + match.end()
+            self.window = ""
+            return True
+
+        # 末尾可能是被截断的标签，只保留这部分以便下次重新扫描
+        self._advance(max(scanned, len(self.window) - _MAX_TAG_LENGTH + 1))
+        return False
+
+    def _advance(self, count: int):
+        """丢弃窗口前 count 个已扫描的字符"""
+        if count > 0:
+            self.window = self.window[count:]
+            self.offset += count
+
+
+if __name__ == "__main__":
+    import time
+
+    # --- Example Usage ---
+    message = """asdfasdf
 <do>
 Action(EQUIP, 116153, -, -, -) = -
 </do>"""
 
-content_blocks = parse_assistant_message(message)
-print(content_blocks) 
\ No newline at end of file
+    content_blocks = parse_assistant_message(message)
+    print(content_blocks)
+
+    # --- Micro-benchmark: 每块解析开销 vs 累积长度 ---
+    chunk = "Let me think about the <b>trees</b> nearby and what to craft next. "
+    for total_chunks in (500, 2000, 8000):
+        parser = StreamingToolParser()
+        start = time.perf_counter()
+        for _ in range(total_chunks):
+            parser.feed(chunk)
+        parser.feed("<do>Action(CHOP, -, -, -, -) = 1</do>")
+        incremental = (time.perf_counter() - start) / (total_chunks + 1)
+
+        full_message = ""
+        start = time.perf_counter()
+        for _ in range(min(total_chunks, 2000)):
+            full_message += chunk
+            parse_assistant_message(full_message)
+        reparse = (time.perf_counter() - start) / min(total_chunks, 2000)
+        print(f"{total_chunks:>5} chunks: incremental {incremental * 1e6:6.2f} us/chunk, "
+              f"full re-parse {reparse * 1e6:8.1f} us/chunk (first {min(total_chunks, 2000)} chunks), "
+              f"tool found: {parser.has_tool_use}")
@@ -0,0 +1,246 @@
+"""
+预编译的配方索引
+把 recipes_merged_processed.json 编译成带版本号的 pickle 文件
+（settings.RECIPE_INDEX_FILE_PATH，位于不提交的 .cache 目录），包含：
+- 精简后的配方记录：去掉重复的字段，原料存为元组，字符串去重
+- 别名表：name / product / 英文名 / 中文名 -> 配方名，产物别名优先指向标准配方 (name == product)
+- 原料反向索引：原料 -> 使用它的配方
+- 科技等级分桶：(科技, 等级) -> 配方
+索引在第一次使用时才加载；索引缺失、无法读取、版本不符或与 JSON 不一致时解析 JSON 并重新生成索引文件。
+"""
+
+import json
+import os
+import pickle
+import sys
+import threading
+import zlib
+from typing import Any, Dict, List, Optional
+
+from ..config.settings import settings
+
+RECIPE_INDEX_VERSION = 2
+
+# 每条配方保留的字段
+RECIPE_FIELDS = ("name", "product", "display_name_en", "display_name_zh", "level")
+# 原料字段，按原始 JSON 的键顺序保存为元组
+INGREDIENT_FIELDS = ("type", "display_name", "amount", "display_name_zh")
+INGREDIENT_LISTS = ("ingredients", "tech_ingredients", "character_ingredients")
+
+
+def _intern(value):
+    # 相同的字符串共用一个对象，pickle 只写一次，加载后也只占一份内存
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _pack_ingredients(ingredients: List[Dict[str, Any]]) -> tuple:
+    return tuple(tuple(_intern(ingredient.get(field)) for field in INGREDIENT_FIELDS) for ingredient in ingredients)
+
+
+def unpack_ingredients(packed: tuple) -> List[Dict[str, Any]]:
+    """还原为原始 JSON 中的原料字典列表"""
+    return [{field: value for field, value in zip(INGREDIENT_FIELDS, ingredient) if value is not None}
+            for ingredient in packed]
+
+
+def source_digest(path: str) -> str:
+    """配方 JSON 的长度与 CRC32，用于判断预编译索引是否过期（zlib 比 hashlib 轻得多）"""
+    with open(path, 'rb') as f:
+        content = f.read()
+    return "{}-{:08x}".format(len(content), zlib.crc32(content))
+
+
+def compile_index(recipes: List[Dict[str, Any]], digest: str = "") -> Dict[str, Any]:
+    """把配方列表编译为索引数据（可 pickle 的纯字典/列表）"""
+    records = {}
+    order = []
+    for recipe in recipes:
+        record = {field: _intern(recipe.get(field)) for field in RECIPE_FIELDS}
+        record["level"] = {_intern(tech): level for tech, level in recipe["level"].items()}
+        record["filters"] = tuple(_intern(name) for name in recipe.get("filters") or [])
+        for field in INGREDIENT_LISTS:
+            record[field] = _pack_ingredients(recipe.get(field) or [])
+        records[record["name"]] = record
+        order.append(record["name"])
+
+    canonical = {name: name for name, record in records.items() if record["product"] == name}
+    aliases: Dict[str, str] = {}
+    # 先放产物和显示名，再用配方名覆盖：配方名总是指向自己
+    for name in order:
+        record = records[name]
+        for alias in (record["display_name_zh"], record["display_name_en"], record["product"]):
+            if alias and (alias not in aliases or canonical.get(record["product"]) == name):
+                aliases[alias] = name
+    for name in order:
+        aliases[name] = name
+
+    used_in: Dict[str, List[str]] = {}
+    by_tech: Dict[str, Dict[int, List[str]]] = {}
+    for name in order:
+        record = records[name]
+        for ingredient in record["ingredients"]:
+            used_in.setdefault(ingredient[0], []).append(name)
+        for tech, level in record["level"].items():
+            by_tech.setdefault(tech, {}).setdefault(level, []).append(name)
+
+    return {
+        "version": RECIPE_INDEX_VERSION,
+        "source_digest": digest,
+        "order": order,
+        "recipes": records,
+        "aliases": aliases,
+        "used_in": used_in,
+        "by_tech": by_tech
+    }
+
+
+def write_index(source_path: str, index_path: str) -> Dict[str, Any]:
+    """编译并写入索引文件"""
+    with open(source_path, 'r', encoding='utf-8') as f:
+        recipes = json.load(f)
+    data = compile_index(recipes, source_digest(source_path))
+    _dump(data, index_path)
+    return data
+
+
+def _dump(data: Dict[str, Any], index_path: str):
+    """原子地写入索引文件：先写临时文件再替换"""
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, index_path)
+
+
+class RecipeIndex:
+    """只读的配方索引"""
+
+    def __init__(self, data: Dict[str, Any], source: str = "index"):
+        self.source = source  # "index" 或回退时的 "json"
+        self.order: List[str] = data["order"]
+        self.recipes: Dict[str, Dict[str, Any]] = data["recipes"]
+        self.aliases: Dict[str, str] = data["aliases"]
+        self.used_in: Dict[str, List[str]] = data["used_in"]
+        self.by_tech: Dict[str, Dict[int, List[str]]] = data["by_tech"]
+        self.lower_aliases: Optional[Dict[str, str]] = None
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __contains__(self, name: str) -> bool:
+        return self.resolve(name) is not None
+
+    def resolve(self, name: str) -> Optional[str]:
+        """把配方名 / prefab / 英文名 / 中文名解析为配方名；先精确匹配，再忽略大小写"""
+        if name in self.aliases:
+            return self.aliases[name]
+        if self.lower_aliases is None:
+            self.lower_aliases = {alias.lower(): target for alias, target in self.aliases.items()}
+        return self.lower_aliases.get(name.strip().lower())
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        resolved = self.resolve(name)
+        return self.recipes[resolved] if resolved is not None else None
+
+    def ingredients(self, name: str) -> Optional[List[Dict[str, Any]]]:
+        """配方的原料，格式与 recipes_merged_processed.json 相同"""
+        recipe = self.get(name)
+        return unpack_ingredients(recipe["ingredients"]) if recipe is not None else None
+
+    def canonical(self, product: str) -> Optional[Dict[str, Any]]:
+        """产物的标准配方 (name == product)，没有则返回 None"""
+        recipe = self.recipes.get(product)
+        return recipe if recipe is not None and recipe["product"] == product else None
+
+    def iter_recipes(self):
+        """按原始文件顺序遍历配方"""
+        for name in self.order:
+            yield self.recipes[name]
+
+
+_index: Optional[RecipeIndex] = None
+_index_lock = threading.Lock()
+
+
+def _load(source_path: str, index_path: str) -> RecipeIndex:
+    digest = source_digest(source_path)
+    try:
+        with open(index_path, 'rb') as f:
+            data = pickle.load(f)
+        if isinstance(data, dict) and data.get("version") == RECIPE_INDEX_VERSION \
+                and data.get("source_digest") == digest:
+            return RecipeIndex(data)
+    except FileNotFoundError:
+        pass  # 第一次运行，下面生成
+    except Exception as e:
+        # 旧版本或损坏的 pickle 可能抛出任意异常（ValueError、ImportError、TypeError ...）
+        print(f"警告: 无法读取配方索引 {index_path}: {e}，将重新生成。")
+    with open(source_path, 'r', encoding='utf-8') as f:
+        recipes = json.load(f)
+    data = compile_index(recipes, digest)
+    try:
+        _dump(data, index_path)
+    except OSError as e:
+        print(f"警告: 无法写入配方索引 {index_path}: {e}")
+    return RecipeIndex(data, source="json")
+
+
+def get_recipe_index() -> RecipeIndex:
+    """第一次调用时加载索引，之后在进程内共享"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = _load(settings.RECIPE_LIST_FILE_PATH, settings.RECIPE_INDEX_FILE_PATH)
+    return _index
+
+
+if __name__ == "__main__":
+    # 冷启动对比：在新进程中分别用旧方式（解析 JSON + 四个别名字典）和预编译索引加载，记录耗时和峰值 RSS (VmHWM，仅 Linux)
+    import subprocess
+    import sys
+
+    legacy = '''
+import json, time
+start = time.perf_counter()
+with open({source!r}, "r", encoding="utf-8") as f:
+    recipe_list = json.load(f)
+recipe_to_ingredients = {{}}
+for recipe in recipe_list:
+    recipe_to_ingredients[recipe["name"]] = recipe["ingredients"]
+    recipe_to_ingredients[recipe["product"]] = recipe["ingredients"]
+    recipe_to_ingredients[recipe["display_name_en"]] = recipe["ingredients"]
+    recipe_to_ingredients[recipe["display_name_zh"]] = recipe["ingredients"]
+elapsed = time.perf_counter() - start
+print(elapsed * 1000, open("/proc/self/status").read().split("VmHWM:")[1].split()[0])
+'''
+    indexed = '''
+import pickle, time, zlib
+start = time.perf_counter()
+with open({source!r}, "rb") as f:
+    digest = zlib.crc32(f.read())  # 与 _load 一样校验索引是否过期
+with open({index!r}, "rb") as f:
+    data = pickle.load(f)
+elapsed = time.perf_counter() - start
+print(elapsed * 1000, open("/proc/self/status").read().split("VmHWM:")[1].split()[0])
+'''
+    baseline = '''
+print(0, open("/proc/self/status").read().split("VmHWM:")[1].split()[0])
+'''
+    source = settings.RECIPE_LIST_FILE_PATH
+    index = settings.RECIPE_INDEX_FILE_PATH
+    if not os.path.exists(index):
+        write_index(source, index)
+
+    def run(code, rounds=5):
+        samples = [subprocess.run([sys.executable, "-c", code.format(source=source, index=index)],
+                                  capture_output=True, text=True, check=True).stdout.split()
+                   for _ in range(rounds)]
+        return min(float(ms) for ms, _ in samples), min(int(rss) for _, rss in samples)
+
+    _, base_rss = run(baseline)
+    legacy_ms, legacy_rss = run(legacy)
+    index_ms, index_rss = run(indexed)
+    print(f"source {os.path.getsize(source) / 1024:.0f} KiB, index {os.path.getsize(index) / 1024:.0f} KiB")
+    print(f"JSON + alias dict: {legacy_ms:.1f} ms, +{(legacy_rss - base_rss) / 1024:.1f} MiB RSS")
+    print(f"precompiled index: {index_ms:.1f} ms, +{(index_rss - base_rss) / 1024:.1f} MiB RSS")
@@ -1,47 +1,51 @@
-import re
 import json
 import os
 import threading
 import time
-import uuid
 from ..config.settings import settings
+from .parse_tool import READ_ONLY_TOOLS
+from .crafting_planner import get_crafting_planner
+from .name_resolver import NameResolver, get_prefab_resolver, get_recipe_resolver, resolve_in, resolve_recipe_name
+from .action_validator import ActionValidator, iter_possessions
+from .action_parser import ActionParseError, parse_action
+from .macro_runner import MacroRunner
+from .craft_feasibility import PROTOTYPER_RADIUS, PROTOTYPER_TECH, get_feasibility_matrix, nearby_tech_levels
+from .recipe_index import get_recipe_index
+from ..utils.spatial_index import SpatialIndexCache
+from ..utils.world_memory import get_world_memory
+from ..utils.ttl_set import TTLSet
+
+TREE_PREFABS = ["evergreen", "evergreen_tall", "evergreen_normal", "evergreen_short",
+                "deciduoustree", "deciduoustree_tall", "deciduoustree_normal", "deciduoustree_short"]
+
+# explore 的搜索词模糊匹配 prefab 时的最低分数：比配方更严格，避免把 rock2 之类未见过的 prefab 匹配成 rocks
+EXPLORE_MIN_SCORE = 0.85
+
+# find_nearest 可按这些布尔字段筛选实体
+ENTITY_CAPABILITIES = ("Choppable", "Mineable", "Collectable", "Pickable", "Diggable", "Hammerable",
+                       "Harvestable", "Edible", "Cookable", "Fuel", "Equippable")
+
+
+def expand_search_terms(names):
+    """
+    把模型给出的实体名扩展为可能的 prefab 集合（例如 tree -> 各种树，grass <-> cutgrass）
+    """
+    original_entity_list = [name.strip() for name in names if name.strip()]
+    entity_list = []
+    for name in original_entity_list:
+        if name == "cutgrass" or name == "grass":
+            entity_list.append("grass")
+            entity_list.append("cutgrass")
+        elif name == "twig" and "twigs" not in original_entity_list:
+            entity_list.append("twigs")
+        elif name == "goldnuggets"or name == "goldnugget" or name == "rock2":
+            entity_list.append("goldnugget")
+            entity_list.append("rock2")
+        elif "tree" in name:
+            entity_list += TREE_PREFABS
+        entity_list.append(name)
+    return list(set(entity_list))
 
-def parse_action_str(action_str):
-    # 解析动作字符串以提取动作类型 (Action) 和操作对象 (InvObject)
-    # 示例：Action(BUILD, -, -, -, axe)
-    action_match = re.match(r'Action\(([^,]+),\s*(\d+|-),\s*([^,]+),\s*([^,]+),\s*([^,]+)\)\s*=\s*(\d+|-)', action_str)
-    if action_match:
-        action_type = action_match.group(1) # 例如：BUILD
-        inv_object = action_match.group(2) # 例如：axe
-        posX = action_match.group(3)
-        posZ = action_match.group(4)
-        recipe = action_match.group(5)
-        target = action_match.group(6)
-    else:
-        # 如果解析失败或模式不匹配，提供回退值并记录警告
-        action_type = "UNKNOWN"
-        inv_object = "-"
-        print(f"警告: 无法解析动作字符串: {action_str}")
-        return "警告: 无法解析动作字符串: {action_str}"
-
-    # 清空并更新共享的 current_action 字典
-    # 使用 clear() 和 update() 确保修改的是同一个字典对象，而不是创建新对象
-    # 生成一个4位数的uuid作为action的唯一标识
-    auid = str(uuid.uuid4())[:4]
-    action_obj = {
-        "Type": "Action",
-        "Action": action_type,
-        "InvObject": inv_object,
-        "Recipe": recipe,
-        "Name": action_str, # 使用完整的动作字符串作为 Name
-        "PosX": posX,
-        "Target": target,
-        "PosZ": posZ,
-        "WFN": action_str, # 使用完整的动作字符串作为 WFN
-        "AUID": auid # 使用完整的动作字符串作为 AUID
-    }
-    return action_obj
-    
 
 class ToolExecutor:
     """
@@ -56,46 +60,54 @@ class ToolExecutor:
         self.map_file_path = settings.MAP_FILE_PATH
         self.map = self.load_map() # 初始化时从文件加载地图
         self.self_uid = self_uid
-        self.observed_guids = []
-        self.start_cleanup_timer()  # 启动定时清理
+        self.observed_guids = TTLSet(settings.OBSERVER_CLEANUP_INTERVAL)  # 已经报告过的实体，过期后可再次报告
+        self.last_inventory_counts = None  # 用于计算观察之间的物品栏变化
+        self.spatial_cache = SpatialIndexCache()  # Vision 更新后按需重建
+        self.world_memory = get_world_memory()
+        self.seen_prefabs = NameResolver()  # 本会话在视野和世界记忆中见过的 prefab，不进入进程共享的解析器
+        self.action_validator = ActionValidator()
+        self.macro_runner = MacroRunner(self)
+        self.event_manager = None  # 由 Session 设置；探索结果经它的送出线程与事件消息按顺序送给模型
+        self.closed = False
         print(f"ToolExecutor 初始化，动作队列: {self.action_queue} 和 感知字典：{self.shared_perception_dict}")
 
-        # Add attributes for managing the observer thread
-        self.observer_thread = None
-        self.observer_stop_event = threading.Event()
-        self.pathfind_thread = None
-        self.pathfind_stop_event = threading.Event()
-        # 初始化时从文件加载recipe_list
-        self.recipe_to_ingredients = self.load_recipe_to_ingredients()
-    
-    def load_recipe_to_ingredients(self):
-        with open(settings.RECIPE_LIST_FILE_PATH, 'r', encoding='utf-8') as f:
-            recipe_list = json.load(f)
-        recipe_to_ingredients = {}
-        for recipe in recipe_list:
-            recipe_to_ingredients[recipe["name"]] = recipe["ingredients"]
-            recipe_to_ingredients[recipe["product"]] = recipe["ingredients"]
-            recipe_to_ingredients[recipe["display_name_en"]] = recipe["ingredients"]
-            recipe_to_ingredients[recipe["display_name_zh"]] = recipe["ingredients"]
-        return recipe_to_ingredients
+        # 探索订阅在每次感知到达时由 on_perception 评估，不再为每个观察者开线程
+        self.subscription_lock = threading.Lock()
+        self.explore_subscription = None
+        self.pathfind_active = False
+
+    @property
+    def recipe_index(self):
+        """预编译的配方索引，第一次查询配方时才加载（进程内共享）"""
+        return get_recipe_index()
     
     def _has_explore_action(self):
-        """检查是否正在探索（观察者线程是否在运行）"""
-        return self.observer_thread is not None and self.observer_thread.is_alive()
+        """检查是否正在探索（是否有探索订阅）"""
+        return self.explore_subscription is not None
 
     def _has_pathfind_action(self):
-        """检查是否正在探索（观察者线程是否在运行）"""
-        return self.pathfind_thread is not None and self.pathfind_thread.is_alive()
-    
-    def clear_observed_guids(self):
-        print("Clearing observed_guids...")
-        self.observed_guids.clear()  # 清空集合
-        self.start_cleanup_timer()  # 递归调用，实现循环
-
-    def start_cleanup_timer(self):
-        timer = threading.Timer(settings.OBSERVER_CLEANUP_INTERVAL, self.clear_observed_guids)
-        timer.daemon = True  # 设为守护线程（主线程退出时自动结束）
-        timer.start()
+        """检查是否正在前往目的地"""
+        return self.pathfind_active
+
+    def cancel_explore(self):
+        """取消探索订阅（不发送 STOP 动作），返回之前是否在探索"""
+        with self.subscription_lock:
+            was_exploring = self.explore_subscription is not None
+            self.explore_subscription = None
+        return was_exploring
+
+    def cancel_pathfind(self):
+        """结束寻路状态（不发送 STOP 动作），返回之前是否在寻路"""
+        with self.subscription_lock:
+            was_pathfinding = self.pathfind_active
+            self.pathfind_active = False
+        return was_pathfinding
+
+    def shutdown(self):
+        """取消探索订阅和寻路状态，供会话回收使用"""
+        self.closed = True
+        self.cancel_explore()
+        self.cancel_pathfind()
     
     def load_map(self):
         """
@@ -125,248 +137,409 @@ class ToolExecutor:
         with open(self.map_file_path, 'w', encoding='utf-8') as f:
             json.dump(self.map, f, ensure_ascii=False, indent=4)
 
-    def executeTool(self, content_blocks):
-
+    def executeTool(self, content_blocks, results=None):
+        """
+        执行回复中的工具块，返回合并后的观察文本。
+        results 不为 None 时，各工具的 (名称, 结果) 依次追加到其中，供上下文压缩定位快照；
+        结果不保存在执行器上，后台总结等其它线程同时调用工具时互不影响。
+        """
         # print(f"正在执行工具，内容块: {content_blocks}")
-        for block in content_blocks:
-            # 检查当前块是否是类型为 'tool_use' 且名称为 'perform_action' 的工具指令
-            if block.get('type') == 'tool_use':
-                action_name = block.get('name')
-                if action_name == 'do':
-                    return self.execute_do(block)
-                elif action_name == 'check_inventory':
-                    return self.execute_check_inventory(block)
-                elif action_name == 'check_equipslots':
-                    fields_to_keep = {"GUID", "Prefab"}
-                    inventory = [
-                        {key: item[key] for key in fields_to_keep if key in item}
-                        for item in self.shared_perception_dict["Possessions"]["EquipSlots"]
-                    ]
-                    return "You are equipped with:\n" + json.dumps(inventory, sort_keys=True)
-                elif action_name == 'check_surroundings':
-                    fields_to_keep = {"GUID", "Hammerable", "Mineable", "Choppable", "Collectable", "Quantity", "Prefab", "X", "Z"}
-                    inventory = [
-                        {key: item[key] for key in fields_to_keep if key in item}
-                        for item in self.shared_perception_dict["Vision"]
-                    ]
-                    return "There are the following entities near you:\n" + json.dumps(inventory, sort_keys=True)
-                elif action_name == 'task_completion':
-                    return
-                elif action_name == 'mark_loc':
-                    loc_name = block.get('params')['name']
-                    self.map[loc_name] = json.dumps(block.get('params'))
-                    self.save_map() # 在标记位置后保存地图
-                    return "The location {} has been marked".format(loc_name)
-                elif action_name == 'check_map':
-                    return "The map has the following locations:\n" + json.dumps(self.map, sort_keys=True)
-                elif action_name == 'check_self_GUID':
-                    return "You GUID is: " + str(self.self_uid)
-                # elif action_name == 'observer':
-                #     return self.execute_observer(block)
-                elif action_name == 'explore':
-                    return self.execute_observer(block)
-                elif action_name == 'check_recipe':
-                    return self.execute_check_recipe(block)
-                elif action_name == 'check_status':
-                    return self.check_status()
-                elif action_name == 'stop_explore':
-                    return self.stop_explore()
-                elif action_name == 'stop_pathfind':
-                    return self.stop_pathfind()
-
-        print("在内容块中未找到工具使用指令。")
+        tool_blocks = [block for block in content_blocks if block.get('type') == 'tool_use']
+        if results is None:
+            results = []
+        if not tool_blocks:
+            print("在内容块中未找到工具使用指令。")
+            return
+
+        if not settings.MULTI_TOOL_TURNS or len(tool_blocks) == 1:
+            result = self._execute_block(tool_blocks[0])
+            if result:
+                results.append((tool_blocks[0].get('name'), result))
+            return result
+
+        # 同一条回复中的只读工具一次执行完，结果合并为一条观察；
+        # 遇到第一个会改变游戏状态的工具时执行它并结束
+        observations = []
+        for block in tool_blocks:
+            result = self._execute_block(block)
+            if result:
+                observations.append("[{}]\n{}".format(block.get('name'), result))
+                results.append((block.get('name'), result))
+            if block.get('name') not in READ_ONLY_TOOLS:
+                break
+        return "\n\n".join(observations) if observations else None
+
+    def _execute_block(self, block):
+        """执行单个工具块并返回给模型的观察文本"""
+        action_name = block.get('name')
+        if action_name == 'do':
+            return self.execute_do(block)
+        elif action_name == 'check_inventory':
+            return self.execute_check_inventory(block)
+        elif action_name == 'check_equipslots':
+            fields_to_keep = {"GUID", "Prefab"}
+            inventory = [
+                {key: item[key] for key in fields_to_keep if key in item}
+                for item in self.shared_perception_dict["Possessions"]["EquipSlots"]
+            ]
+            return "You are equipped with:\n" + json.dumps(inventory, sort_keys=True)
+        elif action_name == 'find_nearest':
+            return self.execute_find_nearest(block)
+        elif action_name == 'recall':
+            return self.execute_recall(block)
+        elif action_name == 'check_surroundings':
+            fields_to_keep = {"GUID", "Hammerable", "Mineable", "Choppable", "Collectable", "Quantity", "Prefab", "X", "Z"}
+            inventory = [
+                {key: item[key] for key in fields_to_keep if key in item}
+                for item in self.shared_perception_dict["Vision"]
+            ]
+            return "There are the following entities near you:\n" + json.dumps(inventory, sort_keys=True)
+        elif action_name == 'task_completion':
+            return
+        elif action_name == 'mark_loc':
+            loc_name = block.get('params')['name']
+            self.map[loc_name] = json.dumps(block.get('params'))
+            self.save_map() # 在标记位置后保存地图
+            return "The location {} has been marked".format(loc_name)
+        elif action_name == 'check_map':
+            return "The map has the following locations:\n" + json.dumps(self.map, sort_keys=True)
+        elif action_name == 'check_self_GUID':
+            return "You GUID is: " + str(self.self_uid)
+        # elif action_name == 'observer':
+        #     return self.execute_observer(block)
+        elif action_name == 'explore':
+            return self.execute_observer(block)
+        elif action_name == 'check_recipe':
+            return self.execute_check_recipe(block)
+        elif action_name == 'plan_craft':
+            return self.execute_plan_craft(block)
+        elif action_name == 'check_craftable':
+            return self.execute_check_craftable(block)
+        elif action_name == 'check_status':
+            return self.check_status()
+        elif action_name == 'stop_explore':
+            return self.stop_explore()
+        elif action_name == 'stop_pathfind':
+            return self.stop_pathfind()
+        elif action_name == 'macro':
+            return self.execute_macro(block)
+        elif action_name == 'stop_macro':
+            return self.stop_macro()
 
     def stop_explore(self):
-        if self._has_explore_action():
-            self.observer_stop_event.set()
-            # 检查当前线程是否是观察者线程，避免自己join自己
-            if threading.current_thread() != self.observer_thread:
-                self.observer_thread.join(timeout=0.5)
-            self.action_queue.put_action(parse_action_str("Action(STOP, -, -, -, -) = -"))
+        if self.cancel_explore():
+            self.action_queue.put_action(parse_action("Action(STOP, -, -, -, -) = -").to_dict(), urgent=True)
             return "Exploration stopped."
         else:
             return "No exploration in progress."
     
+    def stop_macro(self):
+        if self.macro_runner.cancel():
+            self.action_queue.put_action(parse_action("Action(STOP, -, -, -, -) = -").to_dict(), urgent=True)
+            return "Macro stopped."
+        else:
+            return "No macro in progress."
+
+    def execute_macro(self, block):
+        """启动动作宏：给出 actions 时按顺序执行，给出 repeat 时对最近的匹配实体重复执行"""
+        if self._has_explore_action() or self._has_pathfind_action():
+            return "Cannot start a macro while exploring or going towards a destination. Stop it first."
+        params = block.get('params', {})
+        if params.get('actions'):
+            return self.macro_runner.start_sequence(params['actions'].splitlines())
+        if params.get('repeat'):
+            try:
+                count = int(params.get('count') or 3)
+                radius = float(params['radius']) if params.get('radius') else None
+            except ValueError:
+                return "count must be an integer and radius must be a number."
+            prefab = params.get('prefab', '')
+            prefabs = expand_search_terms(self.resolve_prefabs(prefab.split(','))) if prefab.strip() else []
+            return self.macro_runner.start_repeat(params['repeat'], prefabs, count, radius)
+        return "You should specify either actions or repeat for the macro."
+
     def stop_pathfind(self):
-        if self._has_pathfind_action():
-            self.pathfind_stop_event.set()
-            # 检查当前线程是否是路径查找线程，避免自己join自己
-            if threading.current_thread() != self.pathfind_thread:
-                self.pathfind_thread.join(timeout=0.5)
-            self.action_queue.put_action(parse_action_str("Action(STOP, -, -, -, -) = -"))
+        if self.cancel_pathfind():
+            self.action_queue.put_action(parse_action("Action(STOP, -, -, -, -) = -").to_dict(), urgent=True)
             return "Pathfinding stopped."
         else:
             return "No pathfinding in progress."
 
+    def spatial_index(self):
+        """当前 Vision 的空间索引（感知未更新时复用上次构建的索引）"""
+        return self.spatial_cache.get(self.shared_perception_dict)
+
+    def player_position(self):
+        """返回角色当前坐标 (x, z)，感知尚未到达时返回 None"""
+        try:
+            return float(self.shared_perception_dict["PosX"]), float(self.shared_perception_dict["PosZ"])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def execute_find_nearest(self, block):
+        """按 prefab 和/或能力查询最近的若干实体，只返回精简字段"""
+        params = block.get('params', {})
+        prefab = params.get('prefab', '').strip()
+        capability = params.get('capability', '').strip()
+        if not prefab and not capability:
+            return "You should specify a prefab or a capability to search for."
+
+        if capability:
+            matched = [name for name in ENTITY_CAPABILITIES if name.lower() == capability.lower()]
+            if not matched:
+                return "Unknown capability {}. Available capabilities: {}".format(capability, ", ".join(ENTITY_CAPABILITIES))
+            capability = matched[0]
+
+        try:
+            count = max(1, int(params.get('count') or 3))
+            radius = float(params['radius']) if params.get('radius') else None
+        except ValueError:
+            return "count must be an integer and radius must be a number."
+
+        position = self.player_position()
+        if position is None:
+            return "Your position is not available yet."
+
+        prefabs = expand_search_terms(prefab.split(',')) if prefab else None
+        results = self.spatial_index().nearest(position[0], position[1], prefabs=prefabs,
+                                               capability=capability or None, count=count, radius=radius)
+        target = " ".join(part for part in (capability, prefab) if part)
+        if not results:
+            return "No {} found in your surroundings.".format(target)
+        entities = [
+            {"GUID": entity.get("GUID"), "Prefab": entity.get("Prefab"), "Quantity": entity.get("Quantity", 1),
+             "X": round(float(entity["X"]), 1), "Z": round(float(entity["Z"]), 1), "Dist": round(dist, 1)}
+            for dist, entity in results
+        ]
+        return "The nearest {} (you are at x: {}, z: {}):\n".format(target, *position) + json.dumps(entities)
+
+    def execute_recall(self, block):
+        """查询世界记忆中离开视野的实体"""
+        params = block.get('params', {})
+        prefab = params.get('prefab', '').strip()
+        if not prefab:
+            return "You should specify the prefab you want to recall."
+        try:
+            count = max(1, int(params.get('count') or 3))
+        except ValueError:
+            return "count must be an integer."
+
+        position = self.player_position()
+        x, z = position if position is not None else (None, None)
+        results = self.world_memory.recall(expand_search_terms(prefab.split(',')), x, z, count=count)
+        if not results:
+            return "You don't remember seeing any {}.".format(prefab)
+        return "You remember seeing {} at (today is day {}):\n".format(prefab, self.world_memory.current_day) + json.dumps(results)
+
+    def resolve_recipe(self, name: str):
+        """配方名 / 英文名 / 中文名（允许拼写错误）-> 配方名，无法确定时返回 None"""
+        return resolve_recipe_name(name)
+
+    @staticmethod
+    def recipe_not_found(name: str) -> str:
+        suggestions = get_recipe_resolver().suggest(name)
+        if suggestions:
+            return "Recipe {} not found. Did you mean: {}?".format(name, ", ".join(suggestions))
+        return "Recipe not found"
+
     def execute_check_recipe(self, block):
-        if block.get('params') == {}:
+        recipe_name = block.get('params', {}).get('recipe', '').strip()
+        if not recipe_name:
             return "You should specify the recipe you want to check."
-        elif block.get('params')['recipe'] not in self.recipe_to_ingredients:
-            return "Recipe not found"
-        else:
-            recipe_name = block.get('params')['recipe']
-            return "The recipe {} is available.".format(recipe_name) + "\n" + json.dumps(self.recipe_to_ingredients[recipe_name], sort_keys=True, ensure_ascii=False)
+        name = self.resolve_recipe(recipe_name)
+        if name is None:
+            return self.recipe_not_found(recipe_name)
+        header = "The recipe {} is available.".format(name)
+        if self.recipe_index.resolve(recipe_name) is None:
+            header = "The recipe {} (closest match for '{}') is available.".format(name, recipe_name)
+        return header + "\n" + json.dumps(self.recipe_index.ingredients(name), sort_keys=True, ensure_ascii=False)
+
+    def execute_plan_craft(self, block):
+        """展开完整的合成路线，并扣除当前持有的物品"""
+        params = block.get('params', {})
+        recipe_name = params.get('recipe', '').strip()
+        if not recipe_name:
+            return "You should specify the recipe you want to plan."
+        try:
+            amount = max(1, int(params.get('amount') or 1))
+        except ValueError:
+            return "amount must be an integer."
+        name = self.resolve_recipe(recipe_name)
+        if name is None:
+            return self.recipe_not_found(recipe_name)
+        planner = get_crafting_planner()
+        return planner.format_plan(planner.plan(name, self.inventory_counts(), amount))
+
+    def nearby_tech_levels(self) -> dict:
+        """角色附近（PROTOTYPER_RADIUS 内）的制作站提供的科技等级"""
+        position = self.player_position()
+        if position is None:
+            return {}
+        nearby = self.spatial_index().within_radius(position[0], position[1], PROTOTYPER_RADIUS, prefabs=PROTOTYPER_TECH)
+        return nearby_tech_levels(entity.get("Prefab") for _, entity in nearby)
+
+    def execute_check_craftable(self, block):
+        """用可行性矩阵一次性判断当前物品栏能制作哪些配方"""
+        matrix = get_feasibility_matrix()
+        inventory = self.inventory_counts()
+        recipe_name = block.get('params', {}).get('recipe', '').strip()
+        if recipe_name:
+            name = self.resolve_recipe(recipe_name)
+            if name is None:
+                return self.recipe_not_found(recipe_name)
+            if name not in matrix.row_of:
+                return "Recipe {} is character-specific or needs no ingredients.".format(name)
+            missing = matrix.missing(name, inventory)
+            tech = matrix.required_tech(name)
+            lines = ["You have all the ingredients for {}.".format(name) if not missing else
+                     "You are missing ingredients for {}: {}".format(name, json.dumps(missing, sort_keys=True))]
+            if tech:
+                lines.append("Tech required: " + "; ".join(get_crafting_planner().describe_tech(tech)))
+            return "\n".join(lines)
+
+        tech_levels = self.nearby_tech_levels()
+        with_ingredients = matrix.feasible_mask(inventory)
+        here = with_ingredients & matrix.feasible_mask(inventory, tech_levels)
+        craftable_here = [matrix.names[row] for row in here.nonzero()[0]]
+        needs_station = [matrix.names[row] for row in (with_ingredients & ~here).nonzero()[0]]
+        if not craftable_here and not needs_station:
+            return "You don't have enough ingredients to craft anything."
+        result = "You can craft these here:\n" + \
+            json.dumps(craftable_here)
+        if needs_station:
+            result += "\nYou have the ingredients but need a crafting station nearby for:\n" + json.dumps(needs_station)
+        return result
 
     def execute_observer(self, block):
         """
-        Starts a background thread to observe for a specific item.
+        注册探索订阅：之后每次感知到达都会检查目标实体是否出现在视野中。
         """
         # 检查是否已经在探索
         if self._has_explore_action():
             print(f"[ToolExecutor] Already exploring, cannot start new observer")
             return "Cannot start observer because exploration is already in progress. Please wait for the current exploration to complete."
-        
-        # Stop any previously running observer thread
-        self.stop_explore()
+        if self.macro_runner.active():
+            return "Cannot start exploring while a macro is running. Wait for it to finish or use <stop_macro></stop_macro> to stop it."
 
         params = block.get('params', {})
         item_to_find = params.get('search')
 
         if not item_to_find:
             return "Observer Error: You must specify the 'search' to look for items."
-        self.action_queue.put_action(parse_action_str("Action(EXPLORE, -, -, -, -) = -"))
+        self.action_queue.put_action(parse_action("Action(EXPLORE, -, -, -, -) = -").to_dict())
 
-        
-        # Clear the stop event for the new thread
-        self.observer_stop_event.clear()
-        
-        # 延迟1秒
-        time.sleep(1) # 延迟一秒，让EXPLORE动作先启动。
-        
-        # Create and start the new observer thread
-        self.observer_thread = threading.Thread(
-            target=self._observe_loop, 
-            args=(item_to_find,),
-            daemon=True  # Daemon threads exit when the main program exits
-        )
-        self.observer_thread.start()
+        entity_list = expand_search_terms(self.resolve_prefabs(item_to_find.split(',')))
+        with self.subscription_lock:
+            self.explore_subscription = {
+                "search": item_to_find,
+                "prefabs": entity_list,
+                # 给 EXPLORE 动作留出启动时间，之前到达的感知不参与匹配
+                "not_before": time.monotonic() + settings.OBSERVER_ARM_DELAY
+            }
+        print(f"[Observer] Started looking for item: '{json.dumps(entity_list, ensure_ascii=False)}'")
 
         # Return a confirmation message to the LLM
         # return f"Observer has been set up. I will now monitor the surroundings for '{item_to_find}' and will notify you when it appears."
         return f"You are now exploring the map, monitoring the surroundings for '{item_to_find}', no `do` tool and explore tool is allowed when exploring."
 
-    def _observe_loop(self, entities_str: str):
+    def resolve_prefabs(self, names):
         """
-        The actual loop that runs in the background thread.
+        在模型给出的名字之外，补充模糊解析到的 prefab（中英文名、拼写错误），
+        候选来自配方数据以及本会话在视野和世界记忆中见过的 prefab。
         """
-        trees = ["evergreen", "evergreen_tall", "evergreen_normal", "evergreen_short",
-        "deciduoustree", "deciduoustree_tall", "deciduoustree_normal", "deciduoustree_short"]
-
-        original_entity_list = [name.strip() for name in entities_str.split(',') if name.strip()]
-        entity_list = []
-        for name in original_entity_list:
-            if name == "cutgrass" or name == "grass":
-                entity_list.append("grass")
-                entity_list.append("cutgrass")
-            elif name == "twig" and "twigs" not in original_entity_list:
-                entity_list.append("twigs")
-            elif name == "goldnuggets"or name == "goldnugget" or name == "rock2":
-                entity_list.append("goldnugget")
-                entity_list.append("rock2")
-            elif "tree" in name:
-                entity_list += trees
-            entity_list.append(name)
-        entity_list = list(set(entity_list))
-        print(f"[Observer] Started looking for item: '{json.dumps(entity_list, ensure_ascii=False)}'")
+        for prefab in list(self.spatial_index().by_prefab) + list(self.world_memory.known_prefabs()):
+            if prefab:
+                self.seen_prefabs.add(prefab, prefab)
+        resolvers = (get_prefab_resolver(), self.seen_prefabs)
+        result = [name.strip() for name in names if name.strip()]
+        for name in list(result):
+            prefab = resolve_in(resolvers, name, min_score=EXPLORE_MIN_SCORE)
+            if prefab and prefab not in result:
+                result.append(prefab)
+        return result
 
+    def on_perception(self):
+        """
+        感知更新后调用：评估探索订阅，找到目标时结束探索并通知模型。
+        """
+        subscription = self.explore_subscription
+        if subscription is None or time.monotonic() < subscription["not_before"]:
+            return
 
-        while not self.observer_stop_event.is_set():
-            try:
-                # Safely get the list of visible items
-                vision_items = self.shared_perception_dict.get("Vision", [])
-                
-                if not vision_items:
-                    time.sleep(0.5) # Wait if perception data is not yet available
-                    continue
-                
-                found_item_list = []
-                for item in vision_items:
-                    found_item_name = item.get("Prefab")
-                    if item and item.get("Prefab") in entity_list and item.get("GUID") not in self.observed_guids:
-                        
-                        self.observed_guids.append(item.get("GUID"))
-                        if (item.get("Prefab") == "grass" or item.get("Prefab") == "twigs") and item.get("Collectable") == False:
-                            continue
-                        print(f"[Observer] Found '{found_item_name}'!")
-                        found_item_list.append({"GUID": item.get("GUID"), "Prefab": found_item_name})
-
-                
-                if len(found_item_list) > 0:
-                    # Construct the new prompt for the LLM
-                    prompt = (f"Observer Shutting down: The item you were waiting for, '{json.dumps(found_item_list)}', "
-                                f"is now in your surroundings. You can proceed with the next action. You may set up the observer again if you are done with your action.")
-                    
-                    # Use the stored task_instance to call processStream
-                    
-                    self.action_queue.clear_queue()
-                    self.stop_explore()
-                    self.task_instance.processStream(prompt)
-                    self.dialog_queue.put_dialog(f"I found {json.dumps(found_item_list)}")
-                    # Job is done, exit the thread
-                    return 
-                
-                # Wait for 1 second before checking again to avoid high CPU usage
-                time.sleep(1)
-
-            except Exception as e:
-                print(f"[Observer] Error in observation loop: {e}")
-                time.sleep(5) # Wait longer if an error occurs
-
-        print(f"[Observer] Stopped for '{entities_str}'.")
+        found_item_list = []
+        # 只取目标 prefab 的桶，不再逐项扫描全部 Vision
+        for item in self.spatial_index().with_prefabs(subscription["prefabs"]):
+            guid = item.get("GUID")
+            if guid in self.observed_guids:
+                continue
+            self.observed_guids.add(guid)
+            if (item.get("Prefab") == "grass" or item.get("Prefab") == "twigs") and item.get("Collectable") == False:
+                continue
+            print(f"[Observer] Found '{item.get('Prefab')}'!")
+            found_item_list.append({"GUID": guid, "Prefab": item.get("Prefab")})
+
+        if not found_item_list:
+            return
+        with self.subscription_lock:
+            if self.explore_subscription is not subscription:
+                return  # 已被取消或替换
+            self.explore_subscription = None
 
+        prompt = (f"Observer Shutting down: The item you were waiting for, '{json.dumps(found_item_list)}', "
+                    f"is now in your surroundings. You can proceed with the next action. You may set up the observer again if you are done with your action.")
+        self.action_queue.clear_queue()
+        self.action_queue.put_action(parse_action("Action(STOP, -, -, -, -) = -").to_dict(), urgent=True)
+        self.dialog_queue.put_dialog(f"I found {json.dumps(found_item_list)}")
+        if self.event_manager is not None:
+            # 作为紧急观察送出：打断当前推理，与其它事件消息共用送出线程，不会并发调用 processStream
+            self.event_manager.submit(prompt, urgent=True)
+        else:
+            self.task_instance.processStreamAsync(prompt)
 
-    
     def execute_do(self, block):
 
-        action_obj = parse_action_str(block.get('content'))
-
-        if type(action_obj) is str:
-            return action_obj
+        try:
+            action_obj = parse_action(block.get('content')).to_dict()
+        except ActionParseError as e:
+            return "Could not parse the action '{}': {}".format((block.get('content') or '').strip(),
+                                                                  json.dumps(e.to_dict(), ensure_ascii=False))
             
         # 检查是否正在探索
         if self._has_explore_action():
             print(f"[ToolExecutor] Currently exploring, blocking new action: {action_obj.get('Action')}")
             return f"Action '{action_obj.get('Action')}' cannot be added because exploration is currently in progress. Please wait for the exploration to complete or use <stop_explore></stop_explore> to stop the exploration."
         
+        if self.macro_runner.active():
+            return f"Action '{action_obj.get('Action')}' cannot be added because a macro is running. Please wait for the macro to finish or use <stop_macro></stop_macro> to stop it."
+
         if self._has_pathfind_action():
             print(f"[ToolExecutor] Currently going towards the destination, blocking new action: {action_obj.get('Action')}")
             return f"Action '{action_obj.get('Action')}' cannot be added because you are currently going towards the destination. Please wait for the pathfinding to complete or use <stop_pathfind></stop_pathfind> to stop the pathfinding."
         
         # 检查队列大小限制
-        if self.action_queue.get_stats()["queue_size"] > settings.ACTION_ALLOWED_NUM:
-            return
+        queue_size = self.action_queue.get_stats()["queue_size"]
+        if queue_size > settings.ACTION_ALLOWED_NUM:
+            return f"Action '{action_obj.get('Action')}' was not added: {queue_size} actions are still waiting in the queue. Wait for them to finish first."
         
+        # 对照当前感知和配方校验参数，失败时立即返回结构化错误，不必等游戏的 Action-Failed 事件
+        error = self.action_validator.validate(action_obj, self.shared_perception_dict, self.spatial_index(), self.self_uid)
+        if error is not None:
+            return "Action '{}' was rejected: {}".format(action_obj.get("Name"), json.dumps(error.to_dict(), ensure_ascii=False))
+
         # 添加动作到队列
-        self.action_queue.put_action(action_obj)
+        if not self.action_queue.put_action(action_obj):
+            return f"Action '{action_obj.get('Action')}' was not added because the action queue is full."
         
         # requires_approval = params.get('requires_approval') # 这个参数当前未在 current_action 中使用
         if action_obj.get("Action") == "PATHFIND":
-            if self.pathfind_thread and self.pathfind_thread.is_alive():
-                self.pathfind_stop_event.set()
-                # Wait briefly for the old thread to finish
-                self.pathfind_thread.join(timeout=1.0)
-            # Clear the stop event for the new thread
-            self.pathfind_stop_event.clear()
-            # Create and start the new observer thread
-            self.pathfind_thread = threading.Thread(
-                target=self._pathfind_loop,
-                daemon=True  # Daemon threads exit when the main program exits
-            )
-            self.pathfind_thread.start()
+            # 寻路结束由 PATHFIND 事件通知 (EventManager)
+            with self.subscription_lock:
+                self.pathfind_active = True
             return "You are on your way now, output <wait><\wait> if you have nothing to do while the character goes towards the destination."
         if action_obj.get("Action") == "CHOP":
             return "You are now Chopping, send next action to the action queue if you want. Or do other stuffs instead."
         return # "The actions are being performed right now."# 执行第一个工具使用块后即返回，因为用户要求"中止"
     
-    def _pathfind_loop(self):
-        """
-        The actual loop that runs in the background thread.
-        """
-        print(f"[Pathfind] Started going towards the destination")
-        while not self.pathfind_stop_event.is_set():
-            time.sleep(0.1)
-        print(f"[Pathfind] Stopped going towards the destination")
-
     def execute_check_inventory(self, block):
         if block.get('params') == {}:
             fields_to_keep = {"GUID", "Quantity", "Prefab"}
@@ -413,4 +586,34 @@ class ToolExecutor:
                 + "Sanity: " + self.shared_perception_dict["RoleStatus"]["Sanity"] + ', ' \
                 + "Hunger: " + self.shared_perception_dict["RoleStatus"]["Hunger"] + ', ' \
                 + "Moisture: " + self.shared_perception_dict["RoleStatus"]["Moisture"] + ', ' \
-                + "Temperature: " + self.shared_perception_dict["RoleStatus"]["Temperature"]
\ No newline at end of file
+                + "Temperature: " + self.shared_perception_dict["RoleStatus"]["Temperature"]
+
+    def inventory_counts(self) -> dict:
+        """统计物品栏、装备栏和背包中每种物品的数量"""
+        counts = {}
+        for item in iter_possessions(self.shared_perception_dict):
+            if item.get("Prefab"):
+                counts[item["Prefab"]] = counts.get(item["Prefab"], 0) + item.get("Quantity", 1)
+        return counts
+
+    def observation_state(self, include_status=True) -> str:
+        """
+        附加在观察消息后的廉价状态：角色状态与上一次观察以来的物品栏变化，
+        省去模型为此单独调用 check_status / check_inventory。
+        """
+        parts = []
+        if include_status and self.shared_perception_dict.get("RoleStatus"):
+            parts.append(self.check_status())
+
+        counts = self.inventory_counts()
+        previous = self.last_inventory_counts
+        self.last_inventory_counts = counts
+        if previous is not None:
+            changes = []
+            for prefab in sorted(set(counts) | set(previous)):
+                diff = counts.get(prefab, 0) - previous.get(prefab, 0)
+                if diff:
+                    changes.append("{:+d} {}".format(diff, prefab))
+            if changes:
+                parts.append("Inventory changes: " + ", ".join(changes))
+        return "\n".join(parts)
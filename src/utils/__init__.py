@@ -3,6 +3,14 @@ Utils module for DST Agent Brain
 Contains utility classes and helper functions
 """
 
-from .queues import ActionQueue, DialogQueue
+from .queues import ActionQueue, DialogQueue, AsyncWaiters, long_poll
+from .perception_delta import PerceptionStore, PerceptionDeltaEncoder, PerceptionDeltaClient, PerceptionDeltaError
+from .spatial_index import SpatialIndex, SpatialIndexCache
+from .world_memory import WorldMemory, get_world_memory
+from .ttl_set import TTLSet
+from .action_ledger import ActionLedger
 
-__all__ = ['ActionQueue', 'DialogQueue'] 
\ No newline at end of file
+__all__ = ['ActionQueue', 'DialogQueue', 'AsyncWaiters', 'long_poll',
+           'PerceptionStore', 'PerceptionDeltaEncoder', 'PerceptionDeltaClient', 'PerceptionDeltaError',
+           'SpatialIndex', 'SpatialIndexCache', 'WorldMemory', 'get_world_memory',
+           'TTLSet', 'ActionLedger'] 
\ No newline at end of file
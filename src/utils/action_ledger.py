@@ -0,0 +1,164 @@
+"""
+动作生命周期账本
+按 AUID 记录每个动作的入队、被 mod 取走 (/decide/Behaviour) 和完成 (Action-End / Action-Failed 事件)
+的时间，按动作类型统计排队时间、执行时间的分位数和失败率。
+mod 的事件只带回 WFN（规范化的动作字符串），不带 AUID，因此完成事件按 WFN 匹配最早一个尚未完成的同名动作。
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from ..config.settings import settings
+
+LATENCY_KINDS = ("queue_wait", "execution", "total")
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """最近秩法分位数，sorted_values 需已排序且非空"""
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class ActionLedger:
+    """
+    records 只保留最近 max_records 个动作；每种动作类型的延迟样本只保留最近 window 个，
+    分位数在查询时计算。
+    """
+
+    def __init__(self, max_records: Optional[int] = None, window: Optional[int] = None):
+        self.max_records = settings.ACTION_LEDGER_SIZE if max_records is None else max_records
+        self.window = settings.ACTION_LEDGER_WINDOW if window is None else window
+        self.lock = threading.Lock()
+        self.records: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.pending_by_wfn: Dict[str, Deque[str]] = {}  # 尚未完成的动作，按入队顺序
+        self.samples: Dict[str, Dict[str, Deque[float]]] = {}
+        self.outcomes: Dict[str, Dict[str, int]] = {}
+        self.unmatched = 0
+
+    def _type_outcomes(self, action_type: str) -> Dict[str, int]:
+        outcomes = self.outcomes.get(action_type)
+        if outcomes is None:
+            outcomes = self.outcomes[action_type] = {"enqueued": 0, "dispatched": 0, "done": 0, "failed": 0,
+                                                     "discarded": 0}
+        return outcomes
+
+    def _evict(self):
+        while len(self.records) > self.max_records:
+            auid, record = self.records.popitem(last=False)
+            pending = self.pending_by_wfn.get(record["wfn"])
+            if pending is not None and auid in pending:
+                pending.remove(auid)
+                if not pending:
+                    del self.pending_by_wfn[record["wfn"]]
+
+    def enqueued(self, action: Dict[str, Any]):
+        """动作进入队列"""
+        auid = action.get("AUID")
+        if not auid:
+            return
+        record = {"auid": auid, "action": action.get("Action"), "wfn": action.get("WFN"),
+                  "enqueued": time.time(), "dispatched": None, "completed": None, "outcome": None}
+        with self.lock:
+            self.records[auid] = record
+            self.pending_by_wfn.setdefault(record["wfn"], deque()).append(auid)
+            self._type_outcomes(record["action"])["enqueued"] += 1
+            self._evict()
+
+    def dispatched(self, action: Dict[str, Any]):
+        """动作被 mod 取走"""
+        with self.lock:
+            record = self.records.get(action.get("AUID"))
+            if record is None or record["dispatched"] is not None:
+                return
+            record["dispatched"] = time.time()
+            self._type_outcomes(record["action"])["dispatched"] += 1
+
+    def discarded(self, action: Dict[str, Any], reason: str):
+        """动作在被取走之前从队列中移除（清空、取消、过期）"""
+        with self.lock:
+            record = self.records.get(action.get("AUID"))
+            if record is None or record["outcome"] is not None:
+                return
+            self._finish(record, reason)
+            self._type_outcomes(record["action"])["discarded"] += 1
+
+    def completed(self, wfn: str, failed: bool, info: str = "") -> Optional[Dict[str, Any]]:
+        """
+        Action-End / Action-Failed 事件到达：匹配最早一个同 WFN 的未完成动作。
+
+        Returns:
+            匹配到的记录副本，没有匹配时返回 None
+        """
+        now = time.time()
+        with self.lock:
+            pending = self.pending_by_wfn.get(wfn)
+            record = None
+            while pending and record is None:
+                record = self.records.get(pending[0])
+                if record is None or record["outcome"] is not None:
+                    pending.popleft()
+                    record = None
+            if record is None:
+                self.unmatched += 1
+                return None
+            record["completed"] = now
+            if info:
+                record["info"] = info
+            self._finish(record, "failed" if failed else "done")
+            outcomes = self._type_outcomes(record["action"])
+            outcomes["failed" if failed else "done"] += 1
+            samples = self.samples.get(record["action"])
+            if samples is None:
+                samples = self.samples[record["action"]] = {kind: deque(maxlen=self.window) for kind in LATENCY_KINDS}
+            dispatched = record["dispatched"] if record["dispatched"] is not None else record["enqueued"]
+            samples["queue_wait"].append(dispatched - record["enqueued"])
+            samples["execution"].append(now - dispatched)
+            samples["total"].append(now - record["enqueued"])
+            return dict(record)
+
+    def _finish(self, record: Dict[str, Any], outcome: str):
+        """标记结束并移出待完成列表（调用方需持有 self.lock）"""
+        record["outcome"] = outcome
+        pending = self.pending_by_wfn.get(record["wfn"])
+        if pending is not None and record["auid"] in pending:
+            pending.remove(record["auid"])
+            if not pending:
+                del self.pending_by_wfn[record["wfn"]]
+
+    @staticmethod
+    def describe(record: Dict[str, Any]) -> str:
+        """附加在观察消息后的动作来源说明"""
+        parts = ["AUID {}".format(record["auid"])]
+        if record.get("dispatched") is not None:
+            parts.append("waited {:.1f}s".format(record["dispatched"] - record["enqueued"]))
+            parts.append("ran {:.1f}s".format(record["completed"] - record["dispatched"]))
+        else:
+            parts.append("took {:.1f}s".format(record["completed"] - record["enqueued"]))
+        return "[" + ", ".join(parts) + "]"
+
+    def get_stats(self, recent: int = 0) -> dict:
+        """按动作类型的延迟分位数 (毫秒) 和失败率；recent > 0 时附带最近的动作记录"""
+        with self.lock:
+            by_type = {}
+            for action_type, outcomes in self.outcomes.items():
+                finished = outcomes["done"] + outcomes["failed"]
+                entry = dict(outcomes)
+                entry["failure_rate"] = round(outcomes["failed"] / finished, 3) if finished else None
+                for kind, values in self.samples.get(action_type, {}).items():
+                    if values:
+                        ordered = sorted(values)
+                        entry[kind + "_ms"] = {name: round(percentile(ordered, fraction) * 1000, 1)
+                                               for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))}
+                by_type[action_type] = entry
+            stats = {
+                "tracked": len(self.records),
+                "in_flight": sum(len(pending) for pending in self.pending_by_wfn.values()),
+                "unmatched_events": self.unmatched,
+                "by_type": by_type
+            }
+            if recent > 0:
+                stats["recent"] = [dict(record) for record in list(self.records.values())[-recent:]]
+            return stats
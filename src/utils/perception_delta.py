@@ -0,0 +1,312 @@
+"""
+增量感知协议 (Perception Delta Protocol)
+
+客户端第一次（以及每次重同步时）向 /{guid}/perceptions 发送带 "Seq" 的完整快照，
+之后向 /{guid}/perceptions/delta 只发送变化部分：
+
+    {
+        "Version": 1,
+        "Seq": 43,                       # 必须是上一次序号 + 1
+        "Added":   [{完整实体}, ...],
+        "Removed": [GUID, ...],
+        "Changed": [{"GUID": ..., 变化的字段..., "Unset": [被删除的字段名]}, ...],
+        "RoleStatus": {...}              # 其它顶层字段只在变化时出现，整体替换
+    }
+
+实体失去某个组件时，对应字段不再出现在实体中，Changed 用 "Unset" 列出这些字段名
+（Lua 表无法发送 null）。
+服务端发现序号断档时返回 409 {"status": "resync", "expected_seq": n}，客户端随后重发完整快照；
+格式错误的消息返回 400，同时丢弃当前序列，之后的增量都会得到 409，直到客户端重发完整快照。
+"""
+
+import json
+import threading
+import urllib.request
+import urllib.error
+from typing import Dict, Any, Optional, Tuple
+
+PERCEPTION_PROTOCOL_VERSION = 1
+
+# 增量消息中的协议字段，其余顶层字段都视为整体替换
+DELTA_RESERVED_KEYS = {"Version", "Seq", "Added", "Removed", "Changed"}
+# Changed 条目中列出被删除字段的键
+UNSET_KEY = "Unset"
+
+
+class PerceptionDeltaError(ValueError):
+    """快照或增量消息格式错误"""
+
+
+def _parse_seq(seq: Any) -> Optional[int]:
+    if seq is None:
+        return None
+    if isinstance(seq, bool):
+        raise PerceptionDeltaError("Seq must be an integer, got {!r}".format(seq))
+    try:
+        return int(seq)
+    except (TypeError, ValueError):
+        raise PerceptionDeltaError("Seq must be an integer, got {!r}".format(seq)) from None
+
+
+def _validate_delta(delta: Any):
+    """在修改任何状态之前检查增量的结构"""
+    if not isinstance(delta, dict):
+        raise PerceptionDeltaError("A delta must be a JSON object")
+    for key in ("Added", "Removed", "Changed"):
+        if not isinstance(delta.get(key) or [], list):
+            raise PerceptionDeltaError("{} must be a list".format(key))
+    for key in ("Added", "Changed"):
+        for entity in delta.get(key) or []:
+            if not isinstance(entity, dict) or entity.get("GUID") is None:
+                raise PerceptionDeltaError("Every {} entry must be an object with a GUID".format(key))
+    for fields in delta.get("Changed") or []:
+        unset = fields.get(UNSET_KEY) or []
+        if not isinstance(unset, list) or not all(isinstance(name, str) for name in unset):
+            raise PerceptionDeltaError("{} must be a list of field names".format(UNSET_KEY))
+
+
+class PerceptionStore:
+    """
+    服务端感知存储。
+    就地维护会话共享的感知字典（Task / ToolExecutor 持有同一个对象），
+    并按 GUID 索引 Vision 实体以便应用增量。
+    """
+
+    def __init__(self, perception: Dict):
+        self.perception = perception
+        self.seq: Optional[int] = None
+        self.vision_index: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+        self.stats = {
+            'snapshots': 0,
+            'deltas': 0,
+            'resyncs': 0,
+            'invalid': 0,
+            'added': 0,
+            'removed': 0,
+            'changed': 0
+        }
+
+    def apply_snapshot(self, data: Dict[str, Any]):
+        """应用完整快照。带 "Seq" 的快照会开启（或重置）增量序列；格式错误时抛出 PerceptionDeltaError"""
+        if not isinstance(data, dict):
+            raise PerceptionDeltaError("A snapshot must be a JSON object")
+        seq = _parse_seq(data.get("Seq"))
+        with self.lock:
+            self.perception.clear()
+            self.perception.update(data)
+            self.vision_index = {str(entity["GUID"]): entity
+                                 for entity in data.get("Vision") or [] if entity and "GUID" in entity}
+            self.seq = seq
+            self.stats['snapshots'] += 1
+
+    def apply_delta(self, delta: Dict[str, Any]) -> Tuple[bool, Optional[int]]:
+        """
+        应用增量。
+
+        Returns:
+            (是否已应用, 期望的下一个序号)；未应用时客户端需要重发完整快照
+
+        Raises:
+            PerceptionDeltaError: 消息格式错误（序号不是整数、实体缺少 GUID 等），当前序列同时作废
+        """
+        with self.lock:
+            try:
+                _validate_delta(delta)
+                seq = _parse_seq(delta.get("Seq"))
+            except PerceptionDeltaError:
+                self.seq = None
+                self.stats['invalid'] += 1
+                raise
+            if self.seq is None or seq is None or seq != self.seq + 1:
+                self.stats['resyncs'] += 1
+                return False, None if self.seq is None else self.seq + 1
+
+            removed = {str(guid) for guid in delta.get("Removed") or []}
+            added = {str(entity["GUID"]) for entity in delta.get("Added") or []}
+            known = (self.vision_index.keys() - removed) | added
+            if any(str(fields["GUID"]) not in known for fields in delta.get("Changed") or []):
+                # 变化了一个未知实体，说明两端状态已经不一致；在修改任何状态之前放弃整个增量
+                self.seq = None
+                self.stats['resyncs'] += 1
+                return False, None
+
+            for guid in removed:
+                if self.vision_index.pop(guid, None) is not None:
+                    self.stats['removed'] += 1
+            for entity in delta.get("Added") or []:
+                self.vision_index[str(entity["GUID"])] = entity
+                self.stats['added'] += 1
+            for fields in delta.get("Changed") or []:
+                guid = str(fields["GUID"])
+                unset = set(fields.get(UNSET_KEY) or [])
+                unset.add(UNSET_KEY)
+                # 复制后替换，旧 Vision 列表中的实体字典保持不变，正在读取的线程看不到半更新的实体
+                self.vision_index[guid] = {key: value for key, value in {**self.vision_index[guid], **fields}.items()
+                                           if key not in unset}
+                self.stats['changed'] += 1
+
+            for key, value in delta.items():
+                if key not in DELTA_RESERVED_KEYS:
+                    self.perception[key] = value
+            # 整体替换列表对象，正在遍历旧列表的读者不受影响
+            self.perception["Vision"] = list(self.vision_index.values())
+            self.perception["Seq"] = seq
+            self.seq = seq
+            self.stats['deltas'] += 1
+            return True, self.seq + 1
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                'seq': self.seq,
+                'entities': len(self.vision_index),
+                'stats': self.stats.copy()
+            }
+
+
+def diff_entity(old: Dict[str, Any], new: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """返回实体变化的字段（带 GUID，被删除的字段列在 Unset 中），无变化返回 None"""
+    changed = None
+    for key, value in new.items():
+        if old.get(key) != value:
+            if changed is None:
+                changed = {"GUID": new["GUID"]}
+            changed[key] = value
+    unset = [key for key in old if key not in new]
+    if unset:
+        if changed is None:
+            changed = {"GUID": new["GUID"]}
+        changed[UNSET_KEY] = unset
+    return changed
+
+
+class PerceptionDeltaEncoder:
+    """
+    参考客户端编码器：把连续的完整感知快照转换为快照/增量消息。
+    游戏 Mod（agentbrain.lua）实现了同样的逻辑。
+    """
+
+    def __init__(self, full_every: int = 30):
+        self.full_every = full_every
+        self.seq: Optional[int] = None
+        self.ticks = 0
+        self.last_vision: Dict[str, Dict[str, Any]] = {}
+        self.last_fields: Dict[str, str] = {}
+
+    def request_resync(self):
+        """服务端返回 409 后调用，下一次 encode 会发送完整快照"""
+        self.seq = None
+
+    def encode(self, snapshot: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """
+        Returns:
+            ("snapshot" | "delta", 要发送的消息)
+        """
+        self.ticks += 1
+        vision = {str(entity["GUID"]): entity for entity in snapshot.get("Vision") or [] if entity}
+        fields = {key: json.dumps(value, sort_keys=True) for key, value in snapshot.items() if key != "Vision"}
+
+        if self.seq is None or self.ticks % self.full_every == 0:
+            self.seq = (self.seq or 0) + 1
+            self.last_vision, self.last_fields = vision, fields
+            message = dict(snapshot)
+            message["Version"] = PERCEPTION_PROTOCOL_VERSION
+            message["Seq"] = self.seq
+            return "snapshot", message
+
+        delta = {"Version": PERCEPTION_PROTOCOL_VERSION, "Seq": self.seq + 1,
+                 "Added": [], "Removed": [], "Changed": []}
+        for guid, entity in vision.items():
+            old = self.last_vision.get(guid)
+            if old is None:
+                delta["Added"].append(entity)
+            else:
+                changed = diff_entity(old, entity)
+                if changed:
+                    delta["Changed"].append(changed)
+        delta["Removed"] = [self.last_vision[guid]["GUID"] for guid in self.last_vision if guid not in vision]
+        for key, encoded in fields.items():
+            if self.last_fields.get(key) != encoded:
+                delta[key] = snapshot[key]
+
+        self.seq += 1
+        self.last_vision, self.last_fields = vision, fields
+        return "delta", delta
+
+
+class PerceptionDeltaClient:
+    """通过 HTTP 发送感知的参考客户端，自动处理 409 重同步"""
+
+    def __init__(self, server: str, guid, full_every: int = 30, timeout: float = 5.0):
+        self.base_url = f"{server.rstrip('/')}/{guid}/perceptions"
+        self.encoder = PerceptionDeltaEncoder(full_every=full_every)
+        self.timeout = timeout
+        self.bytes_sent = 0
+
+    def send(self, snapshot: Dict[str, Any]) -> int:
+        """发送一帧感知，返回 HTTP 状态码"""
+        kind, message = self.encoder.encode(snapshot)
+        url = self.base_url + ("/delta" if kind == "delta" else "")
+        status = self._post(url, message)
+        if status == 409:
+            self.encoder.request_resync()
+            kind, message = self.encoder.encode(snapshot)
+            status = self._post(self.base_url, message)
+        return status
+
+    def _post(self, url: str, message: Dict[str, Any]) -> int:
+        body = json.dumps(message, ensure_ascii=False).encode("utf-8")
+        self.bytes_sent += len(body)
+        request = urllib.request.Request(url, data=body, method="POST",
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+if __name__ == "__main__":
+    # 模拟繁忙基地：300 个实体，每帧约 5% 的实体移动，比较完整快照与增量的字节数与解析耗时
+    import random
+    import time
+
+    def make_entity(guid):
+        return {"GUID": guid, "Prefab": random.choice(["grass", "sapling", "evergreen", "rock1", "pigman"]),
+                "Quantity": 1, "Collectable": True, "Cooker": False, "Cookable": False, "Edible": False,
+                "Equippable": False, "Fuel": False, "Fueled": False, "Grower": False, "Harvestable": False,
+                "Pickable": False, "Stewer": False, "Choppable": False, "Diggable": True, "Hammerable": False,
+                "Mineable": False, "X": random.uniform(0, 400), "Y": 0, "Z": random.uniform(0, 400)}
+
+    entities = {guid: make_entity(guid) for guid in range(100000, 100300)}
+    status = {"Health": "150 / 150", "Hunger": "120 / 150", "Sanity": "200 / 200", "Temperature": "25", "Moisture": "0"}
+    encoder = PerceptionDeltaEncoder(full_every=30)
+    store = PerceptionStore({})
+    full_bytes = delta_bytes = 0
+    full_parse = delta_parse = 0.0
+    frames = 300
+    for _ in range(frames):
+        for guid in random.sample(list(entities), 15):
+            entities[guid]["X"] += random.uniform(-1, 1)
+        snapshot = {"Vision": list(entities.values()), "RoleStatus": dict(status), "PosX": "200.0", "PosZ": "200.0"}
+        full = json.dumps(snapshot)
+        full_bytes += len(full)
+        start = time.perf_counter()
+        json.loads(full)
+        full_parse += time.perf_counter() - start
+
+        kind, message = encoder.encode(snapshot)
+        encoded = json.dumps(message)
+        delta_bytes += len(encoded)
+        start = time.perf_counter()
+        decoded = json.loads(encoded)
+        if kind == "snapshot":
+            store.apply_snapshot(decoded)
+        else:
+            store.apply_delta(decoded)
+        delta_parse += time.perf_counter() - start
+
+    print(f"full snapshots : {full_bytes / frames / 1024:.1f} KiB/frame, parse {full_parse / frames * 1e6:.0f} us/frame")
+    print(f"delta protocol : {delta_bytes / frames / 1024:.1f} KiB/frame, parse+apply {delta_parse / frames * 1e6:.0f} us/frame")
+    print(f"store consistent: {len(store.perception['Vision']) == len(entities)}")
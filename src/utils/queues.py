@@ -1,84 +1,338 @@
 from queue import Queue, Empty
+import asyncio
+import heapq
+import itertools
 import threading
+import time
 import logging
 
+from ..config.settings import settings
+
+
+class AsyncWaiters:
+    """
+    异步等待者集合，用于在生产者线程入队时立即唤醒事件循环上的 long-poll 消费者。
+    每个等待者是 (loop, future)，唤醒通过 call_soon_threadsafe 完成，因此生产者可以是任意线程。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = set()
+
+    def add(self):
+        """在当前事件循环上注册一个等待者"""
+        loop = asyncio.get_running_loop()
+        entry = (loop, loop.create_future())
+        with self._lock:
+            self._waiters.add(entry)
+        return entry
+
+    def discard(self, entry):
+        with self._lock:
+            self._waiters.discard(entry)
+
+    def notify_all(self):
+        """唤醒所有等待者，由它们自行竞争出队"""
+        with self._lock:
+            waiters = list(self._waiters)
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve_waiter, future)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    def __len__(self):
+        with self._lock:
+            return len(self._waiters)
+
+
+def _resolve_waiter(future):
+    if not future.done():
+        future.set_result(None)
+
+
+async def long_poll(take, waiters: AsyncWaiters, timeout: float):
+    """
+    非阻塞地等待队列元素。
+
+    Args:
+        take: 无参函数，队列非空时返回元素，否则返回 None
+        waiters: 队列对应的 AsyncWaiters
+        timeout: 最长等待时间（秒），<= 0 表示不等待
+
+    Returns:
+        取到的元素，超时返回 None
+    """
+    item = take()
+    if item is not None or timeout <= 0:
+        return item
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        # 先注册再检查，避免在检查与等待之间丢失唤醒
+        entry = waiters.add()
+        try:
+            item = take()
+            if item is not None:
+                return item
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            try:
+                await asyncio.wait_for(entry[1], remaining)
+            except asyncio.TimeoutError:
+                return take()
+        finally:
+            waiters.discard(entry)
+
+
 class ActionQueue:
-    """动作队列管理器，实现生产者-消费者模式"""
-    
-    def __init__(self, maxsize=10):
-        self.queue = Queue(maxsize=maxsize)
-        self.lock = threading.RLock()
+    """
+    动作优先队列（生产者-消费者）。
+    - 优先级：数值越小越先出队，同优先级按入队顺序；urgent 动作（如入夜装备火把、STOP）排到最前
+    - 过期：每个动作带 TTL，出队时跳过已过期的动作，重新规划后旧命令不会再被执行
+    - 取消：按 AUID 取消尚未被取走的动作
+    - 去重：幂等动作（移动、装备等）的同一 WFN 已在队列中时不再重复入队；
+      两次 BUILD rope 这类动作是有意的重复，照常入队
+    - 队列满时先清掉已过期的动作；仍然满时，新动作优先级更高则挤掉队列中优先级最低、最晚入队的动作，否则拒绝
+    被取消、过期或挤掉的条目只做标记，出队时惰性跳过（堆中删除是 O(n)）。
+    """
+
+    URGENT = 0
+    NORMAL = 1
+    # 执行两次与执行一次效果相同的动作，只有这些动作按 WFN 去重
+    IDEMPOTENT_ACTIONS = frozenset({"EQUIP", "UNEQUIP", "STOP", "EXPLORE", "PATHFIND", "WALKTO", "TURNON", "TURNOFF"})
+
+    def __init__(self, maxsize=10, ledger=None, default_ttl=None):
+        self.maxsize = maxsize
+        self.ledger = ledger  # 可选的 ActionLedger，记录入队和被取走的时间
+        self.default_ttl = settings.ACTION_DEFAULT_TTL if default_ttl is None else default_ttl
+        self.heap = []  # [priority, seq, entry]
+        self.entries = {}  # AUID -> entry，只包含仍在队列中的动作
+        self.by_wfn = {}  # WFN -> entry，用于去重
+        self.seq = itertools.count()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.waiters = AsyncWaiters()
         self.logger = logging.getLogger(__name__)
         self.stats = {
             'produced': 0,
             'consumed': 0,
-            'dropped': 0
+            'dropped': 0,
+            'deduplicated': 0,
+            'cancelled': 0,
+            'expired': 0,
+            'evicted': 0
         }
-    
-    def put_action(self, action: dict) -> bool:
+
+    def put_action(self, action: dict, urgent: bool = False, priority: int = None, ttl: float = None) -> bool:
         """
         生产者：AI添加动作到队列
-        返回True表示成功添加，False表示队列已满
+
+        Args:
+            action: 动作字典
+            urgent: 排到所有普通动作之前
+            priority: 自定义优先级（数值越小越先出队），给出时覆盖 urgent
+            ttl: 存活时间（秒），默认 default_ttl，<= 0 表示不过期
+
+        返回True表示已在队列中（新加入或与已有动作重复），False表示队列已满被拒绝。
+        与已有动作重复时，action 的 AUID 被改为已有动作的 AUID，调用方据此取消或追踪实际排队的动作
         """
-        try:
-            with self.lock:
-                if self.queue.full():
+        if priority is None:
+            priority = self.URGENT if urgent else self.NORMAL
+        ttl = self.default_ttl if ttl is None else ttl
+        now = time.monotonic()
+        discarded = []
+        with self.lock:
+            wfn = action.get('WFN')
+            duplicate = self.by_wfn.get(wfn) if wfn and action.get('Action') in self.IDEMPOTENT_ACTIONS else None
+            if duplicate is not None and not self._expired(duplicate, now):
+                self.stats['deduplicated'] += 1
+                if duplicate['action'].get('AUID'):
+                    action['AUID'] = duplicate['action']['AUID']
+                if priority < duplicate['priority']:
+                    # 重复的动作被标为更紧急：提升已有条目的优先级
+                    duplicate['removed'] = True
+                    self._push(duplicate['action'], priority, duplicate['expires'], count=False)
+                return True
+            if self.size >= self.maxsize:
+                discarded += self._purge_expired(now)
+            if self.size >= self.maxsize:
+                victim = self._lowest()
+                if victim is None or victim['priority'] <= priority:
                     self.stats['dropped'] += 1
-                    self.logger.warning(f"Action queue is full, dropping action: {action}")
+                    self.logger.warning("Action queue is full, dropping action: %s", action)
                     return False
-                
-                self.queue.put(action, timeout=1.0)
-                self.stats['produced'] += 1
-                self.logger.info(f"Action added to queue: {action.get('Action', 'Unknown')}")
-                return True
-        except Exception as e:
-            self.logger.error(f"Error adding action to queue: {e}")
-            return False
-    
+                self._remove(victim)
+                self.stats['evicted'] += 1
+                discarded.append((victim['action'], "evicted"))
+            self._push(action, priority, now + ttl if ttl > 0 else None)
+            self.stats['produced'] += 1
+            self.not_empty.notify()
+        self.logger.info("Action added to queue: %s", action.get('Action', 'Unknown'))
+        if self.ledger is not None:
+            for victim, reason in discarded:
+                self.ledger.discarded(victim, reason)
+            self.ledger.enqueued(action)
+        self.waiters.notify_all()
+        return True
+
+    def _push(self, action, priority, expires, count=True):
+        """加入堆（调用方需持有 self.lock）"""
+        entry = {'action': action, 'priority': priority, 'expires': expires, 'removed': False}
+        heapq.heappush(self.heap, [priority, next(self.seq), entry])
+        if count:
+            self.size += 1
+        if action.get('AUID'):
+            self.entries[action['AUID']] = entry
+        if action.get('WFN'):
+            self.by_wfn[action['WFN']] = entry
+
+    def _remove(self, entry):
+        """标记删除（调用方需持有 self.lock）"""
+        entry['removed'] = True
+        self.size -= 1
+        action = entry['action']
+        if self.entries.get(action.get('AUID')) is entry:
+            del self.entries[action['AUID']]
+        if self.by_wfn.get(action.get('WFN')) is entry:
+            del self.by_wfn[action['WFN']]
+
+    def _purge_expired(self, now):
+        """删除所有已过期但尚未出队的条目，返回 [(动作, "expired")]（调用方需持有 self.lock，O(n)）"""
+        expired = []
+        for item in self.heap:
+            entry = item[2]
+            if not entry['removed'] and self._expired(entry, now):
+                self._remove(entry)
+                self.stats['expired'] += 1
+                expired.append((entry['action'], "expired"))
+        return expired
+
+    def _lowest(self):
+        """优先级最低、最晚入队的条目（仅在队列满时调用，O(n)）"""
+        live = [item for item in self.heap if not item[2]['removed']]
+        return max(live, key=lambda item: (item[0], item[1]))[2] if live else None
+
+    @staticmethod
+    def _expired(entry, now):
+        return entry['expires'] is not None and entry['expires'] <= now
+
+    def _pop(self):
+        """
+        弹出最优先的有效动作，跳过已删除和已过期的条目（调用方需持有 self.lock）。
+        返回 (动作或 None, 过期的动作列表)
+        """
+        now = time.monotonic()
+        expired = []
+        while self.heap:
+            entry = heapq.heappop(self.heap)[2]
+            if entry['removed']:
+                continue
+            self._remove(entry)
+            if self._expired(entry, now):
+                self.stats['expired'] += 1
+                expired.append(entry['action'])
+                continue
+            self.stats['consumed'] += 1
+            return entry['action'], expired
+        return None, expired
+
+    def _dispatched(self, action, expired):
+        """在锁外记录出队结果"""
+        if self.ledger is not None:
+            for stale in expired:
+                self.ledger.discarded(stale, "expired")
+        if expired:
+            self.logger.info("Skipped %d expired action(s)", len(expired))
+        if action is not None:
+            self.logger.info("Action consumed from queue: %s", action.get('Action', 'Unknown'))
+            if self.ledger is not None:
+                self.ledger.dispatched(action)
+        return action
+
     def get_action(self, timeout=1.0) -> dict:
         """
         消费者：客户端从队列获取动作
         如果队列为空，返回空字典
         """
-        try:
-            action = self.queue.get(timeout=timeout)
-            with self.lock:
-                self.stats['consumed'] += 1
-            self.logger.info(f"Action consumed from queue: {action.get('Action', 'Unknown')}")
-            return action
-        except Empty:
+        deadline = time.monotonic() + timeout
+        expired = []
+        with self.not_empty:
+            while True:
+                action, skipped = self._pop()
+                expired += skipped
+                if action is not None:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.not_empty.wait(remaining)
+        action = self._dispatched(action, expired)
+        if action is None:
             self.logger.debug("No action available in queue")
             return {}
-        except Exception as e:
-            self.logger.error(f"Error getting action from queue: {e}")
-            return {}
-    
+        return action
+
+    def _take_action(self):
+        """非阻塞出队，队列为空时返回 None"""
+        with self.lock:
+            action, expired = self._pop()
+        return self._dispatched(action, expired)
+
+    async def get_action_async(self, timeout=0.0) -> dict:
+        """
+        消费者：在事件循环上以 long-poll 方式获取动作，不阻塞事件循环。
+        入队时立即唤醒；超时仍为空则返回空字典
+        """
+        action = await long_poll(self._take_action, self.waiters, timeout)
+        return action if action is not None else {}
+
+    def cancel(self, auid: str) -> bool:
+        """取消尚未被取走的动作，返回是否找到"""
+        with self.lock:
+            entry = self.entries.get(auid)
+            if entry is None:
+                return False
+            self._remove(entry)
+            self.stats['cancelled'] += 1
+        if self.ledger is not None:
+            self.ledger.discarded(entry['action'], "cancelled")
+        return True
+
     def clear_queue(self):
         """清空队列"""
         with self.lock:
-            while not self.queue.empty():
-                try:
-                    self.queue.get_nowait()
-                except Empty:
-                    break
-            self.logger.info("Action queue cleared")
-    
+            actions = [item[2]['action'] for item in self.heap if not item[2]['removed']]
+            self.heap = []
+            self.entries.clear()
+            self.by_wfn.clear()
+            self.size = 0
+        if self.ledger is not None:
+            for action in actions:
+                self.ledger.discarded(action, "cleared")
+        self.logger.info("Action queue cleared")
+
     def get_stats(self) -> dict:
         """获取队列统计信息"""
         with self.lock:
             return {
-                'queue_size': self.queue.qsize(),
-                'max_size': self.queue.maxsize,
-                'stats': self.stats.copy()
+                'queue_size': self.size,
+                'max_size': self.maxsize,
+                'stats': self.stats.copy(),
+                'waiting_consumers': len(self.waiters)
             }
-    
+
     def is_empty(self) -> bool:
         """检查队列是否为空"""
-        return self.queue.empty()
-    
+        return self.size == 0
+
     def is_full(self) -> bool:
         """检查队列是否已满"""
-        return self.queue.full()
+        return self.size >= self.maxsize
     
 
 class DialogQueue:
@@ -86,6 +340,7 @@ class DialogQueue:
     def __init__(self, maxsize=10):
         self.queue = Queue(maxsize=maxsize)
         self.lock = threading.RLock()
+        self.waiters = AsyncWaiters()
         self.logger = logging.getLogger(__name__)
         self.stats = {
             'produced': 0,
@@ -104,7 +359,8 @@ class DialogQueue:
                 self.queue.put(dialog, timeout=1.0)
                 self.stats['produced'] += 1
                 self.logger.info(f"Dialog added to queue: {dialog}")
-                return True
+            self.waiters.notify_all()
+            return True
         except Exception as e:
             self.logger.error(f"Error adding dialog to queue: {e}")
             return False
@@ -123,6 +379,22 @@ class DialogQueue:
         except Exception as e:
             self.logger.error(f"Error getting dialog from queue: {e}")
             return ""
+
+    def _take_dialog(self):
+        """非阻塞出队，队列为空时返回 None"""
+        try:
+            dialog = self.queue.get_nowait()
+        except Empty:
+            return None
+        with self.lock:
+            self.stats['consumed'] += 1
+        self.logger.info(f"Dialog consumed from queue: {dialog}")
+        return dialog
+
+    async def get_dialog_async(self, timeout=0.0) -> str:
+        """在事件循环上以 long-poll 方式获取对话，超时返回空字符串"""
+        dialog = await long_poll(self._take_dialog, self.waiters, timeout)
+        return dialog if dialog is not None else ""
     
     def clear_queue(self):
         """清空队列"""
@@ -140,7 +412,8 @@ class DialogQueue:
             return {
                 'queue_size': self.queue.qsize(),
                 'max_size': self.queue.maxsize,
-                'stats': self.stats.copy()
+                'stats': self.stats.copy(),
+                'waiting_consumers': len(self.waiters)
             }
     
     def is_empty(self) -> bool:
@@ -149,4 +422,92 @@ class DialogQueue:
     
     def is_full(self) -> bool:
         """检查队列是否已满"""
-        return self.queue.full() 
\ No newline at end of file
+        return self.queue.full() 
+
+if __name__ == "__main__":
+    # 多生产者 / 多消费者下的入队出队吞吐量：原来的 Queue + RLock 实现 vs 优先队列
+    logging.disable(logging.CRITICAL)
+
+    class FifoActionQueue:
+        """原来的实现：有界 FIFO，每次操作另外获取一把 RLock，入队时唤醒 long-poll 等待者"""
+
+        def __init__(self, maxsize):
+            self.queue = Queue(maxsize=maxsize)
+            self.lock = threading.RLock()
+            self.waiters = AsyncWaiters()
+            self.logger = logging.getLogger(__name__)
+            self.stats = {'produced': 0, 'consumed': 0, 'dropped': 0}
+
+        def put_action(self, action):
+            with self.lock:
+                if self.queue.full():
+                    self.stats['dropped'] += 1
+                    self.logger.warning(f"Action queue is full, dropping action: {action}")
+                    return False
+                self.queue.put(action, timeout=1.0)
+                self.stats['produced'] += 1
+                self.logger.info(f"Action added to queue: {action.get('Action', 'Unknown')}")
+            self.waiters.notify_all()
+            return True
+
+        def get_action(self, timeout=1.0):
+            try:
+                action = self.queue.get(timeout=timeout)
+            except Empty:
+                return {}
+            with self.lock:
+                self.stats['consumed'] += 1
+            self.logger.info(f"Action consumed from queue: {action.get('Action', 'Unknown')}")
+            return action
+
+    def run(queue, producers=4, consumers=4, per_producer=5000):
+        total = producers * per_producer
+        consumed = []
+        done = threading.Event()
+
+        def produce(p):
+            for i in range(per_producer):
+                action = {"Action": "CHOP", "AUID": f"{p}-{i}", "WFN": f"Action(CHOP, -, -, -, -) = {p}{i:05d}"}
+                while not queue.put_action(action):
+                    time.sleep(0)
+
+        def consume():
+            count = 0
+            while not done.is_set():
+                if queue.get_action(timeout=0.05):
+                    count += 1
+            consumed.append(count)
+
+        threads = [threading.Thread(target=consume) for _ in range(consumers)]
+        for thread in threads:
+            thread.start()
+        start = time.perf_counter()
+        producer_threads = [threading.Thread(target=produce, args=(p,)) for p in range(producers)]
+        for thread in producer_threads:
+            thread.start()
+        for thread in producer_threads:
+            thread.join()
+        while queue.stats['consumed'] < total:
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - start
+        done.set()
+        for thread in threads:
+            thread.join()
+        assert sum(consumed) == total
+        return total / elapsed
+
+    for producers, consumers in ((1, 1), (4, 4)):
+        fifo = run(FifoActionQueue(20), producers, consumers)
+        priority = run(ActionQueue(20, default_ttl=0), producers, consumers)
+        print(f"{producers} producers x {consumers} consumers: FIFO {fifo:,.0f} ops/s, priority queue {priority:,.0f} ops/s")
+
+    queue = ActionQueue(4, default_ttl=0)
+    queue.put_action({"Action": "EQUIP", "AUID": "1", "WFN": "equip"})
+    queue.put_action({"Action": "EQUIP", "AUID": "2", "WFN": "equip"})
+    queue.put_action({"Action": "PICK", "AUID": "3", "WFN": "pick"})
+    queue.put_action({"Action": "STOP", "AUID": "4", "WFN": "stop"}, urgent=True)
+    queue.put_action({"Action": "WALKTO", "AUID": "5", "WFN": "walk"}, ttl=0.01)
+    queue.cancel("3")
+    time.sleep(0.02)
+    order = [queue.get_action(timeout=0).get("AUID") for _ in range(4)]
+    print(f"dispatch order: {order}, stats: {queue.get_stats()['stats']}")
@@ -0,0 +1,218 @@
+"""
+Vision 实体的空间索引
+每次感知更新（快照或增量都会生成新的 Vision 列表）后按需构建一次均匀网格，
+提供按 prefab / 能力（Choppable、Mineable、Collectable 等）的最近 N 个查询和半径查询，
+代替对 Vision 列表的逐项线性扫描。
+"""
+
+import heapq
+import math
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class SpatialIndex:
+    """
+    对一份 Vision 列表构建的只读网格索引。
+    cell_size 取视野半径的几分之一，使半径查询只需检查少量格子。
+    """
+
+    def __init__(self, entities: Iterable[Dict[str, Any]], cell_size: float = 8.0):
+        self.cell_size = cell_size
+        self.grid: Dict[Tuple[int, int], List[Tuple[float, float, Dict[str, Any]]]] = {}
+        self.by_prefab: Dict[str, List[Tuple[float, float, Dict[str, Any]]]] = {}
+        self.by_capability: Dict[str, List[Tuple[float, float, Dict[str, Any]]]] = {}
+        self.by_guid: Optional[Dict[str, Dict[str, Any]]] = None
+        self.size = 0
+        for entity in entities:
+            if not entity:
+                continue
+            x, z = _to_float(entity.get("X")), _to_float(entity.get("Z"))
+            if x is None or z is None:
+                continue
+            entry = (x, z, entity)
+            self.grid.setdefault(self._cell(x, z), []).append(entry)
+            self.by_prefab.setdefault(entity.get("Prefab"), []).append(entry)
+            self.size += 1
+
+    def _cell(self, x: float, z: float) -> Tuple[int, int]:
+        return (math.floor(x / self.cell_size), math.floor(z / self.cell_size))
+
+    def entity(self, guid) -> Optional[Dict[str, Any]]:
+        """按 GUID 查找实体（GUID 统一按字符串比较）；GUID 表在第一次查询时构建"""
+        if self.by_guid is None:
+            self.by_guid = {str(entry[2].get("GUID")): entry[2]
+                            for entries in self.grid.values() for entry in entries}
+        return self.by_guid.get(str(guid))
+
+    def _bucket(self, prefabs: Optional[Iterable[str]], capability: Optional[str]):
+        """按 prefab 与能力过滤后的候选 (x, z, 实体) 列表；能力桶按需构建并缓存"""
+        if prefabs is not None:
+            entries = [entry for prefab in set(prefabs) for entry in self.by_prefab.get(prefab, ())]
+            if capability is not None:
+                entries = [entry for entry in entries if entry[2].get(capability) is True]
+            return entries
+        if capability is None:
+            return [entry for entries in self.grid.values() for entry in entries]
+        bucket = self.by_capability.get(capability)
+        if bucket is None:
+            bucket = [entry for entries in self.grid.values() for entry in entries
+                      if entry[2].get(capability) is True]
+            self.by_capability[capability] = bucket
+        return bucket
+
+    def nearest(self, x: float, z: float, prefabs: Optional[Iterable[str]] = None,
+                capability: Optional[str] = None, count: int = 3,
+                radius: Optional[float] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        返回距离 (x, z) 最近的 count 个实体，按距离升序的 (距离, 实体) 列表。
+
+        Args:
+            prefabs: 只考虑这些 prefab（None 表示全部）
+            capability: 只考虑该布尔字段为 True 的实体，例如 "Choppable"
+            radius: 只考虑该半径内的实体
+        """
+        if count <= 0:
+            return []
+        if prefabs is None and capability is None:
+            if radius is not None:
+                return self.within_radius(x, z, radius)[:count]
+            return self._ring_search(x, z, count)
+
+        limit = radius * radius if radius is not None else math.inf
+        scored = []
+        for ex, ez, entity in self._bucket(prefabs, capability):
+            d2 = (ex - x) ** 2 + (ez - z) ** 2
+            if d2 <= limit:
+                scored.append((d2, entity))
+        best = heapq.nsmallest(count, scored, key=lambda pair: pair[0])
+        return [(math.sqrt(d2), entity) for d2, entity in best]
+
+    def _ring_search(self, x: float, z: float, count: int):
+        """从所在格子向外逐圈扩展，直到已找到的第 count 个结果比下一圈更近"""
+        if not self.grid:
+            return []
+        cx, cz = self._cell(x, z)
+        max_ring = max(max(abs(gx - cx), abs(gz - cz)) for gx, gz in self.grid)
+        found: List[Tuple[float, Dict[str, Any]]] = []
+        for ring in range(max_ring + 1):
+            for cell in self._ring_cells(cx, cz, ring):
+                for ex, ez, entity in self.grid.get(cell, ()):
+                    found.append((math.hypot(ex - x, ez - z), entity))
+            if len(found) >= count:
+                found.sort(key=lambda pair: pair[0])
+                # 下一圈格子中的点距离至少为 ring * cell_size
+                if found[count - 1][0] <= ring * self.cell_size:
+                    break
+        found.sort(key=lambda pair: pair[0])
+        return found[:count]
+
+    @staticmethod
+    def _ring_cells(cx: int, cz: int, ring: int):
+        if ring == 0:
+            yield (cx, cz)
+            return
+        for dx in range(-ring, ring + 1):
+            yield (cx + dx, cz - ring)
+            yield (cx + dx, cz + ring)
+        for dz in range(-ring + 1, ring):
+            yield (cx - ring, cz + dz)
+            yield (cx + ring, cz + dz)
+
+    def within_radius(self, x: float, z: float, radius: float, prefabs: Optional[Iterable[str]] = None,
+                      capability: Optional[str] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        """返回半径内的全部实体，按距离升序的 (距离, 实体) 列表"""
+        prefab_set = set(prefabs) if prefabs is not None else None
+        min_cx, min_cz = self._cell(x - radius, z - radius)
+        max_cx, max_cz = self._cell(x + radius, z + radius)
+        result = []
+        for gx in range(min_cx, max_cx + 1):
+            for gz in range(min_cz, max_cz + 1):
+                for ex, ez, entity in self.grid.get((gx, gz), ()):
+                    if prefab_set is not None and entity.get("Prefab") not in prefab_set:
+                        continue
+                    if capability is not None and entity.get(capability) is not True:
+                        continue
+                    dist = math.hypot(ex - x, ez - z)
+                    if dist <= radius:
+                        result.append((dist, entity))
+        result.sort(key=lambda pair: pair[0])
+        return result
+
+    def with_prefabs(self, prefabs: Iterable[str]) -> List[Dict[str, Any]]:
+        """返回指定 prefab 的全部实体（不计算距离）"""
+        return [entity for _, _, entity in self._bucket(prefabs, None)]
+
+
+class SpatialIndexCache:
+    """
+    按 Vision 列表对象缓存 SpatialIndex。
+    PerceptionStore 每次应用快照或增量都会赋值新的 Vision 列表，
+    因此列表对象不变就说明感知没有更新，可以直接复用索引。
+    """
+
+    def __init__(self, cell_size: float = 8.0):
+        self.cell_size = cell_size
+        self.lock = threading.Lock()
+        self.vision = None
+        self.index: Optional[SpatialIndex] = None
+        self.builds = 0
+
+    def get(self, perception: Dict[str, Any]) -> SpatialIndex:
+        vision = perception.get("Vision") or []
+        with self.lock:
+            if self.index is None or vision is not self.vision:
+                self.index = SpatialIndex(vision, self.cell_size)
+                self.vision = vision  # 持有引用，避免对象 id 被复用
+                self.builds += 1
+            return self.index
+
+
+if __name__ == "__main__":
+    # 300 个实体中查询最近的 3 棵树：线性扫描 vs 网格索引，以及回答体积（完整实体列表 vs 最近 3 个）
+    import json
+    import random
+    import time
+
+    prefabs = ["grass", "sapling", "evergreen", "rock1", "pigman", "berrybush"]
+    vision = [{"GUID": 100000 + i, "Prefab": random.choice(prefabs), "Choppable": random.random() < 0.2,
+               "Mineable": False, "Collectable": True, "Quantity": 1,
+               "X": random.uniform(0, 60), "Z": random.uniform(0, 60)} for i in range(300)]
+    px, pz = 30.0, 30.0
+    rounds = 2000
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        linear = sorted(
+            ((math.hypot(e["X"] - px, e["Z"] - pz), e) for e in vision if e["Prefab"] == "evergreen"),
+            key=lambda pair: pair[0]
+        )[:3]
+    linear_us = (time.perf_counter() - start) / rounds * 1e6
+
+    start = time.perf_counter()
+    for _ in range(20):
+        index = SpatialIndex(vision)
+    build_us = (time.perf_counter() - start) / 20 * 1e6
+    start = time.perf_counter()
+    for _ in range(rounds):
+        indexed = index.nearest(px, pz, prefabs=["evergreen"], count=3)
+    prefab_us = (time.perf_counter() - start) / rounds * 1e6
+    start = time.perf_counter()
+    for _ in range(rounds):
+        nearby = index.within_radius(px, pz, 6.0)
+    radius_us = (time.perf_counter() - start) / rounds * 1e6
+
+    full_answer = json.dumps(vision, sort_keys=True)
+    compact_answer = json.dumps([{"GUID": e["GUID"], "Prefab": e["Prefab"], "X": round(e["X"], 1),
+                                  "Z": round(e["Z"], 1), "Dist": round(d, 1)} for d, e in indexed])
+    print(f"build: {build_us:.0f} µs (once per perception update)")
+    print(f"nearest 3 evergreen: linear {linear_us:.1f} µs, indexed {prefab_us:.1f} µs")
+    print(f"within 6 units: {radius_us:.1f} µs ({len(nearby)} entities)")
+    print(f"answer size: full entity list {len(full_answer)} B, nearest 3 {len(compact_answer)} B")
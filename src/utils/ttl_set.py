@@ -0,0 +1,51 @@
+"""
+带过期时间的集合
+成员在加入 ttl 秒后自动失效，O(1) 判断成员关系；过期成员在写入时按需清理，
+不需要后台定时器。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+
+class TTLSet:
+    """
+    按加入顺序保存成员及其过期时间。由于 ttl 固定，最早加入的成员总是最先过期，
+    清理时只需从头部弹出，均摊 O(1)。
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.items: "OrderedDict[Hashable, float]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _purge(self, now: float):
+        while self.items:
+            key, expires = next(iter(self.items.items()))
+            if expires > now:
+                break
+            self.items.popitem(last=False)
+
+    def add(self, key: Hashable):
+        """加入成员（已存在时刷新其过期时间）"""
+        now = time.monotonic()
+        with self.lock:
+            self._purge(now)
+            self.items.pop(key, None)
+            self.items[key] = now + self.ttl
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self.lock:
+            expires = self.items.get(key)
+            return expires is not None and expires > time.monotonic()
+
+    def __len__(self) -> int:
+        with self.lock:
+            self._purge(time.monotonic())
+            return len(self.items)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
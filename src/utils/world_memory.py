@@ -0,0 +1,391 @@
+"""
+世界实体记忆
+每次感知更新时记录视野内实体（GUID、prefab、坐标、最后看到的天数），
+实体离开视野后仍可查询"上次在哪里看到 rock2"。
+- 空间哈希：按格子索引实体，用于清理视野内已消失的实体和按距离排序
+- prefab 索引：按 prefab 直接取候选，查询不扫描全部记忆
+- 超过 stale_days 未再看到的实体被淘汰
+- 按世界分开：mod 在 WorldStatus.WorldID 中发送存档的会话标识，每个世界一份记忆，
+  持久化到 memory/world_memory_<WorldID>.json，同一世界的会话共享；天数倒退（新世界或回档）时清空记忆
+- DST 的 GUID 在服务器重启后会变化：WorldStatus.Run 变化时，之前记下的实体只保留 prefab 和坐标，
+  recall 不再返回它们的 GUID，直到再次看到
+"""
+
+import json
+import math
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ..config.settings import settings
+
+WORLD_MEMORY_VERSION = 2
+
+
+def world_identity(perception: Dict[str, Any]) -> Optional[str]:
+    """感知中的世界标识（旧版 mod 不发送时为 None）"""
+    world_id = (perception.get("WorldStatus") or {}).get("WorldID")
+    return str(world_id) if world_id else None
+
+
+def world_memory_path(world_id: Optional[str]) -> str:
+    """世界记忆的文件路径；没有世界标识时使用 WORLD_MEMORY_FILE_PATH"""
+    if world_id is None:
+        return settings.WORLD_MEMORY_FILE_PATH
+    base, ext = os.path.splitext(settings.WORLD_MEMORY_FILE_PATH)
+    return "{}_{}{}".format(base, re.sub(r"[^A-Za-z0-9_-]", "_", world_id), ext)
+
+
+class WorldMemory:
+    """
+    记忆中的实体以 GUID 字符串为键，值为 [prefab, x, z, last_seen_day]。
+    restored 中是服务器重启之前记下的 GUID，它们在当前这次运行中已经无效。
+    """
+
+    # 候选实体超过该数量时按空间哈希由近及远查找，而不是逐个计算距离
+    RING_SEARCH_THRESHOLD = 64
+
+    def __init__(self, path: Optional[str] = None, cell_size: float = 16.0, stale_days: Optional[int] = None,
+                 see_dist: Optional[float] = None, save_interval: Optional[float] = None,
+                 world_id: Optional[str] = None):
+        self.path = path
+        self.world_id = world_id
+        self.cell_size = cell_size
+        self.stale_days = settings.WORLD_MEMORY_STALE_DAYS if stale_days is None else stale_days
+        self.see_dist = settings.WORLD_MEMORY_SEE_DIST if see_dist is None else see_dist
+        self.save_interval = settings.WORLD_MEMORY_SAVE_INTERVAL if save_interval is None else save_interval
+        self.lock = threading.Lock()
+        self.entities: Dict[str, list] = {}
+        self.cells: Dict[Tuple[int, int], set] = {}
+        self.by_prefab: Dict[str, set] = {}
+        self.cell_bounds = None  # 曾经出现过实体的格子范围 [min_cx, min_cz, max_cx, max_cz]，只扩不缩
+        self.current_day = 0
+        self.run: Optional[str] = None  # 记下这些 GUID 时服务器的运行标识
+        self.restored: set = set()
+        self.dirty = False
+        self.last_saved = time.monotonic()
+        self.stats = {
+            'observations': 0,
+            'forgotten': 0,
+            'evicted': 0,
+            'resets': 0,
+            'saves': 0
+        }
+        if path:
+            self.load()
+
+    def _cell(self, x: float, z: float) -> Tuple[int, int]:
+        return (math.floor(x / self.cell_size), math.floor(z / self.cell_size))
+
+    # ------------------------------------------------------------------
+    # 索引维护（调用方需持有 self.lock）
+    # ------------------------------------------------------------------
+
+    def _insert(self, guid: str, prefab: str, x: float, z: float, day: int):
+        self.entities[guid] = [prefab, x, z, day]
+        cx, cz = self._cell(x, z)
+        self.cells.setdefault((cx, cz), set()).add(guid)
+        bounds = self.cell_bounds
+        if bounds is None:
+            self.cell_bounds = [cx, cz, cx, cz]
+        elif not (bounds[0] <= cx <= bounds[2] and bounds[1] <= cz <= bounds[3]):
+            self.cell_bounds = [min(bounds[0], cx), min(bounds[1], cz), max(bounds[2], cx), max(bounds[3], cz)]
+        self.by_prefab.setdefault(prefab, set()).add(guid)
+
+    def _remove(self, guid: str):
+        record = self.entities.pop(guid, None)
+        self.restored.discard(guid)
+        if record is None:
+            return
+        prefab, x, z, _ = record
+        cell = self._cell(x, z)
+        self.cells[cell].discard(guid)
+        if not self.cells[cell]:
+            del self.cells[cell]
+        self.by_prefab[prefab].discard(guid)
+        if not self.by_prefab[prefab]:
+            del self.by_prefab[prefab]
+
+    def _upsert(self, guid: str, prefab: str, x: float, z: float, day: int):
+        self.restored.discard(guid)
+        record = self.entities.get(guid)
+        if record is None:
+            self._insert(guid, prefab, x, z, day)
+        elif record[0] != prefab or self._cell(record[1], record[2]) != self._cell(x, z):
+            # prefab 变化（如树被砍成树桩）或跨格移动时重新建索引
+            self._remove(guid)
+            self._insert(guid, prefab, x, z, day)
+        else:
+            record[1], record[2], record[3] = x, z, day
+
+    def _guids_within(self, x: float, z: float, radius: float) -> List[str]:
+        min_cx, min_cz = self._cell(x - radius, z - radius)
+        max_cx, max_cz = self._cell(x + radius, z + radius)
+        result = []
+        for cx in range(min_cx, max_cx + 1):
+            for cz in range(min_cz, max_cz + 1):
+                for guid in self.cells.get((cx, cz), ()):
+                    record = self.entities[guid]
+                    if math.hypot(record[1] - x, record[2] - z) <= radius:
+                        result.append(guid)
+        return result
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+
+    def observe(self, perception: Dict[str, Any]):
+        """
+        用一次感知更新记忆：记录视野内的实体，并忘掉应当在视野内却没有出现的实体
+        （已被采集、砍伐或走开）。
+        """
+        try:
+            px, pz = float(perception["PosX"]), float(perception["PosZ"])
+        except (KeyError, TypeError, ValueError):
+            return
+        world_status = perception.get("WorldStatus") or {}
+        try:
+            day = int(world_status.get("Day") or self.current_day)
+        except (TypeError, ValueError):
+            day = self.current_day
+        run = world_status.get("Run")
+
+        with self.lock:
+            if day < self.current_day:
+                # 天数倒退：换了新世界（旧版 mod 没有 WorldID 时）或者回档，之前的记忆都不再可信
+                self._clear()
+                self.stats['resets'] += 1
+            if run != self.run:
+                # 服务器重启过，之前记下的 GUID 全部失效
+                self.restored.update(self.entities)
+                self.run = run
+            new_day = day > self.current_day
+            self.current_day = max(self.current_day, day)
+            seen = set()
+            for entity in perception.get("Vision") or []:
+                if not entity or "GUID" not in entity:
+                    continue
+                try:
+                    x, z = float(entity["X"]), float(entity["Z"])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                guid = str(entity["GUID"])
+                seen.add(guid)
+                self._upsert(guid, entity.get("Prefab"), x, z, day)
+
+            # 视野边缘的实体可能因为坐标误差时有时无，只清理明显在视野内的
+            for guid in self._guids_within(px, pz, self.see_dist):
+                if guid not in seen:
+                    self._remove(guid)
+                    self.stats['forgotten'] += 1
+
+            if new_day:
+                self._evict_stale()
+            self.stats['observations'] += 1
+            self.dirty = True
+            should_save = self.path and time.monotonic() - self.last_saved >= self.save_interval
+
+        if should_save:
+            self.save()
+
+    def _clear(self):
+        self.entities, self.cells, self.by_prefab = {}, {}, {}
+        self.cell_bounds = None
+        self.restored = set()
+        self.current_day = 0
+
+    def _evict_stale(self):
+        """淘汰超过 stale_days 天没有再看到的实体"""
+        oldest = self.current_day - self.stale_days
+        stale = [guid for guid, record in self.entities.items() if record[3] < oldest]
+        for guid in stale:
+            self._remove(guid)
+        self.stats['evicted'] += len(stale)
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def recall(self, prefabs: Iterable[str], x: Optional[float] = None, z: Optional[float] = None,
+               count: int = 5) -> List[Dict[str, Any]]:
+        """
+        返回记忆中指定 prefab 的实体；给定 (x, z) 时按距离升序，否则按最后看到的时间倒序。
+        """
+        prefab_set = set(prefabs)
+        with self.lock:
+            candidates = sum(len(self.by_prefab.get(prefab, ())) for prefab in prefab_set)
+            if x is not None and z is not None and candidates > self.RING_SEARCH_THRESHOLD:
+                scored = self._ring_search(prefab_set, x, z, count)
+            else:
+                records = [
+                    (guid, list(self.entities[guid]))
+                    for prefab in prefab_set
+                    for guid in self.by_prefab.get(prefab, ())
+                ]
+                if x is not None and z is not None:
+                    scored = [(math.hypot(record[1] - x, record[2] - z), guid, record) for guid, record in records]
+                    scored.sort(key=lambda item: item[0])
+                else:
+                    scored = [(None, guid, record) for guid, record in records]
+                    scored.sort(key=lambda item: -item[2][3])
+            restored = self.restored.intersection(guid for _, guid, _ in scored[:count])
+        result = []
+        for dist, guid, record in scored[:count]:
+            entry = {"GUID": int(guid) if guid.isdigit() else guid, "Prefab": record[0],
+                     "X": round(record[1], 1), "Z": round(record[2], 1), "LastSeenDay": record[3]}
+            if guid in restored:
+                # 服务器重启前的 GUID 已失效，只给出位置
+                entry["GUID"] = None
+            if dist is not None:
+                entry["Dist"] = round(dist, 1)
+            result.append(entry)
+        return result
+
+    def _ring_search(self, prefab_set: set, x: float, z: float, count: int):
+        """
+        候选很多时从所在格子向外逐圈查找，第 count 个结果比下一圈更近时停止
+        （调用方需持有 self.lock）
+        """
+        cx, cz = self._cell(x, z)
+        min_cx, min_cz, max_cx, max_cz = self.cell_bounds
+        max_ring = max(cx - min_cx, max_cx - cx, cz - min_cz, max_cz - cz)
+        found = []
+        for ring in range(max_ring + 1):
+            if ring == 0:
+                ring_cells = [(cx, cz)]
+            else:
+                ring_cells = [(cx + d, cz - ring) for d in range(-ring, ring + 1)]
+                ring_cells += [(cx + d, cz + ring) for d in range(-ring, ring + 1)]
+                ring_cells += [(cx - ring, cz + d) for d in range(-ring + 1, ring)]
+                ring_cells += [(cx + ring, cz + d) for d in range(-ring + 1, ring)]
+            for cell in ring_cells:
+                for guid in self.cells.get(cell, ()):
+                    record = self.entities[guid]
+                    if record[0] in prefab_set:
+                        found.append((math.hypot(record[1] - x, record[2] - z), guid, list(record)))
+            if len(found) >= count:
+                found.sort(key=lambda item: item[0])
+                # 下一圈格子中的点距离至少为 ring * cell_size
+                if found[count - 1][0] <= ring * self.cell_size:
+                    break
+        found.sort(key=lambda item: item[0])
+        return found[:count]
+
+    def known_prefabs(self) -> Dict[str, int]:
+        with self.lock:
+            return {prefab: len(guids) for prefab, guids in self.by_prefab.items()}
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.stats)
+            stats['entities'] = len(self.entities)
+            stats['prefabs'] = len(self.by_prefab)
+            stats['current_day'] = self.current_day
+            stats['world_id'] = self.world_id
+            stats['restored'] = len(self.restored)
+            return stats
+
+    # ------------------------------------------------------------------
+    # 持久化
+    # ------------------------------------------------------------------
+
+    def load(self):
+        """从文件加载记忆，文件不存在或损坏时从空记忆开始"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"警告: 无法读取世界记忆 {self.path}: {e}，将从空记忆开始。")
+            return
+        if data.get("version") != WORLD_MEMORY_VERSION or data.get("world") != self.world_id:
+            return
+        with self.lock:
+            self.current_day = data.get("day", 0)
+            self.run = data.get("run")
+            for guid, prefab, x, z, day in data.get("entities", []):
+                self._insert(guid, prefab, x, z, day)
+            self.restored = set(data.get("restored", [])) & set(self.entities)
+
+    def save(self):
+        """原子地写入文件：先写临时文件再替换"""
+        with self.lock:
+            if not self.dirty or not self.path:
+                return
+            data = {
+                "version": WORLD_MEMORY_VERSION,
+                "world": self.world_id,
+                "run": self.run,
+                "day": self.current_day,
+                "restored": sorted(self.restored),
+                "entities": [[guid, prefab, round(x, 1), round(z, 1), day]
+                             for guid, (prefab, x, z, day) in self.entities.items()]
+            }
+            self.dirty = False
+            self.last_saved = time.monotonic()
+            self.stats['saves'] += 1
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+
+_shared_memories: Dict[Optional[str], WorldMemory] = {}
+_shared_lock = threading.Lock()
+
+
+def get_world_memory(world_id: Optional[str] = None) -> WorldMemory:
+    """同一个世界的会话共享一份记忆"""
+    with _shared_lock:
+        memory = _shared_memories.get(world_id)
+        if memory is None:
+            memory = _shared_memories[world_id] = WorldMemory(world_memory_path(world_id), world_id=world_id)
+        return memory
+
+
+if __name__ == "__main__":
+    # 模拟角色在 1000x1000 的世界中行走 3000 帧，每帧视野内约 60 个实体
+    import random
+    import tempfile
+
+    random.seed(1)
+    world = [(100000 + i, random.choice(["rock1", "rock2", "evergreen", "grass", "sapling", "berrybush"]),
+              random.uniform(0, 1000), random.uniform(0, 1000)) for i in range(60000)]
+    grid: Dict[Tuple[int, int], list] = {}
+    for entity in world:
+        grid.setdefault((int(entity[2] // 18), int(entity[3] // 18)), []).append(entity)
+
+    path = os.path.join(tempfile.mkdtemp(), "world_memory.json")
+    memory = WorldMemory(path, save_interval=1e9)
+    x, z, heading = 500.0, 500.0, 0.0
+    observe_time = 0.0
+    frames = 3000
+    for frame in range(frames):
+        heading += random.uniform(-0.3, 0.3)
+        x = min(max(x + 2 * math.cos(heading), 20), 980)
+        z = min(max(z + 2 * math.sin(heading), 20), 980)
+        cx, cz = int(x // 18), int(z // 18)
+        vision = [{"GUID": guid, "Prefab": prefab, "X": ex, "Z": ez}
+                  for dx in (-1, 0, 1) for dz in (-1, 0, 1)
+                  for guid, prefab, ex, ez in grid.get((cx + dx, cz + dz), ())
+                  if math.hypot(ex - x, ez - z) <= 18]
+        perception = {"PosX": "%.1f" % x, "PosZ": "%.1f" % z, "Vision": vision,
+                      "WorldStatus": {"Day": 1 + frame // 500}}
+        start = time.perf_counter()
+        memory.observe(perception)
+        observe_time += time.perf_counter() - start
+
+    rounds = 10000
+    start = time.perf_counter()
+    for _ in range(rounds):
+        found = memory.recall(["rock2"], x, z, count=3)
+    recall_us = (time.perf_counter() - start) / rounds * 1e6
+    memory.save()
+    print(f"remembered entities: {memory.get_stats()['entities']}")
+    print(f"observe: {observe_time / frames * 1e6:.0f} µs per perception")
+    print(f"recall nearest 3 rock2: {recall_us:.1f} µs")
+    print(f"file size: {os.path.getsize(path) / 1024:.1f} KiB")
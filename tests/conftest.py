@@ -0,0 +1,13 @@
+"""
+测试共用的夹具
+"""
+
+import pytest
+
+
+@pytest.fixture
+def make_action():
+    """动作字典工厂；不指定 WFN 时按动作类型和 AUID 生成互不相同的 WFN"""
+    def make(auid, action="CHOP", wfn=None):
+        return {"Action": action, "AUID": auid, "WFN": wfn or "Action({}, -, -, -, -) = {}".format(action, auid)}
+    return make
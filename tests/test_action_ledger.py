@@ -0,0 +1,56 @@
+"""
+动作账本测试：按 WFN 匹配完成事件、失败率和分位数
+"""
+
+from src.utils.action_ledger import ActionLedger, percentile
+
+
+WFN = "Action(CHOP, -, -, -, -) = 1"
+
+
+def test_completion_matches_oldest_pending_action_with_same_wfn(make_action):
+    ledger = ActionLedger()
+    for auid in ("1", "2"):
+        ledger.enqueued(make_action(auid, wfn=WFN))
+        ledger.dispatched(make_action(auid, wfn=WFN))
+    assert ledger.completed(WFN, failed=False)["auid"] == "1"
+    assert ledger.completed(WFN, failed=True, info="blocked")["auid"] == "2"
+    assert ledger.records["2"]["outcome"] == "failed"
+    assert ledger.records["2"]["info"] == "blocked"
+    assert ledger.completed(WFN, failed=False) is None
+    stats = ledger.get_stats()
+    assert stats["unmatched_events"] == 1
+    assert stats["in_flight"] == 0
+    assert stats["by_type"]["CHOP"]["failure_rate"] == 0.5
+    assert set(stats["by_type"]["CHOP"]["total_ms"]) == {"p50", "p90", "p99"}
+
+
+def test_discarded_actions_are_not_matched(make_action):
+    ledger = ActionLedger()
+    ledger.enqueued(make_action("1", wfn=WFN))
+    ledger.enqueued(make_action("2", wfn=WFN))
+    ledger.discarded(make_action("1", wfn=WFN), "cancelled")
+    assert ledger.completed(WFN, failed=False)["auid"] == "2"
+    assert ledger.records["1"]["outcome"] == "cancelled"
+
+
+def test_unknown_wfn_is_unmatched(make_action):
+    ledger = ActionLedger()
+    ledger.enqueued(make_action("1", wfn=WFN))
+    assert ledger.completed("Action(MINE, -, -, -, -) = 9", failed=False) is None
+    assert ledger.get_stats()["in_flight"] == 1
+
+
+def test_old_records_are_evicted(make_action):
+    ledger = ActionLedger(max_records=2)
+    for auid in ("1", "2", "3"):
+        ledger.enqueued(make_action(auid, wfn=WFN))
+    assert list(ledger.records) == ["2", "3"]
+    assert ledger.get_stats()["in_flight"] == 2
+
+
+def test_percentile_is_nearest_rank():
+    assert percentile([1, 2], 0.5) == 1
+    assert percentile([1, 2, 3, 4, 5, 6], 0.5) == 3
+    assert percentile(list(range(1, 101)), 0.9) == 90
+    assert percentile([7], 0.99) == 7
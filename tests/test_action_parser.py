@@ -0,0 +1,62 @@
+"""
+动作文法解析测试：模型常见写法变体与出错字段
+"""
+
+import pytest
+
+from src.tools.action_parser import ActionParseError, action_wfn, parse_action
+
+
+@pytest.mark.parametrize("text", [
+    "Action(CHOP, -, -, -, -) = 123",
+    "  Action( CHOP ,  - , -, -,  - )  =  123 ",
+    "action(chop, -, -, -, -) = 123",
+    "`Action(CHOP, -, -, -, -) = 123`",
+    "Action(CHOP, , , , ) = 123",
+    "Action(CHOP, \"-\", '-', -, -) = \"123\"",
+])
+def test_accepts_common_variants(text):
+    action = parse_action(text)
+    assert action.action == "CHOP"
+    assert action.target == "123"
+    assert action.wfn == "Action(CHOP, -, -, -, -) = 123"
+
+
+def test_missing_target_defaults_to_dash():
+    action = parse_action("Action(BUILD, -, -, -, \"axe\")")
+    assert action.recipe == "axe"
+    assert action.target == "-"
+    assert action.wfn == "Action(BUILD, -, -, -, axe) = -"
+
+
+def test_positions_and_invobject():
+    action = parse_action("Action(PATHFIND, -, -12.5, 40, -) = -")
+    assert (action.posx, action.posz) == ("-12.5", "40")
+    action = parse_action("Action(EQUIP, 116153, -, -, -) = -")
+    assert action.invobject == "116153"
+
+
+def test_to_dict_matches_wfn():
+    action = parse_action("Action(EAT, -, -, -, -) = 42").to_dict()
+    assert action["Name"] == action["WFN"] == action_wfn(action)
+    assert action["AUID"]
+
+
+def test_auids_are_unique():
+    assert parse_action("Action(STOP, -, -, -, -) = -").auid != parse_action("Action(STOP, -, -, -, -) = -").auid
+
+
+@pytest.mark.parametrize("text, field", [
+    ("CHOP 123", "action"),
+    ("Action(CHOP, -, -, -) = 123", "action"),
+    ("Action(CH0P, -, -, -, -) = 123", "action"),
+    ("Action(EQUIP, torch, -, -, -) = -", "invobject"),
+    ("Action(PATHFIND, -, north, 40, -) = -", "posx"),
+    ("Action(PATHFIND, -, 10, 4o, -) = -", "posz"),
+    ("Action(CHOP, -, -, -, -) = tree", "target"),
+])
+def test_reports_faulty_field(text, field):
+    with pytest.raises(ActionParseError) as info:
+        parse_action(text)
+    assert info.value.field == field
+    assert info.value.to_dict()["field"] == field
@@ -0,0 +1,84 @@
+"""
+动作优先队列测试：优先级、TTL 过期、取消和去重
+"""
+
+import time
+
+from src.utils.action_ledger import ActionLedger
+from src.utils.queues import ActionQueue
+
+
+def drain(queue):
+    auids = []
+    while True:
+        action = queue.get_action(timeout=0)
+        if not action:
+            return auids
+        auids.append(action["AUID"])
+
+
+def test_urgent_actions_go_first_and_fifo_within_priority(make_action):
+    queue = ActionQueue(maxsize=5, default_ttl=0)
+    queue.put_action(make_action("1"))
+    queue.put_action(make_action("2"))
+    queue.put_action(make_action("3", "STOP"), urgent=True)
+    assert drain(queue) == ["3", "1", "2"]
+
+
+def test_expired_actions_are_skipped(make_action):
+    ledger = ActionLedger()
+    queue = ActionQueue(maxsize=5, ledger=ledger, default_ttl=0)
+    queue.put_action(make_action("1"), ttl=0.01)
+    queue.put_action(make_action("2"))
+    time.sleep(0.02)
+    assert drain(queue) == ["2"]
+    assert queue.get_stats()["stats"]["expired"] == 1
+    assert ledger.records["1"]["outcome"] == "expired"
+
+
+def test_expired_actions_do_not_count_toward_capacity(make_action):
+    queue = ActionQueue(maxsize=2)
+    queue.put_action(make_action("1"), ttl=0.01)
+    queue.put_action(make_action("2"), ttl=0.01)
+    time.sleep(0.02)
+    assert queue.put_action(make_action("3"))
+    assert queue.get_stats()["stats"]["evicted"] == 0
+    assert drain(queue) == ["3"]
+
+
+def test_full_queue_rejects_or_evicts_by_priority(make_action):
+    queue = ActionQueue(maxsize=2, default_ttl=0)
+    queue.put_action(make_action("1"))
+    queue.put_action(make_action("2"))
+    assert not queue.put_action(make_action("3"))
+    assert queue.put_action(make_action("4", "STOP"), urgent=True)
+    assert drain(queue) == ["4", "1"]
+
+
+def test_cancel(make_action):
+    ledger = ActionLedger()
+    queue = ActionQueue(maxsize=5, ledger=ledger, default_ttl=0)
+    queue.put_action(make_action("1"))
+    queue.put_action(make_action("2"))
+    assert queue.cancel("1")
+    assert not queue.cancel("1")
+    assert drain(queue) == ["2"]
+    assert ledger.records["1"]["outcome"] == "cancelled"
+
+
+def test_idempotent_duplicates_share_the_queued_auid(make_action):
+    queue = ActionQueue(maxsize=5, default_ttl=0)
+    queue.put_action(make_action("1", "EQUIP", wfn="Action(EQUIP, 7, -, -, -) = -"))
+    duplicate = make_action("2", "EQUIP", wfn="Action(EQUIP, 7, -, -, -) = -")
+    assert queue.put_action(duplicate, urgent=True)
+    assert duplicate["AUID"] == "1"
+    assert queue.get_stats()["stats"]["deduplicated"] == 1
+    assert drain(queue) == ["1"]
+
+
+def test_repeated_non_idempotent_actions_are_all_queued(make_action):
+    queue = ActionQueue(maxsize=5, default_ttl=0)
+    wfn = "Action(BUILD, -, -, -, rope) = -"
+    queue.put_action(make_action("1", "BUILD", wfn=wfn))
+    queue.put_action(make_action("2", "BUILD", wfn=wfn))
+    assert drain(queue) == ["1", "2"]
@@ -0,0 +1,68 @@
+"""
+上下文窗口测试：token 预算、固定消息、最近消息、截断优先于淘汰、被取代快照的压缩
+"""
+
+from src.config.settings import settings
+from src.core.context_window import OBSERVATION, SUPERSEDED_NOTE, ContextWindow, estimate_tokens
+
+
+def make_message(content, role="user"):
+    return {"role": role, "content": content}
+
+
+def make_window(budget, keep_recent):
+    return ContextWindow([make_message("system prompt", "system"), make_message("goal")],
+                         budget=budget, keep_recent=keep_recent)
+
+
+def test_total_stays_within_budget_and_pinned_messages_are_kept():
+    window = make_window(budget=300, keep_recent=2)
+    for number in range(20):
+        window.append(make_message("{} {}".format(number, "x" * 200)))
+        assert window.total <= window.budget
+        assert window.total == sum(estimate_tokens(message["content"]) for message in window)
+    assert window[0]["content"] == "system prompt"
+    assert window[1]["content"] == "goal"
+    assert window[-1]["content"].startswith("19 ")
+    assert window.get_stats()["evicted"] > 0
+
+
+def test_recent_messages_are_never_truncated_or_evicted():
+    window = make_window(budget=100, keep_recent=3)
+    recent = [make_message("x" * 2000) for _ in range(3)]
+    for message in recent:
+        window.append(message, kind=OBSERVATION)
+    assert window.total > window.budget
+    assert window.messages[2:] == recent
+    assert window.get_stats()["truncated"] == window.get_stats()["evicted"] == 0
+
+
+def test_old_observations_are_truncated_before_anything_is_evicted():
+    window = make_window(budget=400, keep_recent=1)
+    window.append(make_message("x" * 2000), kind=OBSERVATION)
+    window.append(make_message("ok"))
+    stats = window.get_stats()
+    assert stats["truncated"] == 1
+    assert stats["evicted"] == 0
+    assert len(window) == 4
+    assert "observation truncated" in window[2]["content"]
+    assert window.total <= window.budget
+
+
+def test_superseded_snapshots_are_compacted_by_message_id(monkeypatch):
+    monkeypatch.setattr(settings, "CONTEXT_COMPACT_MIN_TOKENS", 10 ** 9)
+    window = make_window(budget=120, keep_recent=2)
+    window.append(make_message("y" * 400))
+    old_inventory = "inventory: axe, 3 logs"
+    window.append(make_message("result\n" + old_inventory), snapshots=[("check_inventory", old_inventory)])
+    window.append(make_message("z" * 40))
+    # 淘汰改变了消息下标，压缩仍按编号找到被取代的快照
+    assert window.get_stats()["evicted"] == 1
+    window.append(make_message("result\ninventory: axe"), snapshots=[("check_inventory", "inventory: axe")])
+    assert window.get_stats()["pending_compaction_tokens"] > 0
+    monkeypatch.setattr(settings, "CONTEXT_COMPACT_MIN_TOKENS", 0)
+    window.append(make_message("next"))
+    assert [message["content"] for message in window] == [
+        "system prompt", "goal", "result\n" + SUPERSEDED_NOTE.format("check_inventory"), "z" * 40,
+        "result\ninventory: axe", "next"]
+    assert window.get_stats()["compacted"] == 1
@@ -0,0 +1,73 @@
+"""
+流式工具解析测试：不同分块大小、跨块标签、未闭合的开标签、批量只读工具，以及与 parse_assistant_message 的一致性
+"""
+
+import pytest
+
+from src.tools.parse_tool import StreamingToolParser, parse_assistant_message
+
+MESSAGES = [
+    "I'll chop the tree.\n<do>\nAction(CHOP, -, -, -, -) = 1\n</do>\nand then rest",
+    "Maybe <explore> later, first:\n<do>Action(STOP, -, -, -, -) = -</do>",
+    "<check_recipe><name>axe</name></check_recipe> then <do>X</do>",
+    "<explore><search>rocks</search></explore>",
+    "Thinking about <b>trees</b> and <foo>bar</foo>, no tools yet.",
+    "Unclosed <do>Action(CHOP, -, -, -, -) = 1",
+]
+
+
+def feed_in_chunks(parser, text, size):
+    for start in range(0, len(text), size):
+        if parser.feed(text[start:start + size]):
+            return
+
+
+def first_tool_end(text):
+    """parse_assistant_message 第一次认出工具调用的最短前缀长度"""
+    for end in range(len(text) + 1):
+        if parse_assistant_message(text[:end])[1]:
+            return end
+    return -1
+
+
+@pytest.mark.parametrize("size", [1, 3, None])
+@pytest.mark.parametrize("text", MESSAGES)
+def test_stops_where_full_parser_first_sees_a_tool(text, size):
+    parser = StreamingToolParser()
+    feed_in_chunks(parser, text, size or len(text))
+    assert parser.tool_end == first_tool_end(text)
+    assert parser.has_tool_use == parse_assistant_message(text)[1]
+
+
+def test_tags_split_across_chunks():
+    parser = StreamingToolParser()
+    assert not parser.feed("text <d")
+    assert not parser.feed("o>Action(STOP, -, -, -, -) = -</")
+    assert parser.feed("do>")
+    assert parser.text[:parser.tool_end].endswith("</do>")
+
+
+def test_unclosed_explore_does_not_hide_a_later_do():
+    parser = StreamingToolParser()
+    for chunk in ("I could <explore>", " but instead ", "<do>Action(STOP, -, -, -, -) = -", "</do>"):
+        parser.feed(chunk)
+    assert parser.has_tool_use
+    blocks, has_tool_use = parse_assistant_message(parser.text[:parser.tool_end])
+    assert has_tool_use
+    assert [block["name"] for block in blocks if block["type"] == "tool_use"] == ["do"]
+
+
+@pytest.mark.parametrize("size", [1, 3, None])
+def test_batch_read_only_continues_until_a_state_changing_tool(size):
+    text = "<check_inventory></check_inventory>\n<check_recipe><name>axe</name></check_recipe>\n<do>X</do> tail"
+    parser = StreamingToolParser(batch_read_only=True)
+    feed_in_chunks(parser, text, size or len(text))
+    assert parser.read_only_tools == ["check_inventory", "check_recipe"]
+    assert parser.tool_end == text.index("</do>") + len("</do>")
+
+
+def test_batch_read_only_without_state_changing_tool():
+    parser = StreamingToolParser(batch_read_only=True)
+    assert not parser.feed("<check_status></check_status><check_map></check_map>")
+    assert parser.read_only_tools == ["check_status", "check_map"]
+    assert not parser.has_tool_use
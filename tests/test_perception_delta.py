@@ -0,0 +1,67 @@
+"""
+增量感知协议测试：序号断档、格式错误后的重同步、Unset、未知实体和编码器往返
+"""
+
+import copy
+
+import pytest
+
+from src.utils.perception_delta import PerceptionDeltaEncoder, PerceptionDeltaError, PerceptionStore
+
+
+def make_store(*entities, seq=1):
+    store = PerceptionStore({})
+    store.apply_snapshot({"Seq": seq, "Vision": [dict(entity) for entity in entities], "PosX": "0"})
+    return store
+
+
+def test_seq_gap_is_not_applied():
+    store = make_store({"GUID": 1, "X": 0})
+    assert store.apply_delta({"Seq": 3, "Added": [{"GUID": 2}]}) == (False, 2)
+    assert [entity["GUID"] for entity in store.perception["Vision"]] == [1]
+    assert store.apply_delta({"Seq": 2, "Added": [{"GUID": 2}]}) == (True, 3)
+
+
+def test_invalid_delta_raises_and_requires_resync():
+    store = make_store({"GUID": 1, "X": 0})
+    with pytest.raises(PerceptionDeltaError):
+        store.apply_delta({"Seq": 2, "Changed": [{"X": 1}]})
+    assert store.get_stats()["stats"]["invalid"] == 1
+    # 下一个增量即使序号连续也要求重发完整快照
+    assert store.apply_delta({"Seq": 2, "Changed": [{"GUID": 1, "X": 1}]}) == (False, None)
+    assert store.perception["Vision"][0]["X"] == 0
+
+
+def test_unset_removes_fields_without_mutating_old_entities():
+    store = make_store({"GUID": 1, "X": 0, "Pickable": True})
+    old_vision = store.perception["Vision"]
+    assert store.apply_delta({"Seq": 2, "Changed": [{"GUID": 1, "X": 5, "Unset": ["Pickable"]}]})[0]
+    assert store.perception["Vision"] == [{"GUID": 1, "X": 5}]
+    assert old_vision == [{"GUID": 1, "X": 0, "Pickable": True}]
+
+
+def test_unknown_guid_in_changed_leaves_store_unchanged():
+    store = make_store({"GUID": 1, "X": 0}, {"GUID": 2, "X": 0})
+    before = copy.deepcopy(store.perception)
+    delta = {"Seq": 2, "Removed": [2], "Added": [{"GUID": 3}], "Changed": [{"GUID": 9, "X": 1}], "PosX": "5"}
+    assert store.apply_delta(delta) == (False, None)
+    assert store.perception == before
+    assert store.get_stats()["entities"] == 2
+
+
+def test_encoder_round_trip():
+    encoder = PerceptionDeltaEncoder(full_every=100)
+    store = PerceptionStore({})
+    frames = [
+        {"Vision": [{"GUID": 1, "X": 0, "Pickable": True}, {"GUID": 2, "X": 0}], "PosX": "0"},
+        {"Vision": [{"GUID": 1, "X": 1}, {"GUID": 3, "X": 0}], "PosX": "0"},
+        {"Vision": [{"GUID": 1, "X": 1, "Pickable": False}, {"GUID": 3, "X": 2}], "PosX": "4"},
+    ]
+    for frame in frames:
+        kind, message = encoder.encode(copy.deepcopy(frame))
+        if kind == "snapshot":
+            store.apply_snapshot(message)
+        else:
+            assert store.apply_delta(message)[0]
+        assert sorted(store.perception["Vision"], key=lambda entity: entity["GUID"]) == frame["Vision"]
+        assert store.perception["PosX"] == frame["PosX"]
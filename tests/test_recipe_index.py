@@ -0,0 +1,36 @@
+"""
+配方索引测试：第一次加载时生成缓存，之后直接加载；缓存损坏或过期时重新生成
+"""
+
+import pickle
+
+import pytest
+
+from src.config.settings import settings
+from src.tools.recipe_index import _load
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    return str(tmp_path / "cache" / "recipe_index.pickle")
+
+
+def test_index_is_built_on_first_load(index_path):
+    first = _load(settings.RECIPE_LIST_FILE_PATH, index_path)
+    second = _load(settings.RECIPE_LIST_FILE_PATH, index_path)
+    assert (first.source, second.source) == ("json", "index")
+    assert first.order == second.order
+
+
+@pytest.mark.parametrize("content", [
+    b"not a pickle",
+    pickle.dumps(["a", "list"]),
+    pickle.dumps({"version": -1}),
+    b"\x80\x04\x95\x10\x00\x00\x00\x00\x00\x00\x00\x8c\x0cno.such.mod\x94.",
+])
+def test_unreadable_or_stale_index_is_rebuilt(index_path, content):
+    _load(settings.RECIPE_LIST_FILE_PATH, index_path)
+    with open(index_path, "wb") as f:
+        f.write(content)
+    assert _load(settings.RECIPE_LIST_FILE_PATH, index_path).source == "json"
+    assert _load(settings.RECIPE_LIST_FILE_PATH, index_path).source == "index"
@@ -0,0 +1,53 @@
+"""
+空间索引测试：最近 N 个查询和半径查询与线性扫描的结果一致
+"""
+
+import math
+import random
+
+import pytest
+
+from src.utils.spatial_index import SpatialIndex
+
+PREFABS = ["grass", "sapling", "evergreen", "rock1", "pigman", "berrybush"]
+
+
+def make_vision(seed, count=300):
+    rng = random.Random(seed)
+    return [{"GUID": 100000 + i, "Prefab": rng.choice(PREFABS), "Choppable": rng.random() < 0.2,
+             "X": rng.uniform(-60, 60), "Z": rng.uniform(-60, 60)} for i in range(count)]
+
+
+def brute_force(vision, x, z, count, keep=lambda entity: True, radius=math.inf):
+    scored = sorted((math.hypot(e["X"] - x, e["Z"] - z), e["GUID"]) for e in vision if keep(e))
+    return [guid for dist, guid in scored if dist <= radius][:count]
+
+
+def guids(result):
+    return [entity["GUID"] for _, entity in result]
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("x, z", [(0.0, 0.0), (55.0, -58.0), (200.0, 200.0)])
+def test_nearest_matches_brute_force(seed, x, z):
+    vision = make_vision(seed)
+    index = SpatialIndex(vision)
+    assert guids(index.nearest(x, z, count=7)) == brute_force(vision, x, z, 7)
+    assert guids(index.nearest(x, z, prefabs=["evergreen"], count=3)) == \
+        brute_force(vision, x, z, 3, lambda e: e["Prefab"] == "evergreen")
+    assert guids(index.nearest(x, z, capability="Choppable", count=3)) == \
+        brute_force(vision, x, z, 3, lambda e: e["Choppable"])
+    assert guids(index.nearest(x, z, count=5, radius=20.0)) == brute_force(vision, x, z, 5, radius=20.0)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_within_radius_matches_brute_force(seed):
+    vision = make_vision(seed)
+    index = SpatialIndex(vision)
+    assert guids(index.within_radius(10.0, -5.0, 6.0)) == brute_force(vision, 10.0, -5.0, len(vision), radius=6.0)
+
+
+def test_entities_without_coordinates_are_skipped():
+    index = SpatialIndex([{"GUID": 1, "X": "1.5", "Z": 2}, {"GUID": 2, "X": None, "Z": 0}, {}])
+    assert index.size == 1
+    assert index.nearest(0, 0, count=3) == [(math.hypot(1.5, 2), {"GUID": 1, "X": "1.5", "Z": 2})]
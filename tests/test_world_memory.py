@@ -0,0 +1,77 @@
+"""
+世界记忆测试：视野内遗忘、天数倒退重置、Run 变化后 GUID 失效、逐圈查找与线性扫描一致、保存和加载
+"""
+
+import math
+import random
+
+from src.utils.world_memory import WorldMemory
+
+
+def make_memory(path=None, world_id=None):
+    return WorldMemory(path, see_dist=10.0, stale_days=5, save_interval=1e9, world_id=world_id)
+
+
+def perceive(x, z, vision=(), day=1, run="r1"):
+    return {"PosX": str(x), "PosZ": str(z), "Vision": list(vision), "WorldStatus": {"Day": day, "Run": run}}
+
+
+def rock(guid, x, z, prefab="rock1"):
+    return {"GUID": guid, "Prefab": prefab, "X": x, "Z": z}
+
+
+def test_entities_missing_inside_see_dist_are_forgotten():
+    memory = make_memory()
+    memory.observe(perceive(0, 0, [rock(1, 3, 0), rock(2, 30, 0)]))
+    memory.observe(perceive(0, 0))
+    assert [entry["GUID"] for entry in memory.recall(["rock1"])] == [2]
+    assert memory.get_stats()["forgotten"] == 1
+
+
+def test_day_going_backwards_clears_memory():
+    memory = make_memory()
+    memory.observe(perceive(0, 0, [rock(1, 50, 50)], day=5))
+    memory.observe(perceive(0, 0, [rock(2, 3, 0)], day=2))
+    assert [entry["GUID"] for entry in memory.recall(["rock1"])] == [2]
+    stats = memory.get_stats()
+    assert stats["resets"] == 1
+    assert stats["current_day"] == 2
+
+
+def test_guids_are_suppressed_after_run_changes_until_seen_again():
+    memory = make_memory()
+    memory.observe(perceive(0, 0, [rock(1, 50, 50)], run="r1"))
+    memory.observe(perceive(0, 0, run="r2"))
+    entry, = memory.recall(["rock1"])
+    assert entry["GUID"] is None
+    assert (entry["X"], entry["Z"]) == (50, 50)
+    memory.observe(perceive(0, 0, [rock(1, 50, 50)], run="r2"))
+    assert memory.recall(["rock1"])[0]["GUID"] == 1
+
+
+def test_ring_search_matches_brute_force():
+    rng = random.Random(3)
+    rocks = [rock(1000 + i, rng.uniform(-400, 400), rng.uniform(-400, 400)) for i in range(500)]
+    memory = make_memory()
+    memory.observe(perceive(0, 0, rocks))
+    assert len(rocks) > WorldMemory.RING_SEARCH_THRESHOLD
+    for x, z in [(0, 0), (390, -390), (-1000, 20), (123.4, 56.7)]:
+        expected = sorted(rocks, key=lambda entity: math.hypot(entity["X"] - x, entity["Z"] - z))[:5]
+        assert [entry["GUID"] for entry in memory.recall(["rock1"], x, z, count=5)] == \
+            [entity["GUID"] for entity in expected]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "world_memory_w1.json")
+    memory = make_memory(path, world_id="w1")
+    memory.observe(perceive(0, 0, [rock(1, 50.04, 50), rock(2, 3, 0, "evergreen")], day=3, run="r1"))
+    memory.observe(perceive(0, 0, [rock(2, 3, 0, "evergreen")], day=3, run="r2"))
+    memory.save()
+
+    loaded = make_memory(path, world_id="w1")
+    assert loaded.entities == {"1": ["rock1", 50.0, 50, 3], "2": ["evergreen", 3, 0, 3]}
+    assert loaded.restored == {"1"}
+    assert (loaded.run, loaded.current_day) == ("r2", 3)
+    assert loaded.recall(["rock1", "evergreen"], 0, 0) == memory.recall(["rock1", "evergreen"], 0, 0)
+    # 其它世界的记忆文件不会被加载
+    assert make_memory(path, world_id="w2").entities == {}